@@ -0,0 +1,288 @@
+"""The JSON API, version 1: timelines, profiles, messages, likes and follows.
+
+Mounted at /api/v1, for clients that render their own pages. It reads
+through the same queries as the HTML pages (feeds.py) and pages the same
+way (pagination.py):
+
+    GET    /api/v1/timeline                 the logged-in user's home feed
+    GET    /api/v1/users/<id>               a profile
+    GET    /api/v1/users/<id>/messages      their messages
+    GET    /api/v1/users/<id>/likes         messages they've liked
+    GET    /api/v1/users/<id>/following     users they follow
+    GET    /api/v1/users/<id>/followers     users following them
+    GET    /api/v1/messages/<id>            a message
+    PUT    /api/v1/messages/<id>/like       like it; DELETE to unlike
+    PUT    /api/v1/users/<id>/follow        follow them; DELETE to stop
+
+Lists come as {"data": [...], "next_cursor": ...}; pass the cursor back
+as ?before= for the next page, and ?limit= for shorter pages. Clients
+ask for just the fields they show, per type, as in JSON:API:
+
+    /api/v1/timeline?fields[message]=id,text,user&fields[user]=username
+
+A message's `user` is the author as its card shows them: id, username
+and image_url, which the feed query loads with it. Message ids are
+64-bit snowflakes (see snowflake.py), past what a JavaScript number
+holds exactly, so they're sent as strings. Requests are
+authenticated by the same session cookie as the site, and errors --
+unknown paths and methods under /api/v1 included -- come as
+{"error": ..., "message": ...}.
+
+Bodies are encoded by orjson if it's installed, or else by the json
+module without whitespace.
+"""
+
+import json
+
+from flask import Blueprint, abort, current_app, g, request
+from werkzeug.exceptions import HTTPException
+
+from feeds import (followers_list, following_list, home_feed, liked_feed,
+                   user_feed)
+from http_caching import (not_modified_unless_changed, user_version,
+                          users_version)
+from models import db, Follows, Likes, Message, User
+from pagination import PAGE_SIZE
+from replicas import replica_reads
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+USER_FIELDS = {
+    'id': lambda user: user.id,
+    'username': lambda user: user.username,
+    'image_url': lambda user: user.image_url,
+    'header_image_url': lambda user: user.header_image_url,
+    'bio': lambda user: user.bio,
+    'location': lambda user: user.location,
+    'messages_count': lambda user: user.messages_count,
+    'followers_count': lambda user: user.followers_count,
+    'following_count': lambda user: user.following_count,
+    'likes_count': lambda user: user.likes_count,
+    # whether the logged-in user follows them
+    'following': lambda user: bool(g.user) and g.user.is_following(user),
+}
+
+# what a message's card loads of its author (see feeds.feed_query)
+AUTHOR_FIELDS = ('id', 'username', 'image_url')
+
+MESSAGE_FIELDS = {
+    # a string: JSON numbers are doubles to most clients
+    'id': lambda msg: str(msg.id),
+    'text': lambda msg: msg.text,
+    'timestamp': lambda msg: msg.timestamp.isoformat(),
+    'user_id': lambda msg: msg.user_id,
+    'user': None,  # the author; see message_serializer()
+    # whether the logged-in user likes it
+    'liked': lambda msg: bool(g.user) and msg.id in g.user.liked_message_ids,
+}
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def respond(data, status=200):
+    return current_app.response_class(dumps(data), status=status,
+                                      mimetype='application/json')
+
+
+def fieldset(kind, fields, default=None):
+    """The fields of `kind` the client asked for, in ?fields[kind]=...
+
+    Aborts with a 400 if it names one there isn't.
+    """
+
+    value = request.args.get(f'fields[{kind}]')
+    if value is None:
+        return list(default or fields)
+
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        abort(400, f"No {kind} field {', '.join(unknown)}; "
+                   f"pick from {', '.join(fields)}")
+    return names
+
+
+def serializer(getters):
+    """A function turning an object into a dict of `getters`' fields.
+
+    Made once per request, so each object costs just the getter calls.
+    """
+
+    items = list(getters.items())
+    return lambda obj: {name: getter(obj) for name, getter in items}
+
+
+def user_serializer():
+    return serializer({name: USER_FIELDS[name]
+                       for name in fieldset('user', USER_FIELDS)})
+
+
+def message_serializer():
+    getters = {name: MESSAGE_FIELDS[name]
+               for name in fieldset('message', MESSAGE_FIELDS)}
+
+    if 'user' in getters:
+        author = serializer({name: USER_FIELDS[name] for name in
+                             fieldset('user', AUTHOR_FIELDS, AUTHOR_FIELDS)})
+        getters['user'] = lambda msg: author(msg.user)
+    return serializer(getters)
+
+
+def page_args():
+    """The ?before= cursor and ?limit= page size asked for."""
+
+    limit = request.args.get('limit', str(PAGE_SIZE))
+    if not limit.isdigit() or not 1 <= int(limit) <= PAGE_SIZE:
+        abort(400, f"limit must be from 1 to {PAGE_SIZE}")
+    # a cursor that isn't one of ours is a 400 too (see decode_cursor)
+    return request.args.get('before'), int(limit)
+
+
+def respond_page(page, serialize):
+    return respond({'data': [serialize(item) for item in page],
+                    'next_cursor': page.next_cursor})
+
+
+def require_login():
+    if not g.user:
+        abort(401, "Log in first.")
+
+
+def is_api_request():
+    """Whether this request is for the API, even a path it doesn't have."""
+
+    return (request.path == api.url_prefix
+            or request.path.startswith(api.url_prefix + '/'))
+
+
+# 404 too, or the site's HTML 404 page would take precedence; the site's
+# handlers send paths no view matched here (see app.py)
+@api.errorhandler(404)
+@api.errorhandler(HTTPException)
+def json_error(e):
+    return respond({'error': e.name, 'message': e.description}, e.code)
+
+
+##############################################################################
+# Timelines and messages
+
+
+@api.route('/timeline')
+@replica_reads
+def timeline():
+    """The logged-in user's home feed."""
+
+    require_login()
+    return respond_page(home_feed(g.user.id, *page_args()),
+                        message_serializer())
+
+
+@api.route('/users/<int:user_id>/messages')
+@replica_reads
+def user_messages(user_id):
+    """The messages a user has posted."""
+
+    db.get_or_404(User, user_id)
+    return respond_page(user_feed(user_id, *page_args()),
+                        message_serializer())
+
+
+@api.route('/users/<int:user_id>/likes')
+@replica_reads
+def user_likes(user_id):
+    """The messages a user has liked."""
+
+    require_login()
+    db.get_or_404(User, user_id)
+    return respond_page(liked_feed(user_id, *page_args()),
+                        message_serializer())
+
+
+@api.route('/messages/<int:message_id>')
+@replica_reads
+def show_message(message_id):
+    msg = db.get_or_404(Message, message_id)
+
+    not_modified_unless_changed(
+        msg.id, users_version([msg.user]),
+        bool(g.user) and msg.id in g.user.liked_message_ids)
+    return respond({'data': message_serializer()(msg)})
+
+
+@api.route('/messages/<int:message_id>/like', methods=['PUT', 'DELETE'])
+def like_message(message_id):
+    """Like a message, or with DELETE, unlike it."""
+
+    require_login()
+    msg = db.get_or_404(Message, message_id)
+
+    if request.method == 'PUT' and not g.user.has_liked(msg):
+        db.session.add(Likes(user_id=g.user.id, message_id=msg.id))
+    elif request.method == 'DELETE' and g.user.has_liked(msg):
+        db.session.delete(Likes.query.filter_by(
+            user_id=g.user.id, message_id=msg.id).one())
+    db.session.commit()
+
+    return '', 204
+
+
+##############################################################################
+# Users and the follow graph
+
+
+@api.route('/users/<int:user_id>')
+@replica_reads
+def show_user(user_id):
+    user = db.get_or_404(User, user_id)
+
+    not_modified_unless_changed(user_version(user))
+    return respond({'data': user_serializer()(user)})
+
+
+@api.route('/users/<int:user_id>/following')
+@replica_reads
+def user_following(user_id):
+    """The users a user follows."""
+
+    require_login()
+    db.get_or_404(User, user_id)
+    return respond_page(following_list(user_id, *page_args()),
+                        user_serializer())
+
+
+@api.route('/users/<int:user_id>/followers')
+@replica_reads
+def user_followers(user_id):
+    """The users following a user."""
+
+    require_login()
+    db.get_or_404(User, user_id)
+    return respond_page(followers_list(user_id, *page_args()),
+                        user_serializer())
+
+
+@api.route('/users/<int:user_id>/follow', methods=['PUT', 'DELETE'])
+def follow_user(user_id):
+    """Follow a user, or with DELETE, stop following them."""
+
+    require_login()
+    user = db.get_or_404(User, user_id)
+
+    if request.method == 'PUT' and not g.user.is_following(user):
+        db.session.add(Follows(user_being_followed_id=user.id,
+                               user_following_id=g.user.id))
+    elif request.method == 'DELETE' and g.user.is_following(user):
+        db.session.delete(db.session.get(Follows, (user.id, g.user.id)))
+    db.session.commit()
+
+    return '', 204
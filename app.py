@@ -1,46 +1,142 @@
-import os
+import hmac
+import math
 
-from flask import Flask, render_template, request, flash, redirect, session, g
-from flask_debugtoolbar import DebugToolbarExtension
+from flask import (Blueprint, Flask, render_template, request, flash,
+                   redirect, session, g, current_app, abort)
+from flask_migrate import Migrate
 from sqlalchemy.exc import IntegrityError
-
+from werkzeug.exceptions import Unauthorized
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from api import api, is_api_request, json_error
+from assets import build_assets, init_assets, vendor_assets
+from auth import authenticate, init_login_limits, login_limiter
+from compression import init_compression
+from config import load_config
+from counters import reconcile_counters
+from current_user import CurrentUser, UserGone, forget_user, load_snapshot
+from feeds import (followers_list, following_list, home_feed, liked_feed,
+                   user_feed)
 from forms import UserAddForm, LoginForm, MessageForm, EditUser
-from models import db, connect_db, User, Message
+from fragments import forget_message_card, forget_user_card, init_fragments
+from http_caching import (init_http_caching, not_modified_unless_changed,
+                          user_version, users_version)
+from instrumentation import instrument_app, metrics
+from message_search import search_messages
+from models import db, connect_db, User, Message, Likes
+from pagination import Page, paginate_users
+from passwords import init_passwords
+from ratelimit import DatabaseBackend
+from replicas import init_replicas, replica_reads
+from search import search_users
+from streaming import init_streaming, stream_page
+import timelines  # registers the session hook that fans out messages
 
 CURR_USER_KEY = "curr_user"
 
-app = Flask(__name__)
+# every route and hook below; create_app() puts them on an app
+views = Blueprint('views', __name__, cli_group=None)
+
+migrate = Migrate()
+
+
+def create_app(config=None):
+    """Make the Warbler app.
+
+    `config` is the name of a profile in config.py ('development', 'test'
+    or 'production') or a config object; by default WARBLER_CONFIG names
+    the profile. Nothing here connects to the database or pushes an app
+    context: requests get their own, and scripts push one themselves:
+
+        app = create_app()
+        with app.app_context():
+            ...
+    """
+
+    app = Flask(__name__)
+    if config is None or isinstance(config, str):
+        config = load_config(config)
+    app.config.from_object(config)
+
+    # behind a load balancer, every request comes from its address; the
+    # client's is in the headers it adds
+    proxies = app.config.get('TRUSTED_PROXIES', 0)
+    if proxies:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+
+    # the toolbar is slow to import and wraps every request, so production
+    # and the tests don't load it at all
+    if app.config.get('DEBUG_TB_ENABLED', True):
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
+
+    connect_db(app)
+    instrument_app(app)
+    init_replicas(app, db)
+    init_passwords(app)
+    init_login_limits(app)
+    init_fragments(app)
+    init_streaming(app)
+    init_assets(app)
+    init_http_caching(app)
+    init_compression(app)
+    migrate.init_app(app, db)
+    app.register_blueprint(views)
+    app.register_blueprint(api)
+
+    return app
+
+
+@views.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Recompute every user's message/follower/following/like counts."""
+
+    reconcile_counters()
+    db.session.commit()
+
+
+@views.cli.command('prune-rate-limits')
+def prune_rate_limits_command():
+    """Delete the database's rate-limit buckets that have filled up."""
+
+    print(f"Pruned {DatabaseBackend().prune()} rate-limit buckets.")
 
 
-# Get DB_URI from environ variable (useful for production/testing) or,
-# if not set there, use development local db.
-app.config['SQLALCHEMY_DATABASE_URI'] = (
-    os.environ.get('DATABASE_URL', 'postgresql:///warbler'))
+@views.cli.command('vendor-assets')
+def vendor_assets_command():
+    """Download the pinned Bootstrap, jQuery, Popper and Font Awesome."""
 
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = False
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
-toolbar = DebugToolbarExtension(app)
+    fetched = vendor_assets(current_app.static_folder)
+    print(f"Vendored {len(fetched)} files into static/vendor/.")
 
 
+@views.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint and precompress static/ into static/dist/."""
+
+    manifest = build_assets(current_app.static_folder,
+                            current_app.static_url_path)
+    print(f"Built {len(manifest['files'])} files into static/dist/, "
+          f"{len(manifest['encodings'])} with compressed copies.")
 
-connect_db(app)
-app.app_context().push()
 
 ##############################################################################
 # User signup/login/logout
 
 
-@app.before_request
+@views.before_app_request
 def add_user_to_g():
-    """If we're logged in, add curr user to Flask global."""
+    """If we're logged in, add curr user to Flask global.
+
+    g.user reads from a cached snapshot of the user (see current_user.py);
+    routes that change the user work on g.user.model.
+    """
 
+    snapshot = None
     if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+        snapshot = load_snapshot(session[CURR_USER_KEY])
 
-    else:
-        g.user = None
+    g.user = CurrentUser(snapshot) if snapshot else None
 
 
 def do_login(user):
@@ -55,12 +151,33 @@ def do_logout():
     if CURR_USER_KEY in session:
         del session[CURR_USER_KEY]
 
-@app.errorhandler(404) 
+
+@views.app_errorhandler(UserGone)
+def user_gone(e):
+    """Log out a user deleted since their snapshot was cached."""
+
+    do_logout()
+    if is_api_request():
+        return json_error(Unauthorized("Log in first."))
+    flash("Access unauthorized.", "danger")
+    return redirect("/")
+
+
+@views.app_errorhandler(404) 
 def not_found(e):
+    if is_api_request():
+        return json_error(e)
     return render_template("404.html")
 
 
-@app.route('/signup', methods=["GET", "POST"])
+@views.app_errorhandler(405)
+def method_not_allowed(e):
+    if is_api_request():
+        return json_error(e)
+    return e
+
+
+@views.route('/signup', methods=["GET", "POST"])
 def signup():
     """Handle user signup.
 
@@ -96,17 +213,25 @@ def signup():
         return render_template('users/signup.html', form=form)
 
 
-@app.route('/login', methods=["GET", "POST"])
+@views.route('/login', methods=["GET", "POST"])
 def login():
     """Handle user login."""
 
     form = LoginForm()
 
     if form.validate_on_submit():
-        user = User.authenticate(form.username.data,
-                                 form.password.data)
+        # before any password is checked: each check costs a bcrypt hash
+        wait = login_limiter().take(form.username.data, request.remote_addr)
+        if wait:
+            flash("Too many login attempts. Try again later.", 'danger')
+            return (render_template('users/login.html', form=form), 429,
+                    {'Retry-After': str(math.ceil(wait))})
+
+        user = authenticate(form.username.data, form.password.data)
 
         if user:
+            # saves the password's new hash, if it was rehashed
+            db.session.commit()
             do_login(user)
             flash(f"Hello, {user.username}!", "success")
             return redirect("/")
@@ -116,7 +241,7 @@ def login():
     return render_template('users/login.html', form=form)
 
 
-@app.route('/logout')
+@views.route('/logout')
 def logout():
     """Handle logout of user."""
     do_logout()
@@ -129,24 +254,29 @@ def logout():
 ##############################################################################
 # General user routes:
 
-@app.route('/users')
+@views.route('/users')
+@replica_reads
 def list_users():
     """Page with listing of users.
 
-    Can take a 'q' param in querystring to search by that username.
+    Can take a 'q' param in querystring to search users (see search.py),
+    or a 'before' cursor to page through everyone.
     """
 
     search = request.args.get('q')
+    before = request.args.get('before')
 
     if not search:
-        users = User.query.all()
+        users = paginate_users(User.query, before)
     else:
-        users = User.query.filter(User.username.like(f"%{search}%")).all()
+        users = Page(search_users(search), None)
 
+    not_modified_unless_changed(users_version(users), users.next_cursor)
     return render_template('users/index.html', users=users)
 
 
-@app.route('/users/<int:user_id>')
+@views.route('/users/<int:user_id>')
+@replica_reads
 def users_show(user_id):
     """Show user profile."""
 
@@ -154,16 +284,17 @@ def users_show(user_id):
 
     # snagging messages in order from the database;
     # user.messages won't be in order by default
-    messages = (Message
-                .query
-                .filter(Message.user_id == user_id)
-                .order_by(Message.timestamp.desc())
-                .limit(100)
-                .all())
-    return render_template('users/show.html', user=user, messages=messages)
+    messages = user_feed(user_id, request.args.get('before'))
+
+    not_modified_unless_changed(user_version(user),
+                                [msg.id for msg in messages],
+                                messages.next_cursor)
+    # read whole for its ETag, but still sent as it's rendered
+    return stream_page('users/show.html', user=user, messages=messages)
 
 
-@app.route('/users/<int:user_id>/following')
+@views.route('/users/<int:user_id>/following')
+@replica_reads
 def show_following(user_id):
     """Show list of people this user is following."""
 
@@ -172,10 +303,15 @@ def show_following(user_id):
         return redirect("/")
 
     user = User.query.get_or_404(user_id)
-    return render_template('users/following.html', user=user)
+    users = following_list(user_id, request.args.get('before'))
+
+    not_modified_unless_changed(user_version(user), users_version(users),
+                                users.next_cursor)
+    return render_template('users/following.html', user=user, users=users)
 
 
-@app.route('/users/<int:user_id>/followers')
+@views.route('/users/<int:user_id>/followers')
+@replica_reads
 def users_followers(user_id):
     """Show list of followers of this user."""
 
@@ -184,10 +320,14 @@ def users_followers(user_id):
         return redirect("/")
 
     user = User.query.get_or_404(user_id)
-    return render_template('users/followers.html', user=user)
+    users = followers_list(user_id, request.args.get('before'))
 
+    not_modified_unless_changed(user_version(user), users_version(users),
+                                users.next_cursor)
+    return render_template('users/followers.html', user=user, users=users)
 
-@app.route('/users/follow/<int:follow_id>', methods=['POST'])
+
+@views.route('/users/follow/<int:follow_id>', methods=['POST'])
 def add_follow(follow_id):
     """Add a follow for the currently-logged-in user."""
 
@@ -202,7 +342,7 @@ def add_follow(follow_id):
     return redirect(f"/users/{g.user.id}/following")
 
 
-@app.route('/users/stop-following/<int:follow_id>', methods=['POST'])
+@views.route('/users/stop-following/<int:follow_id>', methods=['POST'])
 def stop_following(follow_id):
     """Have currently-logged-in-user stop following this user."""
 
@@ -217,31 +357,35 @@ def stop_following(follow_id):
     return redirect(f"/users/{g.user.id}/following")
 
 
-@app.route('/users/profile', methods=["GET", "POST"])
+@views.route('/users/profile', methods=["GET", "POST"])
 def profile():
     """Update profile for current user."""
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect('/')
-    form = EditUser(obj=g.user)
+    user = g.user.model
+    form = EditUser(obj=user)
     if form.validate_on_submit():
-        if not g.user.authenticate(g.user.username, form.password.data):
+        if not user.check_password(form.password.data):
             flash("Wrong password", "danger")
             return redirect('/')
         else:
-            g.user.username = form.username.data
-            g.user.email = form.email.data
-            g.user.image_url = form.image_url.data
-            g.user.header_image_url = form.header_image_url.data
-            g.user.bio = form.bio.data
+            user.username = form.username.data
+            user.email = form.email.data
+            user.image_url = form.image_url.data
+            user.header_image_url = form.header_image_url.data
+            user.bio = form.bio.data
 
-            db.session.add(g.user)
+            db.session.add(user)
             db.session.commit()
+            forget_user(user.id)
+            forget_user_card(user.id)
             flash("User successfully edited.","success")
-            return redirect(f"/users/{g.user.id}")
+            return redirect(f"/users/{user.id}")
     return render_template('/users/edit.html', form=form)
     
-@app.route('/users/<int:user_id>/likes')
+@views.route('/users/<int:user_id>/likes')
+@replica_reads
 def show_likes(user_id):
     """Show list of messages this user has liked."""
 
@@ -250,37 +394,31 @@ def show_likes(user_id):
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
-    liked_messages= []
-    for like in g.user.likes:
-        liked_messages.append(like.id)
-    messages = (Message
-                .query
-                .filter(Message.id.in_(liked_messages))
-                .order_by(Message.timestamp.desc())
-                .limit(100)
-                .all())
-    # raise
-    return render_template('users/likes.html', user=user, messages=messages)
-
-@app.route('/users/add_like/<int:msg_id>', methods=["GET", "POST"])
+    messages = liked_feed(user.id, request.args.get('before'), stream=True)
+    return stream_page('users/likes.html', user=user, messages=messages)
+
+@views.route('/users/add_like/<int:msg_id>', methods=["GET", "POST"])
 def add_like(msg_id):
     """Adds or removes message from current user's likes"""
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect('/')
-    liked_message = Message.query.get(msg_id)
-    if liked_message in g.user.likes: 
-        g.user.likes.remove(liked_message)
+    liked_message = Message.query.get_or_404(msg_id)
+
+    # check against the liked-id set and write the Likes row directly,
+    # rather than loading every message the user has liked
+    if g.user.has_liked(liked_message):
+        db.session.delete(Likes.query.filter_by(
+            user_id=g.user.id, message_id=liked_message.id).one())
     else:
-        g.user.likes.append(liked_message)
-    
+        db.session.add(Likes(user_id=g.user.id, message_id=liked_message.id))
 
     db.session.commit()
 
     return redirect('/')
 ##### IMPLEMENT THIS!!!
 
-@app.route('/users/delete', methods=["POST"])
+@views.route('/users/delete', methods=["POST"])
 def delete_user():
     """Delete user."""
 
@@ -290,8 +428,10 @@ def delete_user():
 
     do_logout()
 
-    db.session.delete(g.user)
+    db.session.delete(g.user.model)
     db.session.commit()
+    forget_user(g.user.id)
+    forget_user_card(g.user.id)
 
     return redirect("/signup")
 
@@ -299,7 +439,7 @@ def delete_user():
 ##############################################################################
 # Messages routes:
 
-@app.route('/messages/new', methods=["GET", "POST"])
+@views.route('/messages/new', methods=["GET", "POST"])
 def messages_add():
     """Add a message:
 
@@ -322,15 +462,19 @@ def messages_add():
     return render_template('messages/new.html', form=form)
 
 
-@app.route('/messages/<int:message_id>', methods=["GET"])
+@views.route('/messages/<int:message_id>', methods=["GET"])
+@replica_reads
 def messages_show(message_id):
     """Show a message."""
 
     msg = Message.query.get(message_id)
+
+    if msg is not None:
+        not_modified_unless_changed(msg.id, users_version([msg.user]))
     return render_template('messages/show.html', message=msg)
 
 
-@app.route('/messages/<int:message_id>/delete', methods=["POST"])
+@views.route('/messages/<int:message_id>/delete', methods=["POST"])
 def messages_destroy(message_id):
     """Delete a message."""
 
@@ -341,58 +485,82 @@ def messages_destroy(message_id):
     msg = Message.query.get(message_id)
     db.session.delete(msg)
     db.session.commit()
+    forget_message_card(message_id)
 
     return redirect(f"/users/{g.user.id}")
 
 
+@views.route('/search/messages')
+def messages_search():
+    """Page of messages matching the 'q' param, best match first.
+
+    Takes a 'before' cursor for further pages (see message_search.py).
+    """
+
+    query = request.args.get('q', '')
+    messages = search_messages(query, request.args.get('before'))
+    likes = g.user.liked_message_ids if g.user else set()
+
+    return render_template('messages/search.html', query=query,
+                           messages=messages, likes=likes)
+
+
 ##############################################################################
 # Homepage and error pages
 
 
-@app.route('/')
+@views.route('/')
+@replica_reads
 def homepage():
     """Show homepage:
 
     - anon users: no messages
-    - logged in: 100 most recent messages of followed_users
+    - logged in: 100 most recent messages of followed_users, with a
+      'before' cursor for older pages, sent as they're read (see
+      streaming.py)
     """
 
     if g.user:
-        following = []
-        for user in g.user.following:
-            following.append(user.id)
-        likes = []
-        for message in g.user.likes:
-            likes.append(message.id)
-        
-        messages = (Message
-                    .query
-                    .filter(Message.user_id.in_(following) | Message.user_id.in_([g.user.id]))
-                    .order_by(Message.timestamp.desc())
-                    .limit(100)
-                    .all())
-        likes = (Message.query
-                 .filter(Message.id.in_(likes)))
-        # raise
-        return render_template('home.html', messages=messages, likes=likes)
+        # followed users' messages are fanned out into the timelines table
+        # as they're posted (see timelines.py), so this is one indexed read
+        messages = home_feed(g.user.id, request.args.get('before'),
+                             stream=True)
+        likes = g.user.liked_message_ids
+        return stream_page('home.html', messages=messages, likes=likes)
 
     else:
         return render_template('home-anon.html')
 
 
+@views.route('/metrics')
+def show_metrics():
+    """Request and SQL query metrics, for Prometheus to scrape.
+
+    Only for a scraper sending `Authorization: Bearer <METRICS_TOKEN>`;
+    with no METRICS_TOKEN set, for no one.
+    """
+
+    token = current_app.config.get('METRICS_TOKEN')
+    sent = request.headers.get('Authorization', '')
+    if not token or not hmac.compare_digest(sent.encode(),
+                                            f'Bearer {token}'.encode()):
+        abort(403)
+
+    return metrics.render(pool=db.engine.pool), {
+        'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
 ##############################################################################
-# Turn off all caching in Flask
-#   (useful for dev; in production, this kind of stuff is typically
-#   handled elsewhere)
-#
-# https://stackoverflow.com/questions/34066804/disabling-caching-in-flask
-
-@app.after_request
-def add_header(req):
-    """Add non-caching headers on every request."""
-
-    req.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    req.headers["Pragma"] = "no-cache"
-    req.headers["Expires"] = "0"
-    req.headers['Cache-Control'] = 'public, max-age=0'
-    return req
+# `from app import app`, for the older tests and for `flask` commands run
+# without --app app:create_app: the first use makes an app from
+# WARBLER_CONFIG and DATABASE_URL and pushes an app context for good, as
+# this module used to at import. Production imports wsgi.py instead.
+
+
+def __getattr__(name):
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    app = globals()['app'] = create_app()
+    app.app_context().push()
+    return app
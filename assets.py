@@ -0,0 +1,344 @@
+"""Static assets: vendored, fingerprinted and precompressed.
+
+Bootstrap, jQuery, Popper and Font Awesome used to come from unpkg and
+use.fontawesome.com on every page load. Now they're committed under
+static/vendor/, and served like any other static file.
+
+    flask vendor-assets
+
+downloads the pinned versions in VENDOR into static/vendor/, checking
+each against its pinned sha256; run it after changing VENDOR, and commit
+the result.
+
+    flask build-assets
+
+copies everything in static/ into static/dist/ under names with a hash
+of their contents in them (style.css -> style.3f9c2d1a7b4e.css),
+rewrites the url()s in stylesheets to match, writes a gzip (and, with
+the brotli package installed, a brotli) copy of each file that
+compresses well, and lists it all in static/dist/manifest.json. Run it
+on deploy; dist/ isn't committed. It fails if any of VENDOR is missing.
+
+Templates link assets with asset_url('stylesheets/style.css'), which
+gives the built, fingerprinted file if there's a build, and otherwise
+the file itself with its fingerprint as ?v=... Either is cached for good
+(see http_caching.py). Built files are served precompressed when the
+client accepts it: brotli first, then gzip.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import urllib.request
+from functools import lru_cache
+
+from flask import current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# versions templates/ is written against: Bootstrap 4 markup, Font Awesome 5
+# icons
+BOOTSTRAP = 'https://unpkg.com/bootstrap@4.6.2/dist'
+FONT_AWESOME = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4'
+
+# the fonts all.css uses, and their sha256s
+FONT_AWESOME_WEBFONTS = {
+    'fa-brands-400.eot':
+        'e4299464e7b012968eed63ac2db1c9509f56bca409ef9f71f2926a8c3c80b2a9',
+    'fa-brands-400.svg':
+        'a3b9817780214caf01e8aec20bcdc2305a1ff34a15fae81ecd0923df9cd5cd0a',
+    'fa-brands-400.ttf':
+        'cda59d6efffa685830fd95b55f64ae9cb51279cd34b2410b69f84c7ec30157d9',
+    'fa-brands-400.woff':
+        'f9217f66874b0c01cd8c10b6a295dbc4f609acb6f5adc41c37da46641b57eb02',
+    'fa-brands-400.woff2':
+        '8ea8791754915a898a3100e63e32978a6d1763be6df8e73a39d3a90d691cdeef',
+    'fa-regular-400.eot':
+        '79d088064beb3826054fb88165416235897a856ca952fca1498b1c59b16aaa48',
+    'fa-regular-400.svg':
+        'be0a084962d8066884f7fe9bd27ec16e51f5a93b72a502c92c5a24dc87eb2ebc',
+    'fa-regular-400.ttf':
+        'e8711bbb871afd8e9dea60e16d30f00c7e4837bbc9807065017475b849fa2313',
+    'fa-regular-400.woff':
+        'cb9e9e693192413cde2b1f21c1dc1d44b6fe7b27cc2b458e8b359d18f9ff8f4e',
+    'fa-regular-400.woff2':
+        'e42a88444448ac3d60549cc7c1ff2c8a9cac721034c073d80a14a44e79730cca',
+    'fa-solid-900.eot':
+        '373c04fd2418f5c77eea49d514731058f1907a94ff3b4e5d7c3e5767e8b53d8b',
+    'fa-solid-900.svg':
+        '9674eb1bd5504717903837093a67668ea88f2ed006d91367d0d4b7aa1f9211fc',
+    'fa-solid-900.ttf':
+        'af6397503fcefbd613976c21ad5c1e37298c18bbe07d096db03ccd3af6e05ba8',
+    'fa-solid-900.woff':
+        '3f6d3488cf65374f6f676c315340b0ac2be832bd55240c809448e36ef9b96326',
+    'fa-solid-900.woff2':
+        '9834b82ad26e2a37583d22676a12dd2eb0fe7c80356a2114d0db1aa8b3899537',
+}
+
+# static/ filename: (URL, sha256 of the file). vendor-assets refuses to
+# write a download that doesn't match: to upgrade a file, check the new
+# one and pin its hash here
+VENDOR = {
+    'vendor/bootstrap/bootstrap.min.css': (
+        f'{BOOTSTRAP}/css/bootstrap.min.css',
+        'f886516f3d41e9e7bd994c7f7a39a89cafae9483f90396cb0ddeafe8d1ea5e72'),
+    'vendor/bootstrap/bootstrap.min.js': (
+        f'{BOOTSTRAP}/js/bootstrap.min.js',
+        '423217abf8775cea2dc30fa1fe3e1c5e24dc359a80f1c37ad29a86094bfe81d1'),
+    'vendor/jquery/jquery.min.js': (
+        'https://unpkg.com/jquery@3.7.1/dist/jquery.min.js',
+        'fc9a93dd241f6b045cbff0481cf4e1901becd0e12fb45166a8f17f95823f0b1a'),
+    'vendor/popper/popper.min.js': (
+        'https://unpkg.com/popper.js@1.16.1/dist/umd/popper.min.js',
+        'fe28dc38bc057f6eb11180235bbe458b3295a39b674d889075d3d9a0b5071d9f'),
+    'vendor/fontawesome/css/all.css': (
+        f'{FONT_AWESOME}/css/all.min.css',
+        '99464ceb71bc9bbdcc72275faefe44f98eb5cbb6b5d8ee665b87b35376f1a96e'),
+    # all.css refers to these as ../webfonts/...
+    **{f'vendor/fontawesome/webfonts/{font}':
+       (f'{FONT_AWESOME}/webfonts/{font}', sha256)
+       for font, sha256 in FONT_AWESOME_WEBFONTS.items()},
+}
+
+# under static/
+BUILD_DIR = 'dist'
+MANIFEST = 'manifest.json'
+
+# worth compressing; images and woff fonts are compressed already
+COMPRESSIBLE = {'.css', '.js', '.svg', '.ico', '.ttf', '.eot', '.json',
+                '.txt', '.map'}
+# a compressed copy must save at least this much to be kept
+MIN_SAVING = 0.1
+
+# (Content-Encoding, file suffix), best first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def vendor_assets(static_folder):
+    """Download VENDOR into `static_folder`; return the paths fetched.
+
+    Raises RuntimeError, writing nothing, if any download doesn't match
+    its pinned sha256.
+    """
+
+    downloads = {}
+    for filename, (url, sha256) in VENDOR.items():
+        with urllib.request.urlopen(url) as response:
+            data = response.read()
+        if hashlib.sha256(data).hexdigest() != sha256:
+            raise RuntimeError(
+                f"{url} doesn't match the sha256 pinned for {filename}: "
+                f"check what changed before updating VENDOR")
+        downloads[filename] = data
+
+    for filename, data in downloads.items():
+        path = os.path.join(static_folder, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(data)
+    return list(downloads)
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def fingerprinted_name(filename, data):
+    root, ext = posixpath.splitext(filename)
+    return f'{root}.{content_hash(data)}{ext}'
+
+
+def source_files(static_folder):
+    """Every file under `static_folder` but the build, as '/' paths."""
+
+    for root, dirs, files in os.walk(static_folder):
+        rel = os.path.relpath(root, static_folder)
+        if rel == BUILD_DIR:
+            dirs[:] = []
+            continue
+        for name in files:
+            yield posixpath.normpath(
+                posixpath.join(rel.replace(os.sep, '/'), name))
+
+
+def rewrite_css(css, filename, built, static_url_path):
+    """Point the url()s in stylesheet `filename` at the built names in
+    `built`, relative to where the stylesheet is built."""
+
+    def replace(match):
+        quote, url = match.groups()
+        if re.match(r'^([a-z]+:|//|#)', url):
+            return match.group(0)
+
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        if path.startswith(static_url_path + '/'):
+            target = path[len(static_url_path) + 1:]
+        else:
+            target = posixpath.normpath(
+                posixpath.join(posixpath.dirname(filename), path))
+
+        if target not in built:
+            return match.group(0)
+        new = posixpath.relpath(built[target], posixpath.dirname(filename))
+        return f'url({quote}{new}{suffix}{quote})'
+
+    return CSS_URL.sub(replace, css)
+
+
+def compress(data):
+    """{encoding: compressed data} for the encodings worth sending."""
+
+    variants = {'gzip': gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data)
+
+    return {encoding: compressed for encoding, compressed in variants.items()
+            if len(compressed) <= len(data) * (1 - MIN_SAVING)}
+
+
+def build_assets(static_folder, static_url_path='/static', required=VENDOR):
+    """Build static/dist from `static_folder`; return the manifest.
+
+    Raises RuntimeError, building nothing, if any of the `required` files
+    isn't there.
+    """
+
+    missing = [filename for filename in required
+               if not os.path.isfile(os.path.join(static_folder, filename))]
+    if missing:
+        raise RuntimeError(
+            f"{len(missing)} vendored files are missing, "
+            f"{', '.join(missing[:3])} among them: run `flask vendor-assets` "
+            f"and commit static/vendor/")
+
+    out = os.path.join(static_folder, BUILD_DIR)
+    shutil.rmtree(out, ignore_errors=True)
+
+    filenames = sorted(source_files(static_folder))
+    # stylesheets last, so the files they refer to have their names
+    filenames.sort(key=lambda name: name.endswith('.css'))
+
+    files = {}
+    encodings = {}
+    for filename in filenames:
+        with open(os.path.join(static_folder, filename), 'rb') as file:
+            data = file.read()
+
+        if filename.endswith('.css'):
+            data = rewrite_css(data.decode('utf-8'), filename, files,
+                               static_url_path).encode('utf-8')
+
+        files[filename] = fingerprinted_name(filename, data)
+        path = os.path.join(out, files[filename])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(data)
+
+        if posixpath.splitext(filename)[1] in COMPRESSIBLE:
+            variants = compress(data)
+            for encoding, suffix in ENCODINGS:
+                if encoding in variants:
+                    with open(path + suffix, 'wb') as file:
+                        file.write(variants[encoding])
+            if variants:
+                encodings[files[filename]] = sorted(variants)
+
+    manifest = {
+        'files': {name: f'{BUILD_DIR}/{built}'
+                  for name, built in files.items()},
+        'encodings': {f'{BUILD_DIR}/{built}': variants
+                      for built, variants in encodings.items()},
+    }
+    with open(os.path.join(out, MANIFEST), 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(app):
+    """Read the build's manifest, if there is one, for asset_url()."""
+
+    path = os.path.join(app.static_folder, BUILD_DIR, MANIFEST)
+    try:
+        with open(path) as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        manifest = {'files': {}, 'encodings': {}}
+
+    app.extensions['assets'] = manifest
+    return manifest
+
+
+@lru_cache(maxsize=None)
+def file_fingerprint(path, mtime):
+    """The content hash of a file; `mtime` keys the cache."""
+
+    with open(path, 'rb') as file:
+        return content_hash(file.read())
+
+
+def fingerprint(filename):
+    """The content hash of static file `filename`, or None if missing."""
+
+    path = os.path.join(current_app.static_folder, filename)
+    try:
+        return file_fingerprint(path, os.stat(path).st_mtime_ns)
+    except FileNotFoundError:
+        return None
+
+
+def asset_url(filename):
+    """The URL of static file `filename`, fingerprinted to cache forever."""
+
+    built = current_app.extensions['assets']['files'].get(filename)
+    if built is not None:
+        return url_for('static', filename=built)
+
+    return url_for('static', filename=filename, v=fingerprint(filename))
+
+
+def is_fingerprinted(filename):
+    """Whether this request for static `filename` names its contents."""
+
+    if filename.startswith(BUILD_DIR + '/'):
+        return True
+    version = request.args.get('v')
+    return version is not None and version == fingerprint(filename)
+
+
+def send_static_file(filename):
+    """Serve a static file, precompressed if there's a copy the client
+    accepts."""
+
+    available = current_app.extensions['assets']['encodings'].get(filename)
+    if not available:
+        return current_app.send_static_file(filename)
+
+    for encoding, suffix in ENCODINGS:
+        if encoding in available and request.accept_encodings[encoding]:
+            mimetype = mimetypes.guess_type(filename)[0]
+            response = send_from_directory(
+                current_app.static_folder, filename + suffix,
+                mimetype=mimetype or 'application/octet-stream')
+            response.content_encoding = encoding
+            break
+    else:
+        response = current_app.send_static_file(filename)
+
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_assets(app):
+    load_manifest(app)
+    app.add_template_global(asset_url)
+    app.view_functions['static'] = send_static_file
@@ -0,0 +1,122 @@
+"""Logins, rate-limited so that guessing passwords can't eat the CPU.
+
+Every check of a password costs a bcrypt hash (see passwords.py), so
+before one runs, a login has to get past two token buckets (see
+ratelimit.py): one for the username, which stops guessing at one
+account, and one for the client's address, which stops one client
+guessing at many. Past either, login() answers 429 without checking.
+
+Usernames found not to exist are remembered for UNKNOWN_USERNAME_TTL
+seconds, so repeated tries at them skip the query too. They still take
+as long as a real check (see PasswordHasher.pretend_check), so no answer
+gives away which usernames exist. A session hook forgets a username as
+soon as a commit creates a user with it; other workers may go on
+rejecting it until the TTL is up.
+"""
+
+from flask import current_app
+from sqlalchemy.engine import make_url
+
+from cache import LRUCache
+from changes import track_committed
+from models import User
+from passwords import hasher
+from ratelimit import BACKENDS, TAKE, Limit
+
+UNKNOWN_USERNAMES = 10000
+UNKNOWN_USERNAME_TTL = 30
+
+unknown_usernames = LRUCache(maxsize=UNKNOWN_USERNAMES,
+                             ttl=UNKNOWN_USERNAME_TTL)
+
+
+class LoginLimiter:
+    """The token buckets logins take from, in one backend."""
+
+    def __init__(self, backend, per_username, per_ip):
+        self.backend = backend
+        self.per_username = per_username
+        self.per_ip = per_ip
+
+    def take(self, username, ip):
+        """Take a token for a login; 0, or the seconds to wait for one."""
+
+        wait = self.backend.take(f'login-ip:{ip}', self.per_ip)
+        if wait:
+            return wait
+        return self.backend.take(f'login-user:{username}', self.per_username)
+
+
+def init_login_limits(app):
+    app.config.setdefault('RATE_LIMIT_BACKEND', 'memory')
+    app.config.setdefault('LOGIN_USERNAME_BURST', 5)
+    app.config.setdefault('LOGIN_USERNAME_INTERVAL', 12)
+    app.config.setdefault('LOGIN_IP_BURST', 20)
+    app.config.setdefault('LOGIN_IP_INTERVAL', 3)
+
+    backend = app.config['RATE_LIMIT_BACKEND']
+    if backend == 'database':
+        dialect = make_url(
+            app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name()
+        if dialect not in TAKE:
+            raise RuntimeError(
+                f"RATE_LIMIT_BACKEND 'database' can't keep buckets in "
+                f"{dialect}: use Postgres or SQLite, or the 'memory' backend")
+    if isinstance(backend, str):
+        backend = BACKENDS[backend]()
+
+    app.extensions['login_limiter'] = LoginLimiter(
+        backend,
+        per_username=Limit(app.config['LOGIN_USERNAME_BURST'],
+                           app.config['LOGIN_USERNAME_INTERVAL']),
+        per_ip=Limit(app.config['LOGIN_IP_BURST'],
+                     app.config['LOGIN_IP_INTERVAL']))
+
+
+def login_limiter():
+    """The current app's LoginLimiter."""
+
+    return current_app.extensions['login_limiter']
+
+
+def authenticate(username, password):
+    """The user with `username` and `password`, or False.
+
+    Usernames known not to exist skip the query, and a check against one
+    is as slow as a wrong password, so timing doesn't give away which
+    exist.
+    """
+
+    if unknown_usernames.get(username):
+        hasher().pretend_check()
+        return False
+
+    user = User.query.filter_by(username=username).first()
+
+    if user is None:
+        unknown_usernames.set(username, True)
+        hasher().pretend_check()
+        return False
+
+    if user.check_password(password):
+        return user
+
+    return False
+
+
+def collect_new_usernames(session, usernames):
+    """Note the usernames this flush gives to users."""
+
+    usernames.update(obj.username for obj in session.new | session.dirty
+                     if isinstance(obj, User))
+
+
+def forget_unknown_usernames(usernames):
+    """Once the users exist, stop turning their usernames away."""
+
+    for username in usernames:
+        unknown_usernames.pop(username)
+
+
+track_committed('new_usernames', collect_new_usernames,
+                forget_unknown_usernames)
@@ -0,0 +1,106 @@
+"""CPU cost against bytes saved, compressing feed pages.
+
+Run from the project root, against a seeded database (see bench_routes):
+
+    python -m benchmarks.bench_routes --users 10000
+    python -m benchmarks.bench_compression --pages 100
+
+Fetches --pages home feeds and profile pages, each as a random logged-in
+user, from the app over BENCH_DATABASE_URL (default
+postgresql:///warbler-bench), uncompressed, then compresses every page
+with each encoding compression.py can use here -- gzip always, brotli
+and zstd if their packages are installed -- at a few levels, the way the
+middleware does: one chunk, flushed, then finished. Prints the average
+page size before and after, p50/p95 milliseconds of CPU per page, and
+what that CPU buys: kilobytes saved per millisecond.
+"""
+
+import argparse
+import logging
+import os
+import random
+from time import process_time
+
+os.environ['DATABASE_URL'] = os.environ.get(
+    'BENCH_DATABASE_URL', 'postgresql:///warbler-bench')
+
+from sqlalchemy import select
+
+from app import create_app, CURR_USER_KEY
+from benchmarks.bench_search import percentile
+from compression import available_encoders
+from models import db, User
+
+# levels to try for each encoding; the middleware's defaults are in
+# compression.COMPRESSION_LEVELS
+LEVELS = {'gzip': (1, 6, 9), 'br': (1, 4, 6, 11), 'zstd': (1, 3, 9, 19)}
+
+
+def fetch_pages(app, user_ids, count, rng):
+    """The HTML of `count` home feeds and profiles, by route."""
+
+    client = app.test_client()
+    pages = {'homepage': [], 'users_show': []}
+    for _ in range(count):
+        with client.session_transaction() as session:
+            session[CURR_USER_KEY] = rng.choice(user_ids)
+        pages['homepage'].append(client.get('/').data)
+        pages['users_show'].append(
+            client.get(f'/users/{rng.choice(user_ids)}').data)
+    return pages
+
+
+def compress(encoder, level, pages):
+    """(compressed bytes, CPU milliseconds) for each page."""
+
+    results = []
+    for page in pages:
+        start = process_time()
+        encoding = encoder(level)
+        size = len(encoding.compress(page)) + len(encoding.finish())
+        results.append((size, (process_time() - start) * 1000))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=100,
+                        help="pages of each kind to compress")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.getLogger('warbler.sql').setLevel(logging.ERROR)
+    app = create_app()
+    with app.app_context():
+        rng = random.Random(args.seed)
+        user_ids = db.session.scalars(select(User.id)).all()
+        if not user_ids:
+            raise SystemExit("No users: seed the database first")
+        pages = fetch_pages(app, user_ids, args.pages, rng)
+
+    encoders = available_encoders()
+    print(f"\nencodings here: {', '.join(e.name for e in encoders)}")
+    for route, html in pages.items():
+        average = sum(map(len, html)) / len(html)
+        print(f"\n{route}: {len(html)} pages, "
+              f"{average / 1024:.1f} KB on average")
+        print(f"  {'encoding':<10} {'KB':>7} {'ratio':>6} {'p50 ms':>7} "
+              f"{'p95 ms':>7} {'KB saved/ms':>12}")
+
+        for encoder in encoders:
+            for level in LEVELS[encoder.name]:
+                results = compress(encoder, level, html)
+                compressed = sum(size for size, ms in results) / len(results)
+                times = [ms for size, ms in results]
+                saved = (sum(map(len, html)) - sum(
+                    size for size, ms in results)) / 1024
+                print(f"  {encoder.name + '-' + str(level):<10} "
+                      f"{compressed / 1024:>7.1f} "
+                      f"{average / compressed:>5.1f}x "
+                      f"{percentile(times, 50):>7.2f} "
+                      f"{percentile(times, 95):>7.2f} "
+                      f"{saved / max(sum(times), 1e-9):>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
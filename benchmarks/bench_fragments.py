@@ -0,0 +1,130 @@
+"""Template render time, with message and user cards cached and not.
+
+Run from the project root, against a seeded database (see bench_routes):
+
+    python -m benchmarks.bench_routes --users 10000
+    python -m benchmarks.bench_fragments --pages 200
+
+Loads --pages home feeds, profiles, user list pages and following lists
+for random users from BENCH_DATABASE_URL (default postgresql:///warbler-bench), then
+times just rendering them -- the queries are run beforehand -- twice:
+with the card cache emptied before every page, so each card is rendered
+from its template as it was before fragments.py, and with the cache
+warm. Prints p50/p95 milliseconds per page and cards per page for each.
+"""
+
+import argparse
+import os
+import random
+from time import perf_counter
+
+os.environ['DATABASE_URL'] = os.environ.get(
+    'BENCH_DATABASE_URL', 'postgresql:///warbler-bench')
+
+from flask import g, render_template
+from sqlalchemy import select
+
+from app import create_app
+from benchmarks.bench_search import percentile
+from current_user import CurrentUser, load_snapshot
+from feeds import home_feed, user_feed
+from fragments import fragments
+from models import db, User
+from pagination import paginate_users
+
+
+def load_pages(user_ids, count, rng):
+    """(template, context, viewer id, cards) for `count` of each page."""
+
+    pages = []
+    for _ in range(count):
+        viewer_id = rng.choice(user_ids)
+
+        messages = home_feed(viewer_id)
+        pages.append(('home.html', {'messages': messages, 'likes': set()},
+                      viewer_id, len(messages)))
+
+        author_id = rng.choice(user_ids)
+        messages = user_feed(author_id)
+        pages.append(('users/show.html',
+                      {'user': db.session.get(User, author_id),
+                       'messages': messages},
+                      viewer_id, len(messages)))
+
+        users = paginate_users(User.query)
+        pages.append(('users/index.html', {'users': users},
+                      viewer_id, len(users)))
+
+        user = db.session.get(User, rng.choice(user_ids))
+        pages.append(('users/following.html', {'user': user},
+                      viewer_id, len(user.following)))
+
+    return pages
+
+
+def render(app, pages, cold):
+    """Milliseconds to render each page, by template."""
+
+    timings = {}
+    viewers = {}
+
+    for template, context, viewer_id, cards in pages:
+        with app.test_request_context():
+            if viewer_id not in viewers:
+                viewer = viewers[viewer_id] = CurrentUser(
+                    load_snapshot(viewer_id))
+                # loads the follow set the follow buttons check
+                viewer.is_following(viewer)
+            g.user = viewers[viewer_id]
+
+            if cold:
+                fragments().clear()
+            start = perf_counter()
+            render_template(template, **context)
+            timings.setdefault(template, []).append(
+                (perf_counter() - start) * 1000)
+
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=200,
+                        help="pages of each kind to render")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        rng = random.Random(args.seed)
+        user_ids = db.session.scalars(select(User.id)).all()
+        if not user_ids:
+            raise SystemExit("No users: seed the database first")
+
+        pages = load_pages(user_ids, args.pages, rng)
+        cards = {}
+        for template, context, viewer_id, count in pages:
+            cards.setdefault(template, []).append(count)
+
+        # once through to load templates and lazy attributes
+        render(app, pages, cold=True)
+        cold = render(app, pages, cold=True)
+        warm = render(app, pages, cold=False)
+
+    print(f"\n{args.pages} pages of each")
+    print(f"  {'page':<22} {'cards':>6} {'cold p50':>9} {'cold p95':>9} "
+          f"{'warm p50':>9} {'warm p95':>9} {'speedup':>8}")
+    for template in cold:
+        speedup = (percentile(cold[template], 50)
+                   / percentile(warm[template], 50))
+        print(f"  {template:<22} "
+              f"{sum(cards[template]) / len(cards[template]):>6.1f} "
+              f"{percentile(cold[template], 50):>9.2f} "
+              f"{percentile(cold[template], 95):>9.2f} "
+              f"{percentile(warm[template], 50):>9.2f} "
+              f"{percentile(warm[template], 95):>9.2f} "
+              f"{speedup:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
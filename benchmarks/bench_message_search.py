@@ -0,0 +1,202 @@
+"""Message search latency at scale.
+
+Run from the project root, against a database of its own:
+
+    createdb warbler-bench
+    python -m benchmarks.bench_message_search --messages 2000000
+
+Fills BENCH_DATABASE_URL (default postgresql:///warbler-bench) with
+synthetic users and messages, if it doesn't have enough already -- the
+messages recombine sentences from generator/messages.csv, so they share
+its vocabulary -- then times message_search.search_messages() over a mix
+of query kinds, first page and a few pages deep, and prints p50/p95/p99
+for each next to an ILIKE '%...%' scan. Also builds the in-process
+InvertedIndex over the first --index-messages messages and times the same
+queries against it.
+"""
+
+import argparse
+import csv
+import io
+import os
+import random
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from time import perf_counter
+
+os.environ['DATABASE_URL'] = os.environ.get(
+    'BENCH_DATABASE_URL', 'postgresql:///warbler-bench')
+
+from sqlalchemy import select, text
+
+from app import create_app
+from benchmarks.bench_search import fill_users, report, time_each
+from models import db, Message
+from message_search import InvertedIndex, search_messages, terms
+from snowflake import id_from_datetime
+
+LOAD_BATCH = 100000
+DEEP_PAGES = 5
+
+
+def read_sentences():
+    with open('generator/messages.csv') as f:
+        return [sentence + '.'
+                for row in csv.DictReader(f)
+                for sentence in re.split(r'\.\s*', row['text'])
+                if sentence]
+
+
+def fake_message(rng, sentences):
+    message = rng.choice(sentences)
+    for _ in range(rng.randint(0, 2)):
+        longer = f"{message} {rng.choice(sentences)}"
+        if len(longer) > 140:
+            break
+        message = longer
+    return message
+
+
+def fill_messages(count, users, rng):
+    """Add synthetic messages until there are `count`."""
+
+    have = Message.query.count()
+    if have >= count:
+        return
+
+    print(f"Loading {count - have} messages...")
+    sentences = read_sentences()
+    start_time = datetime(2016, 1, 1)
+
+    [search_index] = [index for index in Message.__table__.indexes
+                      if index.name == 'ix_messages_search']
+    db.session.commit()
+    search_index.drop(db.engine, checkfirst=True)
+
+    cursor = db.session.connection().connection.cursor()
+    start = perf_counter()
+
+    for first in range(have, count, LOAD_BATCH):
+        rows = io.StringIO()
+        for i in range(first, min(first + LOAD_BATCH, count)):
+            when = start_time + timedelta(seconds=i)
+            rows.write(f"{id_from_datetime(when)}\t"
+                       f"{fake_message(rng, sentences)}\t{when}\t"
+                       f"{rng.randint(1, users)}\n")
+        rows.seek(0)
+        cursor.copy_expert("COPY messages (id, text, timestamp, user_id) "
+                           "FROM STDIN", rows)
+        db.session.commit()
+
+    print(f"Loaded in {perf_counter() - start:.1f}s")
+
+    start = perf_counter()
+    search_index.create(db.engine)
+    db.session.execute(text("ANALYZE messages"))
+    db.session.commit()
+    print(f"Indexed in {perf_counter() - start:.1f}s")
+
+
+def sample_queries(rng, per_kind):
+    """Queries of each kind, with words drawn from the corpus."""
+
+    frequency = Counter(term for sentence in read_sentences()
+                        for term in terms(sentence))
+    by_frequency = [term for term, count in frequency.most_common()]
+    common = by_frequency[:50]
+    rare = by_frequency[-200:]
+    sentences = read_sentences()
+
+    def phrase():
+        words = rng.choice(sentences).rstrip('.').split()
+        start = rng.randrange(max(1, len(words) - 1))
+        return '"' + ' '.join(words[start:start + 2]) + '"'
+
+    return {
+        'common word': [rng.choice(common) for _ in range(per_kind)],
+        'rare word': [rng.choice(rare) for _ in range(per_kind)],
+        'two words': [f"{rng.choice(common)} {rng.choice(rare)}"
+                      for _ in range(per_kind)],
+        'phrase': [phrase() for _ in range(per_kind)],
+        'no match': [f"qx{rng.choice(rare)}" for _ in range(per_kind)],
+    }
+
+
+def deep_page(query):
+    """Follow the cursor DEEP_PAGES pages in."""
+
+    before = None
+    for _ in range(DEEP_PAGES - 1):
+        before = search_messages(query, before).next_cursor
+        if not before:
+            return None
+    return search_messages(query, before)
+
+
+def time_deep(queries):
+    timings = []
+    for query in queries:
+        start = perf_counter()
+        if deep_page(query) is not None:
+            timings.append(perf_counter() - start)
+        db.session.expunge_all()
+    return timings
+
+
+def ilike_scan(query):
+    pattern = f"%{query.strip(chr(34))}%"
+    return (Message.query
+            .filter(Message.text.ilike(pattern))
+            .order_by(Message.id.desc())
+            .limit(100)
+            .all())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000000)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=50,
+                        help="queries of each kind")
+    parser.add_argument('--ilike-queries', type=int, default=5,
+                        help="queries of each kind for the ILIKE baseline")
+    parser.add_argument('--index-messages', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    db.create_all()
+    fill_users(args.users, rng)
+    fill_messages(args.messages, args.users, rng)
+    queries = sample_queries(rng, args.queries)
+
+    report(f"search_messages(), Postgres, {args.messages} messages",
+           {kind: time_each(qs, search_messages)
+            for kind, qs in queries.items()})
+
+    report(f"search_messages(), page {DEEP_PAGES} "
+           "(total time for all pages)",
+           {kind: timings for kind, qs in queries.items()
+            if (timings := time_deep(qs[:args.ilike_queries * 2]))})
+
+    report(f"ILIKE '%q%', Postgres, {args.messages} messages",
+           {kind: time_each(qs[:args.ilike_queries], ilike_scan)
+            for kind, qs in queries.items()})
+
+    index = InvertedIndex()
+    start = perf_counter()
+    index.load(db.session.execute(
+        select(Message.id, Message.text)
+        .order_by(Message.id).limit(args.index_messages)))
+    print(f"\nBuilt InvertedIndex over {len(index)} messages "
+          f"in {perf_counter() - start:.1f}s")
+
+    report(f"InvertedIndex, {len(index)} messages",
+           {kind: time_each(qs, index.search)
+            for kind, qs in queries.items()})
+
+
+if __name__ == '__main__':
+    with create_app().app_context():
+        main()
@@ -0,0 +1,132 @@
+"""Login throughput, with bcrypt on the request threads or in a pool.
+
+Run from the project root:
+
+    python -m benchmarks.bench_passwords --rounds 12 --threads 16
+
+For each --workers setting (0: hash on the request thread), logs in from
+--threads threads at once for --seconds, through the app against
+BENCH_DATABASE_URL (default postgresql:///warbler-bench), while one more
+thread keeps loading a profile page. Prints logins per second, per
+second per core, login latency, and the profile page's latency meanwhile
+-- what a burst of logins costs everyone else on the worker.
+"""
+
+import argparse
+import logging
+import os
+import threading
+from time import perf_counter
+
+os.environ['DATABASE_URL'] = os.environ.get(
+    'BENCH_DATABASE_URL', 'postgresql:///warbler-bench')
+
+from app import create_app
+from benchmarks.bench_search import percentile
+from config import load_config
+from models import db, User
+from passwords import PasswordHasher
+
+USERNAME = 'bench_login'
+PASSWORD = 'correct horse battery staple'
+
+
+def make_app(rounds, workers):
+    config = load_config()
+    config.BCRYPT_LOG_ROUNDS = rounds
+    config.PASSWORD_HASH_WORKERS = workers
+    config.WTF_CSRF_ENABLED = False
+    # this is the flood of logins the rate limits are there to stop
+    config.LOGIN_USERNAME_BURST = config.LOGIN_IP_BURST = 10 ** 9
+    app = create_app(config)
+    logging.getLogger('warbler.sql').setLevel(logging.ERROR)
+    return app
+
+
+def add_user(rounds):
+    """The user to log in as, hashed at `rounds`; returns its id."""
+
+    db.create_all()
+    user = User.query.filter_by(username=USERNAME).first()
+    if user is None:
+        user = User(username=USERNAME, email=f"{USERNAME}@example.com",
+                    password='')
+        db.session.add(user)
+    user.password = PasswordHasher(rounds).hash(PASSWORD)
+    db.session.commit()
+    return user.id
+
+
+def run(app, user_id, threads, seconds):
+    """Log in from `threads` threads while timing the profile page."""
+
+    lock = threading.Lock()
+    logins = []
+    pages = []
+    stop = perf_counter() + seconds
+
+    def log_in():
+        client = app.test_client()
+        while perf_counter() < stop:
+            start = perf_counter()
+            resp = client.post('/login', data={'username': USERNAME,
+                                               'password': PASSWORD})
+            elapsed = perf_counter() - start
+            if resp.status_code != 302:
+                raise SystemExit(f"login failed: {resp.status_code}")
+            with lock:
+                logins.append(elapsed)
+
+    def browse():
+        client = app.test_client()
+        while perf_counter() < stop:
+            start = perf_counter()
+            client.get(f'/users/{user_id}')
+            pages.append(perf_counter() - start)
+
+    workers = [threading.Thread(target=log_in) for _ in range(threads)]
+    workers.append(threading.Thread(target=browse))
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    return logins, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', default=f"0,1,{os.cpu_count()}",
+                        help="comma-separated pool sizes to compare")
+    args = parser.parse_args()
+
+    cores = os.cpu_count()
+    print(f"\ncost {args.rounds}, {args.threads} threads logging in, "
+          f"{cores} cores")
+    print(f"  {'workers':>7} {'logins/s':>9} {'per core':>9} "
+          f"{'login p50':>10} {'login p95':>10} {'page p50':>9} "
+          f"{'page p95':>9}")
+
+    for workers in sorted({int(w) for w in args.workers.split(',')}):
+        app = make_app(args.rounds, workers)
+        with app.app_context():
+            user_id = add_user(args.rounds)
+
+        logins, pages = run(app, user_id, args.threads, args.seconds)
+        app.extensions['passwords'].shutdown()
+
+        logins_ms = [t * 1000 for t in logins]
+        pages_ms = [t * 1000 for t in pages]
+        rate = len(logins) / args.seconds
+        print(f"  {workers:>7} {rate:>9.1f} {rate / cores:>9.1f} "
+              f"{percentile(logins_ms, 50):>10.1f} "
+              f"{percentile(logins_ms, 95):>10.1f} "
+              f"{percentile(pages_ms, 50):>9.1f} "
+              f"{percentile(pages_ms, 95):>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""Load test of the connection pool at high concurrency.
+
+Run from the project root, against a seeded database (see bench_routes):
+
+    python -m benchmarks.bench_routes --users 10000
+    python -m benchmarks.bench_pool --threads 200 --seconds 20
+
+Sends homepage and profile requests from --threads threads at once, as
+random logged-in users, for --seconds, against BENCH_DATABASE_URL
+(default postgresql:///warbler-bench), once for each pool set up in
+SCENARIOS:
+
+- unbounded: a connection for every thread that asks, as a pool with no
+  overflow limit (or no pool at all) gives -- past Postgres'
+  max_connections, requests fail
+- pooled: --pool-size connections, as pool.py sets up; threads queue for
+  one instead
+- pgbouncer: no pool, through PgBouncer in transaction mode, if
+  --pgbouncer-url is given
+
+For each it prints throughput (overall, and the slowest, median and
+fastest second), latency, errors, the mean wait for a connection and the
+most connections Postgres saw open at once.
+"""
+
+import argparse
+import logging
+import os
+import random
+import threading
+from collections import Counter
+from time import perf_counter, sleep
+
+os.environ['DATABASE_URL'] = os.environ.get(
+    'BENCH_DATABASE_URL', 'postgresql:///warbler-bench')
+
+import psycopg2
+from sqlalchemy import select
+
+from app import create_app, CURR_USER_KEY
+from benchmarks.bench_search import percentile
+from config import load_config
+from instrumentation import metrics
+from models import db, User
+from pool import engine_options
+
+# share of requests that are homepages; the rest are profiles
+HOMEPAGE_SHARE = 0.7
+
+
+def scenarios(args):
+    """(name, database url, DB_* settings) for each pool to test."""
+
+    url = os.environ['DATABASE_URL']
+    yield 'unbounded', url, {'DB_POOL_SIZE': '5', 'DB_MAX_OVERFLOW': '-1',
+                             'DB_POOL_PRE_PING': 'off'}
+    yield 'pooled', url, {'DB_POOL_SIZE': str(args.pool_size),
+                          'DB_MAX_OVERFLOW': '0',
+                          'DB_POOL_TIMEOUT': str(args.pool_timeout)}
+    if args.pgbouncer_url:
+        yield 'pgbouncer', args.pgbouncer_url, {'DB_PGBOUNCER': '1'}
+
+
+def make_app(url, settings):
+    config = load_config()
+    config.SQLALCHEMY_DATABASE_URI = url
+    config.SQLALCHEMY_ENGINE_OPTIONS = engine_options(url, settings)
+    app = create_app(config)
+
+    # failures are counted below; their tracebacks and the slow-query log
+    # would drown the report
+    app.logger.setLevel(logging.CRITICAL)
+    logging.getLogger('warbler.sql').setLevel(logging.ERROR)
+    return app
+
+
+class ConnectionMonitor(threading.Thread):
+    """Samples how many connections the database has open."""
+
+    def __init__(self, url):
+        super().__init__(daemon=True)
+        self.conn = psycopg2.connect(url)
+        self.conn.autocommit = True
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        with self.conn.cursor() as cursor:
+            while not self.stopped.is_set():
+                cursor.execute("SELECT count(*) FROM pg_stat_activity "
+                               "WHERE datname = current_database()")
+                # less this connection
+                self.peak = max(self.peak, cursor.fetchone()[0] - 1)
+                sleep(0.1)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.conn.close()
+
+
+def load(app, user_ids, threads, seconds, seed):
+    """Send requests from `threads` threads for `seconds`; return results."""
+
+    lock = threading.Lock()
+    timings = []
+    per_second = Counter()
+    errors = Counter()
+    start = perf_counter()
+    stop = start + seconds
+
+    def worker(n):
+        rng = random.Random(seed + n)
+        client = app.test_client()
+
+        while (now := perf_counter()) < stop:
+            with client.session_transaction() as session:
+                session[CURR_USER_KEY] = rng.choice(user_ids)
+            url = ('/' if rng.random() < HOMEPAGE_SHARE
+                   else f'/users/{rng.choice(user_ids)}')
+
+            try:
+                status = client.get(url).status_code
+            except Exception as exc:
+                status = type(exc).__name__
+            elapsed = perf_counter() - now
+
+            with lock:
+                if status == 200:
+                    timings.append(elapsed)
+                    per_second[int(now - start)] += 1
+                else:
+                    errors[status] += 1
+
+    workers = [threading.Thread(target=worker, args=(n,))
+               for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    return timings, per_second, errors, perf_counter() - start
+
+
+def report(name, timings, per_second, errors, elapsed, peak):
+    ms = [t * 1000 for t in timings] or [0]
+    # the first and last seconds are ramping up and down
+    steady = sorted(per_second[s] for s in range(1, int(elapsed) - 1)) or [0]
+    wait = metrics.pool_wait.sum / max(metrics.pool_wait.count, 1) * 1000
+
+    print(f"  {name:<10} {len(timings) / elapsed:>7.1f} {steady[0]:>6} "
+          f"{percentile(steady, 50):>6} {steady[-1]:>6} "
+          f"{percentile(ms, 50):>8.1f} {percentile(ms, 99):>8.1f} "
+          f"{sum(errors.values()):>7} {wait:>8.2f} {peak:>6}")
+    for error, count in errors.most_common():
+        print(f"  {'':<10} {count} x {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--pool-size', type=int, default=10)
+    parser.add_argument('--pool-timeout', type=float, default=30)
+    parser.add_argument('--pgbouncer-url',
+                        help="the same database, through PgBouncer")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with make_app(os.environ['DATABASE_URL'], {}).app_context():
+        user_ids = db.session.scalars(
+            select(User.id).order_by(User.id).limit(10000)).all()
+        if not user_ids:
+            raise SystemExit("No users: seed the database first")
+        rng = random.Random(args.seed)
+        user_ids = rng.sample(user_ids, min(len(user_ids), 1000))
+
+    print(f"\n{args.threads} threads for {args.seconds:g}s")
+    print(f"  {'pool':<10} {'req/s':>7} {'min/s':>6} {'p50/s':>6} "
+          f"{'max/s':>6} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} "
+          f"{'wait ms':>8} {'conns':>6}")
+
+    for name, url, settings in scenarios(args):
+        app = make_app(url, settings)
+        metrics.clear()
+        monitor = ConnectionMonitor(os.environ['DATABASE_URL'])
+        monitor.start()
+
+        results = load(app, user_ids, args.threads, args.seconds, args.seed)
+
+        monitor.stop()
+        with app.app_context():
+            db.engine.dispose()
+        report(name, *results, monitor.peak)
+
+
+if __name__ == '__main__':
+    main()
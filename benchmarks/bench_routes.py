@@ -0,0 +1,289 @@
+"""Request-level benchmark of the main routes.
+
+Run from the project root, against a database of its own:
+
+    createdb warbler-bench
+    python -m benchmarks.bench_routes --users 10000
+
+Generates CSVs with generator/create_csvs.py at the given scale and seeds
+BENCH_DATABASE_URL (default postgresql:///warbler-bench) from them with
+seed.py -- unless --no-seed -- then sends a seeded, weighted mix of
+requests (MIX) through app.test_client(), each as a random logged-in
+user. For each route it prints p50/p95/p99 latency, and the SQL queries
+and rows fetched per request (rows only on Postgres: see
+instrumentation.py).
+
+Results are compared with a JSON baseline (--baseline, by default
+benchmarks/baseline_routes.json, if there is one), and the run exits 1
+if any route got slower than the baseline by more than --tolerance or
+runs more queries or fetches more rows than it did. Record a new
+baseline with --save-baseline; baselines only compare at the same scale
+and seed, and latency only on the same machine.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+os.environ['DATABASE_URL'] = os.environ.get(
+    'BENCH_DATABASE_URL', 'postgresql:///warbler-bench')
+
+from sqlalchemy import func, select
+
+from app import create_app, CURR_USER_KEY
+from benchmarks.bench_search import percentile
+from instrumentation import metrics
+from models import db, Follows, Message, User
+from seed import seed
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline_routes.json')
+
+# (route, weight): mostly reading feeds and profiles, some writes
+MIX = (
+    ('homepage', 35),
+    ('users_show', 20),
+    ('list_users', 10),
+    ('show_likes', 10),
+    ('add_like', 12),
+    ('add_follow', 5),
+    ('messages_add', 8),
+)
+
+# how much slower than the baseline a route may get before the run fails
+TOLERANCE = 0.5
+
+# queries and rows are deterministic for a scale and seed, but allow for
+# a little drift from the random writes
+COUNT_TOLERANCE = 0.1
+
+app = create_app()
+
+
+def seed_database(args):
+    """Generate CSVs at the given scale and load them."""
+
+    with tempfile.TemporaryDirectory() as directory:
+        subprocess.run(
+            [sys.executable, 'generator/create_csvs.py',
+             '--users', str(args.users),
+             '--messages-per-user', str(args.messages_per_user),
+             '--follows-per-user', str(args.follows_per_user),
+             '--likes-per-message', str(args.likes_per_message),
+             '--seed', str(args.seed),
+             '--out', directory],
+            check=True)
+        seed(directory, batch_rows=50000)
+
+
+class Workload:
+    """Picks the next request for each route in MIX."""
+
+    def __init__(self, rng, sample_size=1000):
+        self.rng = rng
+        self.user_count = db.session.scalar(select(func.max(User.id)))
+
+        # drawn with `rng`, not the database's random(), so a run repeats
+        sample = [self.user_id() for _ in range(sample_size)]
+        self.usernames = db.session.scalars(
+            select(User.username).where(User.id.in_(sample))
+            .order_by(User.id)).all()
+        self.message_ids = db.session.scalars(
+            select(Message.id).where(Message.user_id.in_(sample))
+            .order_by(Message.id).limit(sample_size)).all()
+
+    def user_id(self):
+        return self.rng.randint(1, self.user_count)
+
+    def homepage(self, user_id):
+        return 'GET', '/', None
+
+    def users_show(self, user_id):
+        return 'GET', f'/users/{self.user_id()}', None
+
+    def list_users(self, user_id):
+        if self.rng.random() < 0.5:
+            return 'GET', '/users', None
+        return 'GET', f'/users?q={self.rng.choice(self.usernames)[:4]}', None
+
+    def show_likes(self, user_id):
+        return 'GET', f'/users/{user_id}/likes', None
+
+    def add_like(self, user_id):
+        # likes, or unlikes if it's already liked
+        return 'POST', f'/users/add_like/{self.rng.choice(self.message_ids)}', None
+
+    def add_follow(self, user_id):
+        while True:
+            followed = self.user_id()
+            if followed != user_id and not db.session.get(
+                    Follows, (followed, user_id)):
+                return 'POST', f'/users/follow/{followed}', None
+
+    def messages_add(self, user_id):
+        return 'POST', '/messages/new', {
+            'text': f"Benchmark warble {self.rng.random():.6f}"}
+
+
+def counted():
+    """(queries, rows) the app's requests have run and read so far.
+
+    The same per-request stats /metrics exports (see instrumentation.py),
+    which count the rows streamed feeds read from server-side cursors.
+    """
+
+    return sum(metrics.queries.values()), sum(metrics.rows.values())
+
+
+def run(workload, rng, requests):
+    """Send `requests` requests; return measurements by route."""
+
+    routes, weights = zip(*MIX)
+    results = {route: {'timings': [], 'queries': 0, 'rows': 0}
+               for route in routes}
+    client = app.test_client()
+
+    for route in rng.choices(routes, weights, k=requests):
+        user_id = workload.user_id()
+        method, url, data = getattr(workload, route)(user_id)
+        with client.session_transaction() as session:
+            session[CURR_USER_KEY] = user_id
+
+        queries, rows = counted()
+        start = perf_counter()
+        resp = client.open(url, method=method, data=data)
+        # streamed feeds run their queries as the body is read, and the
+        # request's stats are recorded once it's closed
+        resp.get_data()
+        resp.close()
+        elapsed = perf_counter() - start
+
+        if resp.status_code >= 400:
+            sys.exit(f"{method} {url}: got {resp.status_code}")
+
+        result = results[route]
+        result['timings'].append(elapsed)
+        after_queries, after_rows = counted()
+        result['queries'] += after_queries - queries
+        result['rows'] += after_rows - rows
+
+        # a fresh session per request, as each request's own app
+        # context would give it
+        db.session.remove()
+
+    return results
+
+
+def summarize(results):
+    summary = {}
+    for route, result in results.items():
+        timings = [t * 1000 for t in result['timings']]
+        if not timings:
+            continue
+        summary[route] = {
+            'requests': len(timings),
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'queries': round(result['queries'] / len(timings), 2),
+            'rows': round(result['rows'] / len(timings), 2),
+        }
+    return summary
+
+
+def report(summary):
+    print(f"\n  {'route':<14} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'queries':>8} {'rows':>9}")
+    for route, row in summary.items():
+        print(f"  {route:<14} {row['requests']:>6} {row['p50_ms']:>9.2f} "
+              f"{row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} "
+              f"{row['queries']:>8.2f} {row['rows']:>9.2f}")
+
+
+def regressions(summary, baseline, tolerance):
+    """Describe each way `summary` is worse than `baseline`."""
+
+    found = []
+    for route, row in summary.items():
+        before = baseline.get(route)
+        if before is None:
+            continue
+
+        for metric in ('p50_ms', 'p95_ms'):
+            if row[metric] > before[metric] * (1 + tolerance):
+                found.append(f"{route}: {metric} {row[metric]} "
+                             f"(baseline {before[metric]})")
+
+        for metric in ('queries', 'rows'):
+            if row[metric] > before[metric] * (1 + COUNT_TOLERANCE) + 0.5:
+                found.append(f"{route}: {metric}/request {row[metric]} "
+                             f"(baseline {before[metric]})")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--messages-per-user', type=float, default=10)
+    parser.add_argument('--follows-per-user', type=float, default=50)
+    parser.add_argument('--likes-per-message', type=float, default=2)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-seed', action='store_true',
+                        help="use the database as it is")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="write the results to --baseline")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    config = {name: getattr(args, name) for name in
+              ('users', 'messages_per_user', 'follows_per_user',
+               'likes_per_message', 'requests', 'seed')}
+
+    if not args.no_seed:
+        seed_database(args)
+
+    rng = random.Random(args.seed)
+    workload = Workload(rng)
+    run(workload, rng, args.warmup)
+    summary = summarize(run(workload, rng, args.requests))
+    report(summary)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'config': config, 'routes': summary}, f, indent=2)
+            f.write('\n')
+        print(f"\nSaved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    if baseline['config'] != config:
+        sys.exit(f"\n{args.baseline} was recorded with {baseline['config']}; "
+                 "rerun with those options, or --save-baseline")
+
+    found = regressions(summary, baseline['routes'], args.tolerance)
+    if found:
+        print("\nRegressions against the baseline:")
+        for regression in found:
+            print(f"  {regression}")
+        sys.exit(1)
+
+    print(f"\nNo regressions against {args.baseline}")
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        main()
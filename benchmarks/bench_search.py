@@ -0,0 +1,172 @@
+"""User search latency at scale.
+
+Run from the project root, against a database of its own:
+
+    createdb warbler-bench
+    python -m benchmarks.bench_search --users 1000000
+
+Fills BENCH_DATABASE_URL (default postgresql:///warbler-bench) with
+synthetic users, if it doesn't have enough already, then times
+search.search_users() over a mix of query kinds and prints p50/p95/p99
+for each, next to the unindexed LIKE '%...%' scan it replaced. Also
+builds the in-process NgramIndex over the first --index-users users and
+times the same queries against it.
+"""
+
+import argparse
+import io
+import os
+import random
+from time import perf_counter
+
+os.environ['DATABASE_URL'] = os.environ.get(
+    'BENCH_DATABASE_URL', 'postgresql:///warbler-bench')
+
+from sqlalchemy import select, text
+
+from app import create_app
+from models import db, User
+from search import NgramIndex, search_users
+
+SYLLABLES = ('ba be bi bo bu da de di do ka ke ki ko la le li lo ma me mi mo '
+             'na ne ni no ra re ri ro sa se si so ta te ti to va ve vi wa '
+             'ya yo za zu').split()
+
+LOAD_BATCH = 100000
+
+
+def fake_word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def fill_users(count, rng):
+    """Add synthetic users until there are `count`."""
+
+    have = User.query.count()
+    if have >= count:
+        return
+
+    print(f"Loading {count - have} users...")
+    places = [fake_word(rng).title() for _ in range(500)]
+
+    # building the GIN index once is far faster than updating it per row
+    [search_index] = [index for index in User.__table__.indexes
+                      if index.name == 'ix_users_search']
+    db.session.commit()
+    search_index.drop(db.engine, checkfirst=True)
+
+    cursor = db.session.connection().connection.cursor()
+    start = perf_counter()
+
+    for first in range(have, count, LOAD_BATCH):
+        rows = io.StringIO()
+        for i in range(first, min(first + LOAD_BATCH, count)):
+            username = f"{fake_word(rng)}_{fake_word(rng)}{i}"
+            bio = ' '.join(fake_word(rng) for _ in range(rng.randint(4, 12)))
+            rows.write(f"{i + 1}\t{username}@example.com\t{username}\t"
+                       f"{rng.choice(places)}\t{bio}\tHASHED_PASSWORD\n")
+        rows.seek(0)
+        cursor.copy_expert("COPY users (id, email, username, location, bio, "
+                           "password) FROM STDIN", rows)
+
+    db.session.execute(text("SELECT setval('users_id_seq', :count)"),
+                       {'count': count})
+    db.session.commit()
+
+    search_index.create(db.engine)
+    db.session.execute(text("ANALYZE users"))
+    db.session.commit()
+
+    print(f"Loaded in {perf_counter() - start:.1f}s")
+
+
+def sample_queries(rng, per_kind):
+    """Queries of each kind, drawn from the users actually loaded."""
+
+    count = User.query.count()
+    sample = db.session.execute(
+        select(User.username, User.location, User.bio)
+        .where(User.id.in_([rng.randint(1, count)
+                            for _ in range(per_kind)]))).all()
+
+    return {
+        'exact username': [row.username for row in sample],
+        'short prefix': [row.username[:2] for row in sample],
+        'word prefix': [row.bio.split()[0][:4] for row in sample],
+        'two words': [f"{row.location} {row.bio.split()[-1]}"
+                      for row in sample],
+        'no match': [f"qx{fake_word(rng)}" for row in sample],
+    }
+
+
+def percentile(timings, pct):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(title, timings_by_kind):
+    print(f"\n{title}")
+    print(f"  {'query kind':<16} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9}")
+
+    for kind, timings in timings_by_kind.items():
+        ms = [t * 1000 for t in timings]
+        print(f"  {kind:<16} {len(ms):>5} {percentile(ms, 50):>9.2f} "
+              f"{percentile(ms, 95):>9.2f} {percentile(ms, 99):>9.2f}")
+
+
+def time_each(queries, run):
+    timings = []
+    for query in queries:
+        run(query)
+        start = perf_counter()
+        run(query)
+        timings.append(perf_counter() - start)
+        db.session.expunge_all()
+    return timings
+
+
+def like_scan(query):
+    return User.query.filter(User.username.like(f"%{query}%")).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=100,
+                        help="queries of each kind")
+    parser.add_argument('--like-queries', type=int, default=5,
+                        help="queries of each kind for the LIKE baseline")
+    parser.add_argument('--index-users', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    db.create_all()
+    fill_users(args.users, rng)
+    queries = sample_queries(rng, args.queries)
+
+    report(f"search_users(), Postgres, {args.users} users",
+           {kind: time_each(qs, search_users)
+            for kind, qs in queries.items()})
+
+    report(f"LIKE '%q%' (before), Postgres, {args.users} users",
+           {kind: time_each(qs[:args.like_queries], like_scan)
+            for kind, qs in queries.items()})
+
+    index = NgramIndex()
+    start = perf_counter()
+    index.load(db.session.execute(
+        select(User.id, User.username, User.location, User.bio)
+        .order_by(User.id).limit(args.index_users)))
+    print(f"\nBuilt NgramIndex over {len(index)} users "
+          f"in {perf_counter() - start:.1f}s")
+
+    report(f"NgramIndex, {len(index)} users",
+           {kind: time_each(qs, index.search)
+            for kind, qs in queries.items()})
+
+
+if __name__ == '__main__':
+    with create_app().app_context():
+        main()
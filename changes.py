@@ -0,0 +1,115 @@
+"""What a session flush changes in Warbler's social graph.
+
+Follows and likes can be written as `Follows`/`Likes` rows or through the
+`User.following`, `User.followers` and `User.likes` relationships. The
+helpers here read all of those from a session's pending state, for hooks
+that keep derived data (timelines, counters) in step with every write.
+
+Call them from `after_flush`: the session still holds the pre-flush
+new/dirty/deleted sets and attribute history, and new rows have ids.
+Caches that may only change once a write is committed register with
+track_committed(), which holds what each flush changed until then.
+"""
+
+from sqlalchemy import event
+
+from models import db, Follows, Likes, Message, User
+
+
+def _collection_changes(session, attr, reverse=False):
+    """(added, removed) (user.id, other.id) pairs from a User relationship."""
+
+    added = set()
+    removed = set()
+
+    for user in session.new | session.dirty:
+        if not isinstance(user, User):
+            continue
+
+        history = getattr(db.inspect(user).attrs, attr).history
+        for other in history.added:
+            added.add((other.id, user.id) if reverse else (user.id, other.id))
+        for other in history.deleted:
+            removed.add((other.id, user.id) if reverse else (user.id, other.id))
+
+    return added, removed
+
+
+def follow_changes(session):
+    """Return (added, removed) sets of (follower_id, followed_id) pairs."""
+
+    added = {(obj.user_following_id, obj.user_being_followed_id)
+             for obj in session.new if isinstance(obj, Follows)}
+    removed = {(obj.user_following_id, obj.user_being_followed_id)
+               for obj in session.deleted if isinstance(obj, Follows)}
+
+    for attr, reverse in (('following', False), ('followers', True)):
+        more_added, more_removed = _collection_changes(session, attr, reverse)
+        added |= more_added
+        removed |= more_removed
+
+    return added - removed, removed - added
+
+
+def like_changes(session):
+    """Return (added, removed) sets of (user_id, message_id) pairs."""
+
+    added = {(obj.user_id, obj.message_id)
+             for obj in session.new if isinstance(obj, Likes)}
+    removed = {(obj.user_id, obj.message_id)
+               for obj in session.deleted if isinstance(obj, Likes)}
+
+    more_added, more_removed = _collection_changes(session, 'likes')
+    added |= more_added
+    removed |= more_removed
+
+    return added - removed, removed - added
+
+
+def new_messages(session):
+    """Return the messages being inserted."""
+
+    return [obj for obj in session.new if isinstance(obj, Message)]
+
+
+def deleted_messages(session):
+    """Return the messages being deleted."""
+
+    return [obj for obj in session.deleted if isinstance(obj, Message)]
+
+
+
+def track_committed(key, collect, apply, pending=set, model=None,
+                    on_bulk=None):
+    """Keep an in-process cache in step with committed writes.
+
+    After each flush, `collect(session, changes)` notes what it changed
+    in `changes`, a `pending()` kept in session.info[key]. Once they're
+    committed, `apply(changes)` makes them; a rollback drops them. A bulk
+    UPDATE or DELETE of `model`'s table can touch any row, so it calls
+    `on_bulk()` instead.
+    """
+
+    @event.listens_for(db.session, 'after_flush')
+    def collect_changes(session, flush_context):
+        collect(session, session.info.setdefault(key, pending()))
+
+    @event.listens_for(db.session, 'after_commit')
+    def apply_changes(session):
+        changes = session.info.pop(key, None)
+        if changes:
+            apply(changes)
+
+    @event.listens_for(db.session, 'after_rollback')
+    def discard_changes(session):
+        session.info.pop(key, None)
+
+    if model is None:
+        return
+
+    @event.listens_for(db.session, 'do_orm_execute')
+    def bulk_write(orm_execute_state):
+        if orm_execute_state.is_update or orm_execute_state.is_delete:
+            table = getattr(orm_execute_state.statement, 'table', None)
+            if getattr(table, 'name', None) == model.__tablename__:
+                on_bulk()
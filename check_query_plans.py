@@ -0,0 +1,167 @@
+"""Fail if any page's queries need a sequential scan.
+
+Run against a seeded database (see seed.py):
+
+    python check_query_plans.py
+
+Logs in as the user who follows the most people, requests each page in
+ROUTES (and the second page of each feed), and EXPLAINs every SELECT they
+ran with sequential scans disabled. Postgres still falls back to a Seq Scan
+when no index can answer a query -- or to walking a whole index whose
+leading column the query doesn't constrain, which is no better -- so either
+showing up in a plan means a route's query shape is missing its index.
+Exits nonzero if so.
+"""
+
+import re
+import sys
+
+from sqlalchemy import event, select, text
+
+from app import create_app, CURR_USER_KEY
+from feeds import home_feed, user_feed
+from models import db, Message, User
+
+ROUTES = (
+    '/',
+    '/?before={home_cursor}',
+    '/users',
+    '/users?q={short_search}',
+    '/users?q={search}',
+    '/users/{user_id}',
+    '/users/{user_id}?before={profile_cursor}',
+    '/users/{user_id}/following',
+    '/users/{user_id}/followers',
+    '/users/{user_id}/likes',
+    '/messages/{message_id}',
+    '/search/messages?q={message_search}',
+)
+
+app = create_app()
+
+LEADING_COLUMN = text("""
+    SELECT attname FROM pg_index
+    JOIN pg_attribute ON attrelid = indrelid AND attnum = indkey[0]
+    WHERE indexrelid = CAST(:index AS regclass)
+""")
+
+
+def route_args():
+    """Pick the user and message to request pages for."""
+
+    user_id, username = db.session.execute(
+        select(User.id, User.username)
+        .order_by(User.following_count.desc()).limit(1)).first()
+    message_id, message_text = db.session.execute(
+        select(Message.id, Message.text)
+        .where(Message.user_id == user_id).limit(1)).first()
+
+    return {
+        'user_id': user_id,
+        'message_id': message_id,
+        'search': username[:5],
+        'short_search': username[:2],
+        'message_search': max(message_text.split(), key=len),
+        'home_cursor': home_feed(user_id).next_cursor or '',
+        'profile_cursor': user_feed(user_id).next_cursor or '',
+    }
+
+
+def capture_queries(client, url):
+    """GET `url` and return the (statement, parameters) it executed."""
+
+    queries = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        queries.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        resp = client.get(url)
+        # feeds are streamed: their queries run as the body is read
+        resp.get_data()
+        resp.close()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    if resp.status_code != 200:
+        sys.exit(f"{url}: got {resp.status_code}")
+
+    return queries
+
+
+def explain(conn, statement, parameters):
+    """Return the plan Postgres would use for this statement, as text."""
+
+    return "\n".join(conn.exec_driver_sql(f"EXPLAIN {statement}",
+                                          parameters).scalars())
+
+
+def full_scans(conn, statement, parameters):
+    """Return the plan nodes that read a whole table or index."""
+
+    [[plan]] = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}",
+                                    parameters).all()
+
+    found = []
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.get('Plans', ()))
+
+        if node['Node Type'] == 'Seq Scan':
+            found.append(node)
+
+        elif 'Index Name' in node:
+            leading = conn.execute(LEADING_COLUMN,
+                                   {'index': node['Index Name']}).scalar()
+            cond = node.get('Index Cond')
+
+            if leading is None:
+                # an expression index (search.py's); Postgres only picks
+                # those when the query contains the same expression
+                pass
+            elif cond is None:
+                # an ordered walk is fine; filtering the whole index isn't
+                if 'Filter' in node:
+                    found.append(node)
+            elif not re.search(rf'\b{leading}\b', cond):
+                found.append(node)
+
+    return found
+
+
+def main():
+    if not User.query.first():
+        sys.exit("No users: seed the database first")
+    args = route_args()
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess[CURR_USER_KEY] = args['user_id']
+
+    failed = False
+
+    with db.engine.connect() as conn:
+        conn.exec_driver_sql("SET enable_seqscan = off")
+
+        for route in ROUTES:
+            url = route.format(**args)
+
+            for statement, parameters in capture_queries(client, url):
+                if not statement.lstrip().upper().startswith('SELECT'):
+                    continue
+
+                if full_scans(conn, statement, parameters):
+                    failed = True
+                    print(f"{url}: full scan in\n{statement}\n")
+                    print(explain(conn, statement, parameters), end="\n\n")
+
+            print(f"{url}: checked")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        sys.exit(main())
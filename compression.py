@@ -0,0 +1,258 @@
+"""Compressing responses: gzip, and brotli and zstd when installed.
+
+Feed pages of a hundred message cards went out as they were rendered,
+tens of kilobytes of repetitive HTML each. CompressionMiddleware wraps
+the WSGI app and compresses a response with the best encoding the
+client's Accept-Encoding and this server share -- zstd, then brotli,
+then gzip. zstandard and brotli are in requirements.txt; without them
+installed, only gzip is offered.
+
+A response is sent as it is if
+
+- it already has a Content-Encoding (like static files served from
+  their precompressed copies, see assets.py),
+- its Content-Type isn't in COMPRESSION_MIMETYPES (images and fonts are
+  compressed already),
+- it's smaller than COMPRESSION_MIN_SIZE bytes, where the encoding's
+  framing and the CPU cost outweigh the bytes saved,
+- or it has no body to compress: a HEAD request, a 204 or 304, a range.
+
+Responses are compressed as they're sent, chunk by chunk, each chunk
+flushed through the compressor, so a streamed page still reaches the
+client as it's rendered and a large one is never held whole in memory.
+A response whose length isn't known is buffered only until it reaches
+COMPRESSION_MIN_SIZE. Compressed responses lose their Content-Length
+and their ETag is made weak, since the bytes differ from what it names.
+
+benchmarks/bench_compression.py measures what each encoding costs and
+saves on feed pages.
+"""
+
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_MIN_SIZE = 1024
+
+COMPRESSION_MIMETYPES = (
+    'text/html', 'text/css', 'text/plain', 'text/xml', 'text/javascript',
+    'application/javascript', 'application/json', 'application/xml',
+    'image/svg+xml',
+)
+
+# the speed/size trade-off for compressing on the fly, not ahead of time
+COMPRESSION_LEVELS = {'zstd': 3, 'br': 4, 'gzip': 6}
+
+
+class GzipEncoder:
+    name = 'gzip'
+
+    def __init__(self, level):
+        # wbits 31: a gzip header and trailer around the deflate stream
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return (self.compressor.compress(data)
+                + self.compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliEncoder:
+    name = 'br'
+
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdEncoder:
+    name = 'zstd'
+
+    def __init__(self, level):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return (self.compressor.compress(data) + self.compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK))
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+def available_encoders():
+    """The encoders this server can use, best first."""
+
+    encoders = []
+    if zstandard is not None:
+        encoders.append(ZstdEncoder)
+    if brotli is not None:
+        encoders.append(BrotliEncoder)
+    encoders.append(GzipEncoder)
+    return encoders
+
+
+class CompressionMiddleware:
+    """Compress `app`'s responses for clients that accept it."""
+
+    def __init__(self, app, min_size=COMPRESSION_MIN_SIZE,
+                 mimetypes=COMPRESSION_MIMETYPES, levels=None,
+                 encoders=None):
+        self.app = app
+        self.min_size = min_size
+        self.mimetypes = frozenset(mimetypes)
+        self.levels = {**COMPRESSION_LEVELS, **(levels or {})}
+        self.encoders = {encoder.name: encoder for encoder in
+                         (encoders or available_encoders())}
+
+    def negotiate(self, environ):
+        """The encoder for the client's Accept-Encoding, or None."""
+
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return None
+        accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING'))
+        name = accept.best_match(self.encoders)
+        return self.encoders[name] if name else None
+
+    def compressible(self, status, headers):
+        """Whether a response may be compressed, going by its head."""
+
+        code = int(status.split(None, 1)[0])
+        if code < 200 or code in (204, 206, 304):
+            return False
+        if 'Content-Encoding' in headers or 'Content-Range' in headers:
+            return False
+        if 'no-transform' in headers.get('Cache-Control', ''):
+            return False
+
+        if mimetype(headers) not in self.mimetypes:
+            return False
+
+        length = headers.get('Content-Length', type=int)
+        return length is None or length >= self.min_size
+
+    def pass_on(self, start_response, status, headers, exc_info=None):
+        """Start a response that's sent as it is.
+
+        It still varies by Accept-Encoding if it's a type that's
+        compressed for other clients, so a shared cache doesn't hand this
+        copy to them, or a compressed one to this client.
+        """
+
+        if mimetype(headers) in self.mimetypes:
+            vary(headers)
+        return start_response(status, headers.to_wsgi_list(), exc_info)
+
+    def __call__(self, environ, start_response):
+        encoder = self.negotiate(environ)
+        if encoder is None:
+            def uncompressed(status, headers, exc_info=None):
+                return self.pass_on(start_response, status, Headers(headers),
+                                    exc_info)
+            return self.app(environ, uncompressed)
+
+        response = {}
+
+        def capture(status, headers, exc_info=None):
+            headers = Headers(headers)
+            if self.compressible(status, headers):
+                response['head'] = (status, headers, exc_info)
+            else:
+                response['passed'] = True
+                return self.pass_on(start_response, status, headers,
+                                    exc_info)
+
+            def write(data):
+                raise RuntimeError("write() isn't supported when compressing")
+            return write
+
+        body = self.app(environ, capture)
+        if response.get('passed'):
+            return body
+        return self.compress(body, response, encoder, start_response)
+
+    def compress(self, body, response, encoder, start_response):
+        """Yield `body` compressed by `encoder`, if it's big enough."""
+
+        try:
+            buffered = []
+            size = 0
+            chunks = iter(body)
+            for chunk in chunks:
+                if response.get('passed'):
+                    # the app called start_response() late, and the
+                    # response isn't one to compress
+                    yield chunk
+                    yield from chunks
+                    return
+                if chunk:
+                    buffered.append(chunk)
+                    size += len(chunk)
+                if size >= self.min_size:
+                    break
+
+            status, headers, exc_info = response['head']
+            vary(headers)
+            if size < self.min_size:
+                start_response(status, headers.to_wsgi_list(), exc_info)
+                yield b''.join(buffered)
+                return
+
+            headers['Content-Encoding'] = encoder.name
+            headers.pop('Content-Length', None)
+            etag = headers.get('ETag')
+            if etag and not etag.startswith('W/'):
+                headers['ETag'] = 'W/' + etag
+            start_response(status, headers.to_wsgi_list(), exc_info)
+
+            encoding = encoder(self.levels[encoder.name])
+            yield encoding.compress(b''.join(buffered))
+            for chunk in chunks:
+                if chunk:
+                    yield encoding.compress(chunk)
+            yield encoding.finish()
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+
+def mimetype(headers):
+    return headers.get('Content-Type', '').split(';')[0].strip().lower()
+
+
+def vary(headers):
+    """Note that the response depends on the client's Accept-Encoding."""
+
+    values = [value.strip() for value in headers.get('Vary', '').split(',')
+              if value.strip()]
+    if 'accept-encoding' not in (value.lower() for value in values):
+        headers['Vary'] = ', '.join(values + ['Accept-Encoding'])
+
+
+def init_compression(app):
+    app.config.setdefault('COMPRESSION_MIN_SIZE', COMPRESSION_MIN_SIZE)
+    app.config.setdefault('COMPRESSION_MIMETYPES', COMPRESSION_MIMETYPES)
+    app.config.setdefault('COMPRESSION_LEVELS', COMPRESSION_LEVELS)
+
+    app.wsgi_app = CompressionMiddleware(
+        app.wsgi_app,
+        min_size=app.config['COMPRESSION_MIN_SIZE'],
+        mimetypes=app.config['COMPRESSION_MIMETYPES'],
+        levels=app.config['COMPRESSION_LEVELS'])
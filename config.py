@@ -0,0 +1,152 @@
+"""Configuration profiles for create_app() (see app.py).
+
+    create_app('production')
+
+picks a profile by name; with no name, WARBLER_CONFIG picks it, and
+'development' if that isn't set. Values that differ between deployments
+-- the database and its connection pool (see pool.py), the secret key and
+the /metrics token -- come from the environment.
+"""
+
+import os
+
+from pool import engine_options
+
+
+class Config:
+    """Settings every profile shares."""
+
+    DATABASE_URL_VARIABLE = 'DATABASE_URL'
+    DEFAULT_DATABASE_URL = 'postgresql:///warbler'
+    REPLICA_URLS_VARIABLE = 'DATABASE_REPLICA_URLS'
+
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ECHO = False
+
+    DEBUG_TB_INTERCEPT_REDIRECTS = False
+
+    # queries slower than this many milliseconds are logged
+    SLOW_QUERY_MS = 100
+
+    # after a POST, a user reads from the primary for this long
+    REPLICA_STICKY_SECONDS = 10
+
+    # bcrypt's cost, and the processes hashing with it (see passwords.py)
+    BCRYPT_LOG_ROUNDS = 12
+    PASSWORD_HASH_WORKERS = 2
+
+    # where login rate limits are kept -- 'memory', per worker, or
+    # 'database', shared -- and how many logins they let through at once,
+    # then one per how many seconds (see auth.py and ratelimit.py)
+    RATE_LIMIT_BACKEND = 'memory'
+    LOGIN_USERNAME_BURST = 5
+    LOGIN_USERNAME_INTERVAL = 12
+    LOGIN_IP_BURST = 20
+    LOGIN_IP_INTERVAL = 3
+
+    # proxies in front of the app, each adding to X-Forwarded-For: the
+    # client's address, which logins are limited by, is that many hops
+    # back (see create_app)
+    TRUSTED_PROXIES = 0
+
+    # rendered message and user cards kept per worker (see fragments.py)
+    FRAGMENT_CACHE_SIZE = 20000
+
+    # streamed feed pages go out in chunks of about this many characters,
+    # besides where templates flush() (see streaming.py)
+    STREAM_CHUNK_SIZE = 16 * 1024
+
+    # responses smaller than this many bytes are sent uncompressed (see
+    # compression.py)
+    COMPRESSION_MIN_SIZE = 1024
+
+    # /metrics answers only a scraper sending this as a bearer token, and
+    # no one while it isn't set
+    METRICS_TOKEN = None
+
+    def __init__(self):
+        # read when the app is made, not when this module is imported
+        self.SQLALCHEMY_DATABASE_URI = os.environ.get(
+            self.DATABASE_URL_VARIABLE, self.DEFAULT_DATABASE_URL)
+        # pool sizes, timeouts and PgBouncer mode: see pool.py
+        self.SQLALCHEMY_ENGINE_OPTIONS = engine_options(
+            self.SQLALCHEMY_DATABASE_URI)
+        # read-only pages read from these (see replicas.py)
+        self.SQLALCHEMY_REPLICA_URIS = [
+            url.strip() for url in
+            os.environ.get(self.REPLICA_URLS_VARIABLE, '').split(',')
+            if url.strip()]
+        self.SECRET_KEY = os.environ.get('SECRET_KEY', "it's a secret")
+        self.SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS',
+                                                self.SLOW_QUERY_MS))
+        self.BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS',
+                                                    self.BCRYPT_LOG_ROUNDS))
+        self.PASSWORD_HASH_WORKERS = int(os.environ.get(
+            'PASSWORD_HASH_WORKERS', self.PASSWORD_HASH_WORKERS))
+        self.RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND',
+                                                 self.RATE_LIMIT_BACKEND)
+        self.TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES',
+                                                  self.TRUSTED_PROXIES))
+        self.METRICS_TOKEN = os.environ.get('METRICS_TOKEN',
+                                            self.METRICS_TOKEN)
+
+
+class DevelopmentConfig(Config):
+    """For running locally: loads the debug toolbar, which shows itself
+    when FLASK_DEBUG is on."""
+
+
+class TestConfig(Config):
+    """For the test suite: its own database, and no CSRF tokens to fake."""
+
+    DATABASE_URL_VARIABLE = 'TEST_DATABASE_URL'
+    DEFAULT_DATABASE_URL = 'postgresql:///warbler-test'
+    REPLICA_URLS_VARIABLE = 'TEST_DATABASE_REPLICA_URLS'
+
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    DEBUG_TB_ENABLED = False
+
+    METRICS_TOKEN = 'test-metrics-token'
+
+    # the cheapest bcrypt allows, hashed inline
+    BCRYPT_LOG_ROUNDS = 4
+    PASSWORD_HASH_WORKERS = 0
+
+
+class ProductionConfig(Config):
+    """For the app servers: no toolbar, and templates are never reloaded."""
+
+    # the toolbar wraps every request, so it isn't even imported
+    DEBUG_TB_ENABLED = False
+    TEMPLATES_AUTO_RELOAD = False
+
+    # every worker counts against the same limits
+    RATE_LIMIT_BACKEND = 'database'
+
+    def __init__(self):
+        super().__init__()
+        if 'SECRET_KEY' not in os.environ:
+            raise RuntimeError("SECRET_KEY must be set in production")
+        # pids repeat across servers, and message ids would with them
+        # (see snowflake.py)
+        if 'WARBLER_WORKER_ID' not in os.environ:
+            raise RuntimeError("WARBLER_WORKER_ID must be set in production")
+
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'test': TestConfig,
+    'production': ProductionConfig,
+}
+
+
+def load_config(name=None):
+    """The profile called `name`, or WARBLER_CONFIG's."""
+
+    name = name or os.environ.get('WARBLER_CONFIG', 'development')
+    try:
+        return CONFIGS[name]()
+    except KeyError:
+        raise ValueError(f"No config profile {name!r}; "
+                         f"pick one of {', '.join(CONFIGS)}") from None
@@ -0,0 +1,139 @@
+"""Denormalized per-user counts of messages, followers, following and likes.
+
+Profile headers show all four, and counting the relationships loads every
+related row into the session. Instead `User` carries counter columns that
+are adjusted in the same transaction as the write that changes them, from
+session hooks (like timelines.py) so every ORM write path is covered.
+
+`reconcile_counters()` recomputes them from scratch, for bulk loads that
+skip the session and for repairing drift: `flask reconcile-counters`.
+"""
+
+from collections import Counter, defaultdict
+
+from sqlalchemy import event, func, or_, select, update
+
+from changes import deleted_messages, follow_changes, like_changes, new_messages
+from models import db, Follows, Likes, Message, User
+
+COUNTERS = ('messages_count', 'followers_count', 'following_count',
+            'likes_count')
+
+users = User.__table__
+
+
+def apply_deltas(conn, deltas):
+    """Add {user_id: {counter: delta}} to users' counter columns."""
+
+    # a stable order keeps concurrent transactions from deadlocking
+    for user_id in sorted(deltas):
+        values = {counter: users.c[counter] + delta
+                  for counter, delta in deltas[user_id].items() if delta}
+
+        if values:
+            conn.execute(
+                update(users).where(users.c.id == user_id).values(values))
+
+
+def reconcile_counters():
+    """Recompute every user's counters from the rows they count."""
+
+    def count(table, column):
+        return (select(func.count())
+                .select_from(table)
+                .where(column == users.c.id)
+                .scalar_subquery())
+
+    db.session.execute(update(users).values(
+        messages_count=count(Message.__table__, Message.user_id),
+        followers_count=count(Follows.__table__,
+                              Follows.user_being_followed_id),
+        following_count=count(Follows.__table__, Follows.user_following_id),
+        likes_count=count(Likes.__table__, Likes.user_id),
+    ))
+
+
+@event.listens_for(db.session, 'before_flush')
+def uncount_cascades(session, flush_context, instances):
+    """Take back counts for rows the database is about to cascade away.
+
+    Deleting a message drops its likes, and deleting a user drops their
+    follows and messages, inside the database rather than the session, so
+    those counts have to be adjusted while the rows are still there.
+    """
+
+    message_ids = [obj.id for obj in session.deleted
+                   if isinstance(obj, Message)]
+    user_ids = [obj.id for obj in session.deleted if isinstance(obj, User)]
+
+    if not (message_ids or user_ids):
+        return
+
+    conn = session.connection()
+
+    for user_id in user_ids:
+        followed = (select(Follows.user_being_followed_id)
+                    .where(Follows.user_following_id == user_id))
+        conn.execute(update(users)
+                     .where(users.c.id.in_(followed))
+                     .values(followers_count=users.c.followers_count - 1))
+
+        followers = (select(Follows.user_following_id)
+                     .where(Follows.user_being_followed_id == user_id))
+        conn.execute(update(users)
+                     .where(users.c.id.in_(followers))
+                     .values(following_count=users.c.following_count - 1))
+
+    doomed = select(Message.id).where(or_(Message.id.in_(message_ids),
+                                          Message.user_id.in_(user_ids)))
+    lost = (select(func.count())
+            .select_from(Likes)
+            .where(Likes.user_id == users.c.id, Likes.message_id.in_(doomed))
+            .scalar_subquery())
+    likers = select(Likes.user_id).where(Likes.message_id.in_(doomed))
+
+    conn.execute(update(users)
+                 .where(users.c.id.in_(likers))
+                 .values(likes_count=users.c.likes_count - lost))
+
+
+@event.listens_for(db.session, 'after_flush')
+def update_counters(session, flush_context):
+    """Apply this flush's messages, follows and likes to users' counters."""
+
+    deltas = defaultdict(Counter)
+
+    for msg in new_messages(session):
+        deltas[msg.user_id]['messages_count'] += 1
+    for msg in deleted_messages(session):
+        deltas[msg.user_id]['messages_count'] -= 1
+
+    added, removed = follow_changes(session)
+    for follower_id, followed_id in added:
+        deltas[follower_id]['following_count'] += 1
+        deltas[followed_id]['followers_count'] += 1
+    for follower_id, followed_id in removed:
+        deltas[follower_id]['following_count'] -= 1
+        deltas[followed_id]['followers_count'] -= 1
+
+    added, removed = like_changes(session)
+    for user_id, message_id in added:
+        deltas[user_id]['likes_count'] += 1
+    for user_id, message_id in removed:
+        deltas[user_id]['likes_count'] -= 1
+
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+        session.info.setdefault('recounted', set()).update(deltas)
+
+
+@event.listens_for(db.session, 'after_flush_postexec')
+def expire_counters(session, flush_context):
+    """Make loaded users re-read counters that were changed in SQL."""
+
+    recounted = session.info.pop('recounted', set())
+
+    for obj in list(session.identity_map.values()):
+        # identity rather than .id, which would reload expired instances
+        if isinstance(obj, User) and db.inspect(obj).identity[0] in recounted:
+            session.expire(obj, COUNTERS)
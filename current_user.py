@@ -0,0 +1,148 @@
+"""The logged-in user, served from a cache instead of a query per request.
+
+`add_user_to_g()` used to load the whole `User` row on every request. Now
+it puts a `CurrentUser` on `g`: the columns templates and routes read
+(id, username, pictures, bio, location, counters) come from a snapshot
+held in a bounded LRU for `USER_CACHE_TTL` seconds, and the ORM row is
+only loaded -- through `g.user.model` -- by routes that change the user.
+
+profile() and delete_user() forget the snapshot they've made stale, and a
+session hook does the same for any committed transaction that touched a
+user's row or counters, so this process never serves a snapshot older than
+its own writes. Other processes' writes show up within the TTL; if one of
+them deleted the user, the first read of `g.user.model` finds no row,
+forgets the snapshot and raises `UserGone`, which app.py answers by logging
+the user out.
+"""
+
+from sqlalchemy import select
+
+from cache import LRUCache
+from changes import (deleted_messages, follow_changes, like_changes,
+                     new_messages, track_committed)
+from models import db, Memberships, User
+
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 60
+
+SNAPSHOT_COLUMNS = (
+    User.id,
+    User.username,
+    User.image_url,
+    User.header_image_url,
+    User.bio,
+    User.location,
+    User.messages_count,
+    User.followers_count,
+    User.following_count,
+    User.likes_count,
+    User.profile_version,
+)
+
+SNAPSHOT_FIELDS = frozenset(column.key for column in SNAPSHOT_COLUMNS)
+
+user_cache = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+class UserGone(Exception):
+    """The logged-in user's row was deleted behind a cached snapshot."""
+
+
+def load_snapshot(user_id):
+    """Return a read-only row of the user's cached columns, or None."""
+
+    snapshot = user_cache.get(user_id)
+
+    if snapshot is None:
+        snapshot = db.session.execute(
+            select(*SNAPSHOT_COLUMNS).where(User.id == user_id)).first()
+
+        if snapshot is not None:
+            user_cache.set(user_id, snapshot)
+
+    return snapshot
+
+
+def forget_user(user_id):
+    """Drop a user's snapshot so the next request reloads it."""
+
+    user_cache.pop(user_id)
+
+
+class CurrentUser(Memberships):
+    """The logged-in user for one request.
+
+    Reads of snapshot columns and membership checks never load the user's
+    row. Anything else (email, relationships, ...) is passed through to
+    `model`, the ORM `User`, loaded on first use; once it's loaded every
+    read goes to it, so a route sees its own changes.
+    """
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+        self._model = None
+
+    @property
+    def model(self):
+        """The ORM User, for routes that change or delete the user."""
+
+        if self._model is None:
+            self._model = db.session.get(User, self._snapshot.id)
+            if self._model is None:
+                forget_user(self._snapshot.id)
+                raise UserGone(self._snapshot.id)
+        return self._model
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._model is None and name in SNAPSHOT_FIELDS:
+            return getattr(self._snapshot, name)
+        return getattr(self.model, name)
+
+    def __setattr__(self, name, value):
+        if not name.startswith('_'):
+            raise AttributeError(
+                f"g.user is read-only; set {name!r} on g.user.model")
+        super().__setattr__(name, value)
+
+    def __eq__(self, other):
+        return isinstance(other, (CurrentUser, User)) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"<CurrentUser #{self.id}: {self.username}>"
+
+    def _membership(self, name, query):
+        if self._model is not None:
+            return self._model._membership(name, query)
+        return super()._membership(name, query)
+
+
+def collect_stale_users(session, stale):
+    """Note which users' snapshots this flush makes stale."""
+
+    stale.update(obj.id for obj in session.dirty | session.deleted
+                 if isinstance(obj, User))
+    stale.update(msg.user_id for msg in new_messages(session))
+    stale.update(msg.user_id for msg in deleted_messages(session))
+
+    followed, unfollowed = follow_changes(session)
+    for follower_id, followed_id in followed | unfollowed:
+        stale.update((follower_id, followed_id))
+
+    liked, unliked = like_changes(session)
+    stale.update(user_id for user_id, message_id in liked | unliked)
+
+
+def forget_stale_users(stale):
+    """Once the writes are visible, drop the snapshots they changed."""
+
+    for user_id in stale:
+        forget_user(user_id)
+
+
+track_committed('stale_users', collect_stale_users, forget_stale_users,
+                model=User, on_bulk=user_cache.clear)
@@ -0,0 +1,80 @@
+"""Feed queries: the message lists behind the home, profile and likes pages,
+and the user lists behind the follow pages.
+
+Every message card shows its author's id, username and picture, and is
+cached under the author's profile_version (see fragments.py), so each
+feed joins the author in, loading just those columns, rather than letting
+the template lazily load `msg.user` once per distinct author. A page of
+any length is then a single query. With stream=True it's a StreamedPage,
+read as it's rendered (see streaming.py).
+"""
+
+from sqlalchemy.orm import joinedload, load_only
+
+from models import Follows, Likes, Message, Timeline, User
+from pagination import PAGE_SIZE, paginate, paginate_messages, paginate_users
+
+
+def feed_query():
+    """Messages with just the columns cards use, authors joined in."""
+
+    return Message.query.options(
+        load_only(Message.id, Message.text, Message.timestamp,
+                  Message.user_id),
+        joinedload(Message.user).load_only(User.id, User.username,
+                                           User.image_url,
+                                           User.profile_version),
+    )
+
+
+def home_feed(user_id, before=None, size=PAGE_SIZE, stream=False):
+    """Return a Page of the messages on this user's home timeline.
+
+    Reads the fanned-out timeline (see timelines.py). Message ids are
+    time-ordered, so the page comes straight off the timeline's
+    (user_id, message_id) primary key.
+    """
+
+    query = (feed_query()
+             .join(Timeline, Timeline.message_id == Message.id)
+             .filter(Timeline.user_id == user_id))
+
+    return paginate(query, (Timeline.message_id,), lambda msg: (msg.id,),
+                    before, size, stream)
+
+
+def user_feed(user_id, before=None, size=PAGE_SIZE):
+    """Return a Page of the messages this user has posted."""
+
+    return paginate_messages(
+        feed_query().filter(Message.user_id == user_id), before, size)
+
+
+def liked_feed(user_id, before=None, size=PAGE_SIZE, stream=False):
+    """Return a Page of the messages this user has liked."""
+
+    return paginate_messages(
+        feed_query()
+        .join(Likes, Likes.message_id == Message.id)
+        .filter(Likes.user_id == user_id),
+        before, size, stream)
+
+
+def following_list(user_id, before=None, size=PAGE_SIZE):
+    """Return a Page of the users this user follows."""
+
+    return paginate_users(
+        User.query
+        .join(Follows, Follows.user_being_followed_id == User.id)
+        .filter(Follows.user_following_id == user_id),
+        before, size)
+
+
+def followers_list(user_id, before=None, size=PAGE_SIZE):
+    """Return a Page of the users following this user."""
+
+    return paginate_users(
+        User.query
+        .join(Follows, Follows.user_following_id == User.id)
+        .filter(Follows.user_being_followed_id == user_id),
+        before, size)
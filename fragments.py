@@ -0,0 +1,93 @@
+"""Message and user cards, rendered once and reused by every page.
+
+Feeds and user lists render the same cards over and over, for every
+viewer. message_card() and user_card() render a card's template the first
+time and keep the HTML in the app's bounded LRU (FRAGMENT_CACHE_SIZE
+cards), keyed by the message or user id; after that a page is mostly
+these strings joined together.
+
+Each entry records the profile_version of the user it shows (see
+models.py), which goes up whenever anything a card shows changes; a card
+cached at another version is rendered afresh. So a change made in any
+worker shows in every other one as soon as it loads the user again.
+profile(), messages_destroy() and delete_user() forget the cards they
+make stale, to free their room in this one.
+
+Parts that depend on the viewer -- the like and follow buttons -- aren't
+cached. A card template marks where they go with {{ slot }}, and pages
+fill it in:
+
+    {% call message_card(msg) %}
+      <form>...</form>
+    {% endcall %}
+"""
+
+from flask import current_app
+from markupsafe import Markup
+
+from cache import LRUCache
+
+FRAGMENT_CACHE_SIZE = 20000
+
+# where the viewer's part goes, while a card is rendered for the cache
+SLOT = '<!-- slot -->'
+
+
+def fragments():
+    """The current app's cache of cards."""
+
+    return current_app.extensions['fragments']
+
+
+def render_card(kind, key, version, template, **context):
+    """The (head, tail) of a card, either side of its slot."""
+
+    cached = fragments().get((kind, key))
+
+    if cached is None or cached[0] != version:
+        html = current_app.jinja_env.get_template(template).render(
+            slot=Markup(SLOT), **context)
+        head, tail = html.split(SLOT)
+        cached = (version, Markup(head), Markup(tail))
+        fragments().set((kind, key), cached)
+
+    return cached[1], cached[2]
+
+
+def message_card(message, caller=None):
+    """A message's list item, with the caller's content in its slot."""
+
+    head, tail = render_card('message', message.id,
+                             message.user.profile_version,
+                             'messages/card.html', message=message)
+    return head + (caller() if caller else '') + tail
+
+
+def user_card(user, caller=None):
+    """A user's card, with the caller's content in its slot."""
+
+    head, tail = render_card('user', user.id, user.profile_version,
+                             'users/card.html', user=user)
+    return head + (caller() if caller else '') + tail
+
+
+def forget_message_card(message_id):
+    """Drop a message's cached card."""
+
+    fragments().pop(('message', message_id))
+
+
+def forget_user_card(user_id):
+    """Drop a user's cached card; their messages' cards go stale by
+    version, and are rendered again when next shown."""
+
+    fragments().pop(('user', user_id))
+
+
+def init_fragments(app):
+    app.config.setdefault('FRAGMENT_CACHE_SIZE', FRAGMENT_CACHE_SIZE)
+
+    app.extensions['fragments'] = LRUCache(
+        maxsize=app.config['FRAGMENT_CACHE_SIZE'])
+    app.add_template_global(message_card)
+    app.add_template_global(user_card)
@@ -2,29 +2,45 @@
 
 Students won't need to run this for the exercise; they will just use the CSV
 files that this generates. You should only need to run this if you wanted to
-tweak the CSV formats or generate fewer/more rows.
+tweak the CSV formats or generate fewer/more rows -- say, for load testing:
+
+    python generator/create_csvs.py --users 1000000 --messages-per-user 10 \\
+        --follows-per-user 100 --out /tmp/warbler-data --chunk-rows 1000000
+
+Everything is streamed to disk as it's generated, so memory use doesn't grow
+with the number of rows. The same --seed (with the same Faker version) gives
+the same files, and nothing is fetched over the network.
+
+Writes users.csv, messages.csv, follows.csv and likes.csv. A user's id is
+their row number in users.csv, counting from 1; likes.csv refers to messages
+the same way, by row number in messages.csv (message ids are made from the
+timestamps when seeding). Messages are written oldest first.
+
+Followers and activity are skewed like a real network's: who gets followed,
+who posts and who likes are each drawn from a power law (--skew), so a few
+users have most of the followers and most of the messages.
 """
 
-import csv
-from random import choice, randint, sample
-from itertools import permutations
-import requests
+import argparse
+import os
+from datetime import datetime, timedelta
+from random import Random
+
 from faker import Faker
-from helpers import get_random_datetime
+
+from helpers import ChunkedWriter, Shuffle, geometric, power_law_rank
 
 MAX_WARBLER_LENGTH = 140
 
 USERS_CSV_HEADERS = ['email', 'username', 'image_url', 'password', 'bio', 'header_image_url', 'location']
 MESSAGES_CSV_HEADERS = ['text', 'timestamp', 'user_id']
 FOLLOWS_CSV_HEADERS = ['user_being_followed_id', 'user_following_id']
+LIKES_CSV_HEADERS = ['user_id', 'message_row']
 
-NUM_USERS = 300
-NUM_MESSAGES = 1000
-NUM_FOLLWERS = 5000
-
-fake = Faker()
+PASSWORD = '$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe'
 
-# Generate random profile image URLs to use for users
+# Faker is slow for millions of rows, so draw from pools of its output
+POOL_SIZE = 2000
 
 image_urls = [
     f"https://randomuser.me/api/portraits/{kind}/{i}.jpg"
@@ -32,46 +48,169 @@ image_urls = [
     for i in range(count)
 ]
 
-# Generate random header image URLs to use for users
-
+# collected from splashbase once, rather than asked for on every run
 header_image_urls = [
-    requests.get(f"http://www.splashbase.co/api/v1/images/{i}").json()['url']
-    for i in range(1, 46)
+    f"https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_{key}_1280.jpg"
+    for key in """
+        mnh0n9pHJW1st5lhmo1 mnh0uemhCk1st5lhmo1 mnh121HEWa1st5lhmo1
+        mnh17lfd9R1st5lhmo1 mnh1d7s3UD1st5lhmo1 mnh1jdFvHR1st5lhmo1
+        mnh1uhYnog1st5lhmo1 mnh25vNOvI1st5lhmo1 mnh29fxz111st5lhmo1
+        mnh2m1hnS81st5lhmo1 mo1h6tGOZf1st5lhmo1 mo2wz2LTCs1st5lhmo1
+        mo2x3aAnRH1st5lhmo1 mo2x80NkDu1st5lhmo1 mo2x9xqeef1st5lhmo1
+        mo2xbk8JUK1st5lhmo1 mo2xdqmle51st5lhmo1 mo2xfarCvW1st5lhmo1
+        mo2xgqdEFn1st5lhmo1 mo2xijE2nr1st5lhmo1 mopq4kHmAg1st5lhmo1
+        mopq69jlcS1st5lhmo1 mopq8fyQwI1st5lhmo1 mopqamedKu1st5lhmo1
+        mopqc3ZZcz1st5lhmo1 mopqdfx05t1st5lhmo1 mopqfpSTPN1st5lhmo1
+        mopqhxFulr1st5lhmo1 mopqj9QUeq1st5lhmo1 mopqkkwK2M1st5lhmo1
+        mp6rzyNlAN1st5lhmo1 mp6s1hAudo1st5lhmo1 mp6s32zb6l1st5lhmo1
+        mp6s4dzqHA1st5lhmo1 mp6s661UgK1st5lhmo1 mp6s7lR1lS1st5lhmo1
+        mp6s995bvI1st5lhmo1 mp6sasSvPZ1st5lhmo1 mp6scv2xrZ1st5lhmo1
+        mpp6f50W261st5lhmo1 mpp6gwrYvm1st5lhmo1 mpp6l06zXi1st5lhmo1
+        mpp6poZxE51st5lhmo1 mpp6tjdFhf1st5lhmo1 mpp6w0dxAm1st5lhmo1
+    """.split()
 ]
 
-with open('generator/users.csv', 'w') as users_csv:
-    users_writer = csv.DictWriter(users_csv, fieldnames=USERS_CSV_HEADERS)
-    users_writer.writeheader()
-
-    for i in range(NUM_USERS):
-        users_writer.writerow(dict(
-            email=fake.email(),
-            username=fake.user_name(),
-            image_url=choice(image_urls),
-            password='$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe',
-            bio=fake.sentence(),
-            header_image_url=choice(header_image_urls),
-            location=fake.city()
-        ))
-
-with open('generator/messages.csv', 'w') as messages_csv:
-    messages_writer = csv.DictWriter(messages_csv, fieldnames=MESSAGES_CSV_HEADERS)
-    messages_writer.writeheader()
-
-    for i in range(NUM_MESSAGES):
-        messages_writer.writerow(dict(
-            text=fake.paragraph()[:MAX_WARBLER_LENGTH],
-            timestamp=get_random_datetime(),
-            user_id=randint(1, NUM_USERS)
-        ))
-
-# Generate follows.csv from random pairings of users
-
-with open('generator/follows.csv', 'w') as follows_csv:
-    all_pairs = list(permutations(range(1, NUM_USERS + 1), 2))
-
-    users_writer = csv.DictWriter(follows_csv, fieldnames=FOLLOWS_CSV_HEADERS)
-    users_writer.writeheader()
-
-    for followed_user, follower in sample(all_pairs, NUM_FOLLWERS):
-        users_writer.writerow(dict(user_being_followed_id=followed_user, user_following_id=follower))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--messages-per-user', type=float, default=3.33,
+                        help="average messages posted per user")
+    parser.add_argument('--follows-per-user', type=float, default=16.67,
+                        help="average users each user follows")
+    parser.add_argument('--likes-per-message', type=float, default=2.0,
+                        help="average likes each message gets")
+    parser.add_argument('--skew', type=float, default=1.0,
+                        help="power-law exponent for popularity and activity")
+    parser.add_argument('--end', type=datetime.fromisoformat,
+                        default=datetime(2018, 1, 1),
+                        help="messages are posted before this time")
+    parser.add_argument('--days', type=int, default=730,
+                        help="messages are posted over this many days")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=os.path.dirname(__file__) or '.',
+                        help="directory to write the CSVs to")
+    parser.add_argument('--chunk-rows', type=int, default=0,
+                        help="split each CSV into files of this many rows")
+    return parser.parse_args()
+
+
+def make_pools(fake):
+    """Faker output to draw users' and messages' fields from."""
+
+    return {
+        'username': [fake.user_name() for _ in range(POOL_SIZE)],
+        'domain': [fake.free_email_domain() for _ in range(50)],
+        'location': [fake.city() for _ in range(POOL_SIZE)],
+        'sentence': [fake.sentence() for _ in range(POOL_SIZE)],
+    }
+
+
+def users(rng, pools, count):
+    """Rows for users.csv."""
+
+    for i in range(1, count + 1):
+        # numbered, so usernames stay unique however many there are
+        username = f"{rng.choice(pools['username'])}{i}"
+        yield (f"{username}@{rng.choice(pools['domain'])}",
+               username,
+               rng.choice(image_urls),
+               PASSWORD,
+               rng.choice(pools['sentence']),
+               rng.choice(header_image_urls),
+               rng.choice(pools['location']))
+
+
+def message_text(rng, pools):
+    text = rng.choice(pools['sentence'])
+    for _ in range(rng.randint(0, 3)):
+        longer = f"{text} {rng.choice(pools['sentence'])}"
+        if len(longer) > MAX_WARBLER_LENGTH:
+            break
+        text = longer
+    return text[:MAX_WARBLER_LENGTH]
+
+
+def distinct_users(rng, count, shuffle, skew, exclude):
+    """`count` different users other than `exclude`, drawn by power law."""
+
+    chosen = set()
+    while len(chosen) < count:
+        user_id = shuffle(power_law_rank(rng, shuffle.count, skew))
+        if user_id in chosen or user_id == exclude:
+            # popular users are soon taken; fill up from everyone
+            user_id = rng.randint(1, shuffle.count)
+        if user_id != exclude:
+            chosen.add(user_id)
+    return chosen
+
+
+def messages_and_likes(rng, pools, args):
+    """Rows for messages.csv, oldest first, each with its rows for likes.csv."""
+
+    count = round(args.users * args.messages_per_user)
+    start = args.end - timedelta(days=args.days)
+    spacing = timedelta(days=args.days) / max(count, 1)
+
+    authors = Shuffle(rng, args.users)
+    likers = Shuffle(rng, args.users)
+    max_likes = (args.users - 1) // 2
+
+    for row in range(1, count + 1):
+        author = authors(power_law_rank(rng, args.users, args.skew))
+        timestamp = start + spacing * (row - 1 + rng.random())
+        message = (message_text(rng, pools), timestamp, author)
+
+        like_count = geometric(rng, args.likes_per_message, max_likes)
+        likes = [(user_id, row) for user_id in
+                 distinct_users(rng, like_count, likers, args.skew, author)]
+
+        yield message, likes
+
+
+def follows(rng, args):
+    """Rows for follows.csv, one follower at a time."""
+
+    popular = Shuffle(rng, args.users)
+    # capped so there are always plenty of users left to pick from
+    max_follows = (args.users - 1) // 2
+
+    for follower in range(1, args.users + 1):
+        count = geometric(rng, args.follows_per_user, max_follows)
+        for followed in distinct_users(rng, count, popular, args.skew,
+                                       follower):
+            yield followed, follower
+
+
+def main():
+    args = parse_args()
+
+    rng = Random(args.seed)
+    fake = Faker()
+    fake.seed_instance(args.seed)
+    pools = make_pools(fake)
+
+    def writer(name, headers):
+        return ChunkedWriter(args.out, name, headers, args.chunk_rows)
+
+    with writer('users', USERS_CSV_HEADERS) as users_csv:
+        for row in users(rng, pools, args.users):
+            users_csv.writerow(row)
+
+    with writer('messages', MESSAGES_CSV_HEADERS) as messages_csv, \
+            writer('likes', LIKES_CSV_HEADERS) as likes_csv:
+        for message, likes in messages_and_likes(rng, pools, args):
+            messages_csv.writerow(message)
+            for like in likes:
+                likes_csv.writerow(like)
+
+    with writer('follows', FOLLOWS_CSV_HEADERS) as follows_csv:
+        for row in follows(rng, args):
+            follows_csv.writerow(row)
+
+    for csv_writer in (users_csv, messages_csv, likes_csv, follows_csv):
+        print(f"{csv_writer.name}: {csv_writer.rows} rows")
+
+
+if __name__ == '__main__':
+    main()
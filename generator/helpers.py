@@ -1,14 +1,104 @@
 """Support functions for CSV generation."""
 
-from datetime import datetime
-from random import uniform
+import csv
+import math
+import os
 
 
-def get_random_datetime(year_gap=2):
-    """Get a random datetime within the last few years."""
+def power_law_rank(rng, count, exponent):
+    """Draw a rank in 1..count, with P(rank) roughly rank ** -exponent.
 
-    now = datetime.now()
-    then = now.replace(year=now.year - year_gap)
-    random_timestamp = uniform(then.timestamp(), now.timestamp())
+    Inverts the CDF of the continuous (bounded Pareto) distribution, so it
+    needs no table of weights however large `count` is.
+    """
 
-    return datetime.fromtimestamp(random_timestamp)
+    u = rng.random()
+    if exponent == 1:
+        rank = count ** u
+    else:
+        a = 1 - exponent
+        rank = ((count ** a - 1) * u + 1) ** (1 / a)
+    return min(count, int(rank))
+
+
+def geometric(rng, mean, cap):
+    """Draw a count >= 0 averaging about `mean`, capped at `cap`.
+
+    Most draws are small and a few are large, like how many people like
+    a message.
+    """
+
+    if mean <= 0:
+        return 0
+    count = math.floor(math.log(1 - rng.random()) / math.log(mean / (mean + 1)))
+    return min(cap, count)
+
+
+class Shuffle:
+    """A fixed pseudo-random permutation of 1..count.
+
+    Maps a rank (say, popularity) to a user id, so the most popular users
+    aren't simply the first ones, without holding a list of every id.
+    """
+
+    def __init__(self, rng, count):
+        self.count = count
+        self.offset = rng.randrange(count)
+        self.step = rng.randrange(1, count) if count > 1 else 1
+        while math.gcd(self.step, count) != 1:
+            self.step += 1
+
+    def __call__(self, rank):
+        return (self.offset + (rank - 1) * self.step) % self.count + 1
+
+
+class ChunkedWriter:
+    """Stream CSV rows to `directory`/`name`.csv; use it as a context manager.
+
+    With `chunk_rows`, rows are split across name.0000.csv, name.0001.csv,
+    ..., each with the header and at most `chunk_rows` rows.
+    """
+
+    def __init__(self, directory, name, headers, chunk_rows=0):
+        self.directory = directory
+        self.name = name
+        self.headers = headers
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self._file = None
+        self._chunks = 0
+
+    def __enter__(self):
+        self._next_file()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def writerow(self, row):
+        if self.chunk_rows and self._in_chunk == self.chunk_rows:
+            self._next_file()
+
+        self._writer.writerow(row)
+        self._in_chunk += 1
+        self.rows += 1
+
+    def _next_file(self):
+        self.close()
+
+        if self.chunk_rows:
+            filename = f"{self.name}.{self._chunks:04d}.csv"
+        else:
+            filename = f"{self.name}.csv"
+        self._chunks += 1
+
+        self._file = open(os.path.join(self.directory, filename), 'w',
+                          newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.headers)
+        self._in_chunk = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
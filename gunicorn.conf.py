@@ -0,0 +1,38 @@
+"""gunicorn settings:
+
+    SECRET_KEY=... WARBLER_WORKER_ID=... gunicorn -c gunicorn.conf.py wsgi:app
+
+WEB_CONCURRENCY and GUNICORN_THREADS set the workers and threads here, and
+size each worker's connection pool when DB_MAX_CONNECTIONS is set (see
+pool.py), so the two always agree.
+
+Each worker mints message ids under its own worker number (see
+snowflake.py): WARBLER_WORKER_ID is the server's first, and its workers
+take the numbers from there up. A reload starts new workers before the
+old ones stop, so leave each server twice WEB_CONCURRENCY numbers.
+"""
+
+import itertools
+import os
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+
+# the app is made after forking, so no worker inherits another's
+# connections
+preload_app = False
+
+
+def pre_fork(server, worker):
+    # in the master, which knows the numbers its live workers hold
+    taken = {other.warbler_slot for other in server.WORKERS.values()}
+    worker.warbler_slot = next(slot for slot in itertools.count()
+                               if slot not in taken)
+
+
+def post_fork(server, worker):
+    # before the worker loads the app, and snowflake.py with it
+    first = os.environ.get('WARBLER_WORKER_ID')
+    if first is not None:
+        os.environ['WARBLER_WORKER_ID'] = str(int(first)
+                                              + worker.warbler_slot)
@@ -0,0 +1,136 @@
+"""Cache-Control, ETags and conditional GETs, decided per route.
+
+Every response used to be sent uncacheable, static files included, so
+browsers fetched everything again on every page. Now the after_request
+hook here gives each response the policy for its route:
+
+- Static files linked through asset_url() carry a fingerprint of their
+  contents, in their built name or as ?v=... (see assets.py), so a
+  changed file gets a new URL; those are cached for a year as immutable.
+  Other static files are cached but revalidated (Flask sends them with
+  an ETag of their own).
+- Views that call not_modified_unless_changed() get a weak ETag made from
+  the versions of what the page shows -- users' profile_version and
+  counters, the ids of the messages on it, the viewer and what they
+  follow -- plus the templates'. A browser asking again with that ETag
+  in If-None-Match gets an empty 304 straight away, before the page is
+  rendered. These pages differ per viewer, so they're private.
+- Views marked @cache_control(...) get that Cache-Control.
+- Everything else is still no-store: it may show a form, a flash message
+  or someone's session.
+"""
+
+import hashlib
+import os
+
+from flask import abort, current_app, g, request, session
+
+from assets import is_fingerprinted
+
+# for fingerprinted static files
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# cached, but checked with the server before each use
+REVALIDATE = 'no-cache'
+
+DEFAULT_POLICY = 'no-store'
+
+
+def cache_control(policy):
+    """Mark a view as sending `policy` as its Cache-Control."""
+
+    def mark(view):
+        view.cache_control = policy
+        return view
+    return mark
+
+
+def templates_version(app):
+    """A hash of every template, so a deploy that changes one changes
+    every ETag."""
+
+    digest = hashlib.sha256()
+    loader_root = os.path.join(app.root_path, app.template_folder)
+    for root, dirs, files in sorted(os.walk(loader_root)):
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as file:
+                digest.update(name.encode('utf-8'))
+                digest.update(file.read())
+    return digest.hexdigest()[:12]
+
+
+def viewer_version():
+    """What of the viewer every page shows: who they are, in the nav."""
+
+    if not g.user:
+        return None
+    return (g.user.id, g.user.profile_version)
+
+
+def user_version(user):
+    """What a profile header shows of `user`, with its follow button."""
+
+    return (user.id, user.profile_version, user.messages_count,
+            user.followers_count, user.following_count, user.likes_count,
+            follows(user))
+
+
+def users_version(users):
+    """What the cards of `users` show, with their follow buttons."""
+
+    return tuple((user.id, user.profile_version, follows(user))
+                 for user in users)
+
+
+def follows(user):
+    """Whether the viewer follows `user`, which its follow button shows."""
+
+    return bool(g.user) and g.user.is_following(user)
+
+
+def not_modified_unless_changed(*versions):
+    """Send 304 now if the client has this page as of `versions`.
+
+    Call with everything the page shows that can change, once it's loaded
+    and before it's rendered; the response gets the resulting weak ETag.
+    """
+
+    # a flashed message is shown once, so the page has to be sent
+    if request.method != 'GET' or session.get('_flashes'):
+        return
+
+    digest = hashlib.sha256(repr(
+        (current_app.extensions['templates_version'], viewer_version(),
+         versions)).encode('utf-8'))
+    g.etag = digest.hexdigest()[:32]
+
+    if request.if_none_match.contains_weak(g.etag):
+        # apply_policy() adds the ETag and Cache-Control on the way out
+        abort(current_app.response_class(status=304))
+
+
+def apply_policy(response):
+    """Set Cache-Control, and the ETag if there is one, for this route."""
+
+    if request.endpoint == 'static':
+        if response.status_code in (200, 304):
+            fingerprinted = is_fingerprinted(request.view_args['filename'])
+            response.headers['Cache-Control'] = (IMMUTABLE if fingerprinted
+                                                 else REVALIDATE)
+        return response
+
+    etag = g.get('etag')
+    if etag is not None and response.status_code in (200, 304):
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = f'private, {REVALIDATE}'
+        response.vary.add('Cookie')
+        return response
+
+    view = current_app.view_functions.get(request.endpoint)
+    response.headers['Cache-Control'] = getattr(view, 'cache_control',
+                                                DEFAULT_POLICY)
+    return response
+
+
+def init_http_caching(app):
+    app.extensions['templates_version'] = templates_version(app)
+    app.after_request(apply_policy)
@@ -0,0 +1,269 @@
+"""Per-request SQL instrumentation, exported at /metrics.
+
+Engine event hooks time every query and count the rows SELECTs return,
+adding them up for the request that ran them (on `g`). Rows read from a
+server-side cursor aren't known when it's executed, so whatever reads
+them counts them with count_rows() (see pagination.StreamedPage).
+SQLite's DBAPI gives no rowcount for any SELECT, so on SQLite only rows
+counted that way are counted at all, and warbler_db_rows_total reads low.
+When the request finishes its totals are added to per-endpoint
+aggregates, which `metrics.render()` writes out in the Prometheus text
+format. Queries that take longer than `app.config['SLOW_QUERY_MS']` are
+logged with the endpoint that ran them, to the "warbler.sql" logger.
+
+Everything is kept in process, so each worker exports its own numbers;
+Prometheus adds them up across workers.
+"""
+
+import logging
+from collections import defaultdict
+from threading import Lock
+from time import perf_counter
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOW_QUERY_MS = 100
+
+# upper bounds of the histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+
+logger = logging.getLogger('warbler.sql')
+
+
+class RequestStats:
+    """The queries one request ran."""
+
+    __slots__ = ('queries', 'seconds', 'rows', 'slow')
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.slow = 0
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count, as Prometheus keeps them."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels=''):
+        prefix = f'{labels},' if labels else ''
+        for bound, count in zip(self.buckets, self.counts):
+            yield f'{name}_bucket{{{prefix}le="{bound}"}} {count}'
+        yield f'{name}_bucket{{{prefix}le="+Inf"}} {self.count}'
+
+        labels = f'{{{labels}}}' if labels else ''
+        yield f'{name}_sum{labels} {self.sum}'
+        yield f'{name}_count{labels} {self.count}'
+
+
+class Metrics:
+    """Request and query totals by endpoint, since this process started."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.requests = defaultdict(int)
+            self.durations = defaultdict(lambda: Histogram(DURATION_BUCKETS))
+            self.query_counts = defaultdict(
+                lambda: Histogram(QUERY_COUNT_BUCKETS))
+            self.queries = defaultdict(int)
+            self.db_seconds = defaultdict(float)
+            self.rows = defaultdict(int)
+            self.slow_queries = defaultdict(int)
+            self.pool_wait = Histogram(POOL_WAIT_BUCKETS)
+            self.pool_timeouts = 0
+
+    def observe_pool_wait(self, seconds, timed_out=False):
+        """Add one connection checkout (see pool.py)."""
+
+        with self._lock:
+            self.pool_wait.observe(seconds)
+            self.pool_timeouts += timed_out
+
+    def observe(self, endpoint, method, status, seconds, stats):
+        """Add one finished request."""
+
+        with self._lock:
+            self.requests[endpoint, method, status] += 1
+            self.durations[endpoint].observe(seconds)
+            self.query_counts[endpoint].observe(stats.queries)
+            self.queries[endpoint] += stats.queries
+            self.db_seconds[endpoint] += stats.seconds
+            self.rows[endpoint] += stats.rows
+            self.slow_queries[endpoint] += stats.slow
+
+    def render(self, pool=None):
+        """Everything so far, in the Prometheus text exposition format.
+
+        With a QueuePool `pool`, also how many connections it has open
+        and checked out right now.
+        """
+
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            family('warbler_requests_total', 'counter',
+                   "Requests handled.")
+            for (endpoint, method, status), count in sorted(
+                    self.requests.items()):
+                lines.append(
+                    f'warbler_requests_total{{endpoint="{escape(endpoint)}",'
+                    f'method="{method}",status="{status}"}} {count}')
+
+            family('warbler_request_duration_seconds', 'histogram',
+                   "Time to handle a request.")
+            for endpoint, histogram in sorted(self.durations.items()):
+                lines.extend(histogram.lines(
+                    'warbler_request_duration_seconds',
+                    f'endpoint="{escape(endpoint)}"'))
+
+            family('warbler_request_queries', 'histogram',
+                   "SQL queries run per request.")
+            for endpoint, histogram in sorted(self.query_counts.items()):
+                lines.extend(histogram.lines(
+                    'warbler_request_queries',
+                    f'endpoint="{escape(endpoint)}"'))
+
+            for name, values, help_text in (
+                    ('warbler_db_queries_total', self.queries,
+                     "SQL queries run."),
+                    ('warbler_db_seconds_total', self.db_seconds,
+                     "Time spent running SQL queries."),
+                    ('warbler_db_rows_total', self.rows,
+                     "Rows returned by SELECTs."),
+                    ('warbler_db_slow_queries_total', self.slow_queries,
+                     "SQL queries slower than SLOW_QUERY_MS.")):
+                family(name, 'counter', help_text)
+                for endpoint, value in sorted(values.items()):
+                    lines.append(
+                        f'{name}{{endpoint="{escape(endpoint)}"}} {value}')
+
+            family('warbler_db_pool_wait_seconds', 'histogram',
+                   "Time to check a connection out of the pool.")
+            lines.extend(self.pool_wait.lines('warbler_db_pool_wait_seconds'))
+
+            family('warbler_db_pool_timeouts_total', 'counter',
+                   "Checkouts that gave up waiting for a connection.")
+            lines.append(f'warbler_db_pool_timeouts_total {self.pool_timeouts}')
+
+        if pool is not None and hasattr(pool, 'checkedout'):
+            for name, value, help_text in (
+                    ('warbler_db_pool_size', pool.size(),
+                     "Connections the pool keeps open."),
+                    ('warbler_db_pool_checked_out', pool.checkedout(),
+                     "Connections in use."),
+                    ('warbler_db_pool_idle', pool.checkedin(),
+                     "Connections open and waiting in the pool."),
+                    ('warbler_db_pool_overflow', max(pool.overflow(), 0),
+                     "Connections open beyond the pool size.")):
+                family(name, 'gauge', help_text)
+                lines.append(f'{name} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def escape(label):
+    return (label.replace('\\', '\\\\')
+            .replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+metrics = Metrics()
+
+
+def endpoint_name():
+    """The endpoint handling this request, for labels and logs."""
+
+    if not has_request_context():
+        return '-'
+    return request.endpoint or '<unmatched>'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def finish_query(conn, cursor, statement, parameters, context, executemany):
+    """Add the query to this request's stats; log it if it was slow."""
+
+    seconds = perf_counter() - context._query_start
+
+    slow_ms = (current_app.config.get('SLOW_QUERY_MS', SLOW_QUERY_MS)
+               if has_app_context() else SLOW_QUERY_MS)
+    slow = seconds * 1000 >= slow_ms
+    if slow:
+        logger.warning("slow query (%.1f ms) in %s: %s",
+                       seconds * 1000, endpoint_name(), statement)
+
+    stats = g.get('sql_stats') if has_request_context() else None
+    if stats is None:
+        return
+
+    stats.queries += 1
+    stats.seconds += seconds
+    stats.slow += slow
+    if context.isinsert or context.isupdate or context.isdelete:
+        return
+    # -1 for a server-side cursor, whose reader counts its rows, and for
+    # any SELECT on SQLite, whose rows go uncounted
+    stats.rows += max(cursor.rowcount, 0)
+
+
+def count_rows(rows):
+    """Add `rows` read from a server-side cursor to this request's stats."""
+
+    stats = g.get('sql_stats') if has_request_context() else None
+    if stats is not None:
+        stats.rows += rows
+
+
+def instrument_app(app):
+    """Collect query stats for each of `app`'s requests into `metrics`."""
+
+    app.config.setdefault('SLOW_QUERY_MS', SLOW_QUERY_MS)
+
+    @app.before_request
+    def start_request_stats():
+        g.sql_stats = RequestStats()
+        g.request_start = perf_counter()
+
+    @app.after_request
+    def note_status(response):
+        g.response_status = response.status_code
+        return response
+
+    # a streamed page runs queries after after_request, until its body
+    # has been sent and the request is torn down (see streaming.py)
+    @app.teardown_request
+    def record_request_stats(exc):
+        stats = g.pop('sql_stats', None)
+        if stats is not None:
+            metrics.observe(endpoint_name(), request.method,
+                            g.get('response_status', 500),
+                            perf_counter() - g.request_start, stats)
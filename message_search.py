@@ -0,0 +1,233 @@
+"""Full-text search over messages, for /search/messages.
+
+Every word of the query must appear in a message (after stemming, on
+Postgres), best matches first. Results are paged like the feeds, by a
+(rank, id) keyset, so each page picks up where the last one stopped.
+
+On Postgres the query is parsed by websearch_to_tsquery() -- so "quoted
+phrases", `or` and -exclusions work -- and matched against
+Message.search_vector, through its GIN index ix_messages_search. Other
+databases (local SQLite runs) search an in-process InvertedIndex instead,
+built on first use and updated from session hooks as messages are posted
+and deleted. It matches exact words only: no stemming, so "birds" doesn't
+find "bird" there as it does on Postgres, and no query syntax.
+"""
+
+import math
+from collections import Counter, defaultdict
+from threading import Lock
+
+from sqlalchemy import column, func, literal_column, select
+
+from changes import deleted_messages, new_messages, track_committed
+from feeds import feed_query
+from models import db, Message
+from pagination import PAGE_SIZE, Page, decode_cursor, encode_cursor, paginate
+from search import words
+
+# left out of the in-process index, as Postgres's english config does
+STOP_WORDS = frozenset("""
+    a an and are as at be but by for from has have he her his i in is it
+    its me my not of on or our she so that the their them they this to was
+    we were what when which who will with you your
+""".split())
+
+# the first half of the (rank, id) sort key, for decoding cursors
+RANK = column('rank', db.Float)
+
+
+def terms(text):
+    """The words of `text` worth indexing."""
+
+    return [word for word in words(text) if word not in STOP_WORDS]
+
+
+def search_messages(query, before=None, size=PAGE_SIZE):
+    """Return a Page of messages matching `query`, best match first."""
+
+    if not query.strip():
+        return Page([], None)
+
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return _search_postgres(query, before, size)
+    return _search_index(query, before, size)
+
+
+def _search_postgres(query, before, size):
+    document = Message.search_vector
+    tsquery = func.websearch_to_tsquery(literal_column("'english'"), query)
+    # ts_rank() is a float4, which doesn't survive a round trip through
+    # the cursor; a double does
+    rank = func.ts_rank(document, tsquery).cast(db.Float)
+
+    page = paginate(
+        feed_query().add_columns(rank.label('rank'))
+        .filter(document.op('@@')(tsquery)),
+        (rank, Message.id),
+        lambda row: (row.rank, row.Message.id),
+        before, size)
+
+    return Page([row.Message for row in page], page.next_cursor)
+
+
+def _search_index(query, before, size):
+    if not message_index.loaded:
+        message_index.load(db.session.execute(
+            select(Message.id, Message.text)))
+
+    cursor = tuple(decode_cursor(before, (RANK, Message.id))) if before else None
+    hits = message_index.search(query, cursor, size + 1)
+
+    next_cursor = None
+    if len(hits) > size:
+        hits = hits[:size]
+        next_cursor = encode_cursor(hits[-1])
+
+    ids = [message_id for score, message_id in hits]
+    messages = {msg.id: msg
+                for msg in feed_query().filter(Message.id.in_(ids)).all()}
+    return Page([messages[i] for i in ids if i in messages], next_cursor)
+
+
+class InvertedIndex:
+    """In-process inverted index of message text, ranked by BM25.
+
+    Maps each term to {message id: occurrences}, so a search intersects
+    the postings of the query's terms and scores only those messages.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.loaded = False
+        self._postings = defaultdict(dict)
+        self._documents = {}
+        self._total_length = 0
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._documents)
+
+    def load(self, rows):
+        """Index every (id, text) row in `rows`."""
+
+        for message_id, text in rows:
+            self.add(message_id, text)
+        self.loaded = True
+
+    def clear(self):
+        """Forget everything; the next search reloads."""
+
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._total_length = 0
+            self.loaded = False
+
+    def add(self, message_id, text):
+        """Index (or re-index) one message."""
+
+        counts = Counter(terms(text))
+        length = sum(counts.values())
+
+        with self._lock:
+            self._discard(message_id)
+            for term, count in counts.items():
+                self._postings[term][message_id] = count
+            self._documents[message_id] = (counts.keys(), length)
+            self._total_length += length
+
+    def remove(self, message_id):
+        """Drop one message from the index."""
+
+        with self._lock:
+            self._discard(message_id)
+
+    def _discard(self, message_id):
+        document = self._documents.pop(message_id, None)
+        if document is None:
+            return
+
+        message_terms, length = document
+        self._total_length -= length
+        for term in message_terms:
+            postings = self._postings[term]
+            del postings[message_id]
+            if not postings:
+                del self._postings[term]
+
+    def search(self, query, before=None, limit=PAGE_SIZE):
+        """Return up to `limit` (score, id) pairs, best first.
+
+        With `before`, a (score, id) pair from an earlier page, only
+        results ranked after it are returned.
+        """
+
+        query_terms = set(terms(query))
+        if not query_terms:
+            return []
+
+        with self._lock:
+            postings = sorted((self._postings.get(term, {})
+                               for term in query_terms), key=len)
+            if not postings[0]:
+                return []
+
+            count = len(self._documents)
+            average = self._total_length / count
+
+            hits = []
+            for message_id in postings[0]:
+                if not all(message_id in p for p in postings[1:]):
+                    continue
+
+                length = self._documents[message_id][1]
+                norm = self.K1 * (1 - self.B + self.B * length / average)
+
+                score = 0.0
+                for p in postings:
+                    idf = math.log(1 + (count - len(p) + 0.5) / (len(p) + 0.5))
+                    tf = p[message_id]
+                    score += idf * tf * (self.K1 + 1) / (tf + norm)
+
+                hit = (score, message_id)
+                if before is None or hit < before:
+                    hits.append(hit)
+
+        hits.sort(reverse=True)
+        return hits[:limit]
+
+
+message_index = InvertedIndex()
+
+
+def collect_message_changes(session, changes):
+    """Note messages this flush posted or deleted."""
+
+    if not message_index.loaded:
+        return
+
+    for msg in new_messages(session):
+        changes[msg.id] = msg.text
+    for msg in session.dirty:
+        if isinstance(msg, Message):
+            changes[msg.id] = msg.text
+    for msg in deleted_messages(session):
+        changes[msg.id] = None
+
+
+def apply_message_changes(changes):
+    """Once the changes are committed, update the in-process index."""
+
+    for message_id, text in changes.items():
+        if text is None:
+            message_index.remove(message_id)
+        else:
+            message_index.add(message_id, text)
+
+
+# a bulk write clears the index, which is rebuilt on next use
+track_committed('message_search_changes', collect_message_changes,
+                apply_message_changes, pending=dict, model=Message,
+                on_bulk=message_index.clear)
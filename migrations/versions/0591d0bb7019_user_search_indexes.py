@@ -0,0 +1,43 @@
+"""user search indexes
+
+Full-text search over username, location and bio for /users?q=, plus a
+prefix index on lowercased usernames for short queries (see search.py).
+The expression must match models.search_document() exactly.
+
+Revision ID: 0591d0bb7019
+Revises: 10a72b57991d
+Create Date: 2026-10-18 05:37:13.774018
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0591d0bb7019'
+down_revision = '10a72b57991d'
+branch_labels = None
+depends_on = None
+
+
+SEARCH_DOCUMENT = """
+    (setweight(to_tsvector('simple', coalesce(username, '')), 'A')
+     || setweight(to_tsvector('simple', coalesce(location, '')), 'B'))
+     || setweight(to_tsvector('simple', coalesce(bio, '')), 'C')
+"""
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_users_search', 'users',
+                        [sa.text(f"({SEARCH_DOCUMENT})")],
+                        postgresql_using='gin',
+                        postgresql_concurrently=True)
+        op.create_index('ix_users_username_prefix', 'users',
+                        [sa.text('(lower(username) COLLATE "C")')],
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix_users_username_prefix', table_name='users')
+    op.drop_index('ix_users_search', table_name='users')
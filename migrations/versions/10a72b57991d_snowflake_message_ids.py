@@ -0,0 +1,97 @@
+"""snowflake message ids
+
+Message ids become 64-bit and time-ordered (see snowflake.py), made by the
+app instead of a sequence. Existing messages are renumbered from their
+timestamps, with likes and timelines following, so feeds can order by id
+alone: the copied timestamp on timelines and the timestamp index on
+messages go. Messages also get a server-side timestamp default.
+
+Revision ID: 10a72b57991d
+Revises: 83451286bfde
+Create Date: 2026-10-18 05:32:39.520875
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '10a72b57991d'
+down_revision = '83451286bfde'
+branch_labels = None
+depends_on = None
+
+
+EPOCH = '2010-01-01'
+
+# (table, column, foreign key) of every reference to messages.id
+REFERENCES = (
+    ('likes', 'message_id', 'likes_message_id_fkey'),
+    ('timelines', 'message_id', 'timelines_message_id_fkey'),
+)
+
+
+def upgrade():
+    for table, column, fkey in REFERENCES:
+        op.drop_constraint(fkey, table, type_='foreignkey')
+
+    op.alter_column('messages', 'id', type_=sa.BigInteger(),
+                    existing_type=sa.Integer(), server_default=None)
+    op.execute('DROP SEQUENCE messages_id_seq')
+    for table, column, fkey in REFERENCES:
+        op.alter_column(table, column, type_=sa.BigInteger(),
+                        existing_type=sa.Integer())
+
+    # milliseconds since EPOCH in the high bits; these rows have worker 0,
+    # so the low 22 bits are free to number messages sharing a millisecond
+    op.execute(f"""
+        CREATE TEMPORARY TABLE message_ids ON COMMIT DROP AS
+        SELECT id AS old_id,
+               ms << 22 | (row_number() OVER (PARTITION BY ms ORDER BY id) - 1)
+               AS new_id
+        FROM (SELECT id,
+                     floor(extract(epoch FROM timestamp - '{EPOCH}') * 1000)
+                     ::bigint AS ms
+              FROM messages) AS m
+    """)
+    op.execute('UPDATE messages SET id = new_id '
+               'FROM message_ids WHERE id = old_id')
+    for table, column, fkey in REFERENCES:
+        op.execute(f'UPDATE {table} SET {column} = new_id '
+                   f'FROM message_ids WHERE {column} = old_id')
+
+    for table, column, fkey in REFERENCES:
+        op.create_foreign_key(fkey, table, 'messages', [column], ['id'],
+                              ondelete='cascade')
+
+    op.alter_column('messages', 'timestamp', existing_type=sa.DateTime(),
+                    server_default=sa.text("(now() at time zone 'utc')"))
+
+    op.create_index('ix_messages_user_id_id', 'messages', ['user_id', 'id'])
+    op.drop_index('ix_messages_user_id_timestamp', table_name='messages')
+    op.drop_index('ix_timelines_user_id_timestamp', table_name='timelines')
+    op.drop_column('timelines', 'timestamp')
+
+
+def downgrade():
+    # ids keep their new values, so stay 64-bit; a sequence takes over
+    # numbering from above the largest
+    op.add_column('timelines', sa.Column('timestamp', sa.DateTime()))
+    op.execute('UPDATE timelines SET timestamp = messages.timestamp '
+               'FROM messages WHERE messages.id = timelines.message_id')
+    op.alter_column('timelines', 'timestamp', nullable=False)
+    op.create_index('ix_timelines_user_id_timestamp', 'timelines',
+                    ['user_id', 'timestamp', 'message_id'])
+
+    op.create_index('ix_messages_user_id_timestamp', 'messages',
+                    ['user_id', 'timestamp', 'id'])
+    op.drop_index('ix_messages_user_id_id', table_name='messages')
+
+    op.alter_column('messages', 'timestamp', existing_type=sa.DateTime(),
+                    server_default=None)
+
+    op.execute('CREATE SEQUENCE messages_id_seq OWNED BY messages.id')
+    op.execute("SELECT setval('messages_id_seq', "
+               "(SELECT coalesce(max(id), 0) + 1 FROM messages), false)")
+    op.alter_column('messages', 'id', existing_type=sa.BigInteger(),
+                    server_default=sa.text("nextval('messages_id_seq')"))
@@ -0,0 +1,32 @@
+"""rate limits
+
+The rate_limits table, for login rate limits shared by every worker
+(see ratelimit.py).
+
+Revision ID: 365b3c93d2b2
+Revises: 505aea111215
+Create Date: 2026-10-18 07:27:13.197854
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '365b3c93d2b2'
+down_revision = '505aea111215'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'rate_limits',
+        sa.Column('key', sa.Text(), nullable=False),
+        sa.Column('full_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+
+
+def downgrade():
+    op.drop_table('rate_limits')
@@ -0,0 +1,39 @@
+"""message search index
+
+Full-text search over message text for /search/messages (see
+message_search.py): a stored tsvector column, computed as
+models.message_document() is, and a GIN index on it. Adding a stored
+generated column rewrites the messages table under an exclusive lock, so
+on a large table run this in a maintenance window.
+
+Revision ID: 505aea111215
+Revises: 0591d0bb7019
+Create Date: 2026-10-18 06:08:39.206542
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '505aea111215'
+down_revision = '0591d0bb7019'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('messages', sa.Column(
+        'search_vector', postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('english', text)", persisted=True)))
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_messages_search', 'messages', ['search_vector'],
+                        postgresql_using='gin',
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix_messages_search', table_name='messages')
+    op.drop_column('messages', 'search_vector')
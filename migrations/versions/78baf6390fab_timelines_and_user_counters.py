@@ -0,0 +1,71 @@
+"""timelines and user counters
+
+Adds the fan-out home timeline table and the denormalized counters on
+users, and fills both in from the existing messages, follows and likes.
+Databases created by the original db.create_all() start here.
+
+Revision ID: 78baf6390fab
+Revises: 
+Create Date: 2026-10-18 05:25:20.050957
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '78baf6390fab'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+COUNTERS = ('messages_count', 'followers_count', 'following_count',
+            'likes_count')
+
+
+def upgrade():
+    op.create_table(
+        'timelines',
+        sa.Column('user_id', sa.Integer(),
+                  sa.ForeignKey('users.id', ondelete='cascade'),
+                  primary_key=True),
+        sa.Column('message_id', sa.Integer(),
+                  sa.ForeignKey('messages.id', ondelete='cascade'),
+                  primary_key=True),
+        sa.Column('timestamp', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_timelines_user_id_timestamp', 'timelines',
+                    ['user_id', 'timestamp'])
+
+    op.execute("""
+        INSERT INTO timelines (user_id, message_id, timestamp)
+        SELECT user_id, id, timestamp FROM messages
+        UNION
+        SELECT f.user_following_id, m.id, m.timestamp
+        FROM messages m
+        JOIN follows f ON f.user_being_followed_id = m.user_id
+    """)
+
+    for counter in COUNTERS:
+        op.add_column('users', sa.Column(counter, sa.Integer(),
+                                         nullable=False, server_default='0'))
+
+    op.execute("""
+        UPDATE users SET
+            messages_count = (SELECT count(*) FROM messages
+                              WHERE messages.user_id = users.id),
+            followers_count = (SELECT count(*) FROM follows
+                               WHERE follows.user_being_followed_id = users.id),
+            following_count = (SELECT count(*) FROM follows
+                               WHERE follows.user_following_id = users.id),
+            likes_count = (SELECT count(*) FROM likes
+                           WHERE likes.user_id = users.id)
+    """)
+
+
+def downgrade():
+    for counter in COUNTERS:
+        op.drop_column('users', counter)
+
+    op.drop_table('timelines')
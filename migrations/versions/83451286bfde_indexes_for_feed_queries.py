@@ -0,0 +1,65 @@
+"""indexes for feed queries
+
+Every feed filters or sorts on columns that had no index. The new indexes
+are built CONCURRENTLY so a live database keeps taking writes.
+
+Also replaces the unique constraint on likes.message_id, which only let
+one user ever like a message, with one on (user_id, message_id).
+
+Revision ID: 83451286bfde
+Revises: 78baf6390fab
+Create Date: 2026-10-18 05:25:21.137483
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '83451286bfde'
+down_revision = '78baf6390fab'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = (
+    ('ix_follows_user_following_id', 'follows',
+     ['user_following_id', 'user_being_followed_id']),
+    ('ix_likes_message_id', 'likes', ['message_id']),
+    ('ix_messages_user_id_timestamp', 'messages',
+     ['user_id', 'timestamp', 'id']),
+    ('ix_timelines_message_id', 'timelines', ['message_id']),
+)
+
+
+def upgrade():
+    op.drop_constraint('likes_message_id_key', 'likes', type_='unique')
+    op.create_unique_constraint('uq_likes_user_id_message_id', 'likes',
+                                ['user_id', 'message_id'])
+
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns,
+                            postgresql_concurrently=True)
+
+        # widen the timeline index so keyset pages can break timestamp ties
+        op.create_index('ix_timelines_user_id_timestamp_message_id',
+                        'timelines', ['user_id', 'timestamp', 'message_id'],
+                        postgresql_concurrently=True)
+        op.drop_index('ix_timelines_user_id_timestamp',
+                      table_name='timelines', postgresql_concurrently=True)
+
+    op.execute('ALTER INDEX ix_timelines_user_id_timestamp_message_id '
+               'RENAME TO ix_timelines_user_id_timestamp')
+
+
+def downgrade():
+    op.drop_index('ix_timelines_user_id_timestamp', table_name='timelines')
+    op.create_index('ix_timelines_user_id_timestamp', 'timelines',
+                    ['user_id', 'timestamp'])
+
+    for name, table, columns in INDEXES:
+        op.drop_index(name, table_name=table)
+
+    op.drop_constraint('uq_likes_user_id_message_id', 'likes', type_='unique')
+    op.create_unique_constraint('likes_message_id_key', 'likes',
+                                ['message_id'])
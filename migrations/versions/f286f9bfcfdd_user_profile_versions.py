@@ -0,0 +1,29 @@
+"""user profile versions
+
+users.profile_version, which cached message and user cards are checked
+against (see fragments.py). A constant default doesn't rewrite the
+table, so this is quick on a large one.
+
+Revision ID: f286f9bfcfdd
+Revises: 365b3c93d2b2
+Create Date: 2026-10-18 07:31:11.618415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f286f9bfcfdd'
+down_revision = '365b3c93d2b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('profile_version', sa.Integer(),
+                                     nullable=False, server_default='1'))
+
+
+def downgrade():
+    op.drop_column('users', 'profile_version')
@@ -2,11 +2,76 @@
 
 from datetime import datetime
 
-from flask_bcrypt import Bcrypt
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, select
+from sqlalchemy.dialects import postgresql  # registers to_tsvector() etc.
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
 
-bcrypt = Bcrypt()
-db = SQLAlchemy()
+from passwords import hasher
+from replicas import RoutingSession
+from snowflake import next_message_id
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+class utcnow(FunctionElement):
+    """The database's current time in UTC, for server-side defaults."""
+
+    type = db.DateTime()
+    inherit_cache = True
+
+
+@compiles(utcnow, 'postgresql')
+def _pg_utcnow(element, compiler, **kw):
+    return "(now() at time zone 'utc')"
+
+
+@compiles(utcnow)
+def _utcnow(element, compiler, **kw):
+    # SQLite's CURRENT_TIMESTAMP is already UTC
+    return "CURRENT_TIMESTAMP"
+
+
+def search_document(username, location, bio):
+    """A user's searchable text as a Postgres tsvector.
+
+    Weighted so a match in the username (A) outranks one in the location
+    (B), which outranks one in the bio (C). Used both to define
+    ix_users_search and by search.py to query it; Postgres only uses the
+    index if the two expressions are identical, so both come from here.
+    """
+
+    def weighted(text, weight):
+        return db.func.setweight(
+            db.func.to_tsvector(db.literal_column("'simple'"),
+                                db.func.coalesce(text, '')),
+            weight)
+
+    return (weighted(username, 'A')
+            .op('||')(weighted(location, 'B'))
+            .op('||')(weighted(bio, 'C')))
+
+
+class message_document(FunctionElement):
+    """A message's text as a Postgres tsvector, stemmed as English.
+
+    What Message.search_vector is computed from. Other databases store
+    NULL there; they search an in-process index instead (see
+    message_search.py).
+    """
+
+    inherit_cache = True
+
+
+@compiles(message_document, 'postgresql')
+def _pg_message_document(element, compiler, **kw):
+    return f"to_tsvector('english', {compiler.process(element.clauses, **kw)})"
+
+
+@compiles(message_document)
+def _message_document(element, compiler, **kw):
+    return "NULL"
 
 
 class Follows(db.Model):
@@ -26,6 +91,12 @@ class Follows(db.Model):
         primary_key=True
     )
 
+    # the primary key serves "who follows X"; this serves "who X follows"
+    __table_args__ = (
+        db.Index('ix_follows_user_following_id',
+                 'user_following_id', 'user_being_followed_id'),
+    )
+
 
 class Likes(db.Model):
     """Mapping user likes to warbles."""
@@ -43,13 +114,84 @@ class Likes(db.Model):
     )
 
     message_id = db.Column(
-        db.Integer,
+        db.BigInteger,
         db.ForeignKey('messages.id', ondelete='cascade'),
-        unique=True
     )
 
+    # one like per user per message; also serves a user's liked list,
+    # while the message_id index serves cascades from deleted messages
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'message_id',
+                            name='uq_likes_user_id_message_id'),
+        db.Index('ix_likes_message_id', 'message_id'),
+    )
+
+
+class Memberships:
+    """Follow/like membership checks for a user, by id set.
+
+    Each set is loaded with one query the first time it's asked for, then
+    checked in O(1) -- listing pages ask once per card. User drops them
+    whenever it's expired (e.g. on commit) or the follows/likes behind them
+    change; see forget_memberships().
+    """
+
+    MEMBERSHIPS = ('_following_ids', '_follower_ids', '_liked_message_ids')
+
+    def _membership(self, name, query):
+        if name not in self.__dict__:
+            self.__dict__[name] = frozenset(db.session.scalars(query))
+        return self.__dict__[name]
 
-class User(db.Model):
+    @property
+    def following_ids(self):
+        """Ids of the users this user follows."""
+
+        return self._membership(
+            '_following_ids',
+            select(Follows.user_being_followed_id)
+            .where(Follows.user_following_id == self.id))
+
+    @property
+    def follower_ids(self):
+        """Ids of the users following this user."""
+
+        return self._membership(
+            '_follower_ids',
+            select(Follows.user_following_id)
+            .where(Follows.user_being_followed_id == self.id))
+
+    @property
+    def liked_message_ids(self):
+        """Ids of the messages this user has liked."""
+
+        return self._membership(
+            '_liked_message_ids',
+            select(Likes.message_id).where(Likes.user_id == self.id))
+
+    def forget_memberships(self):
+        """Drop the cached membership sets so they're reloaded on next use."""
+
+        for name in self.MEMBERSHIPS:
+            self.__dict__.pop(name, None)
+
+    def is_followed_by(self, other_user):
+        """Is this user followed by `other_user`?"""
+
+        return other_user.id in self.follower_ids
+
+    def is_following(self, other_user):
+        """Is this user following `other_use`?"""
+
+        return other_user.id in self.following_ids
+
+    def has_liked(self, message):
+        """Has this user liked `message`?"""
+
+        return message.id in self.liked_message_ids
+
+
+class User(Memberships, db.Model):
     """User in the system."""
 
     __tablename__ = 'users'
@@ -94,6 +236,46 @@ class User(db.Model):
         nullable=False,
     )
 
+    # Denormalized counts for profile headers, kept in step by counters.py
+
+    messages_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    followers_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    following_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    likes_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    # Bumped whenever the profile changes, so rendered cards and pages can
+    # be cached under it (see fragments.py and http_caching.py)
+
+    profile_version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=1,
+        server_default='1',
+    )
+
     messages = db.relationship('Message')
 
     followers = db.relationship(
@@ -117,21 +299,19 @@ class User(db.Model):
         secondary="likes"
     )
 
+    # full-text search over username, location and bio, and username
+    # prefixes for queries too short for that (see search.py)
+    __table_args__ = (
+        db.Index('ix_users_search', search_document(username, location, bio),
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+        db.Index('ix_users_username_prefix',
+                 db.func.lower(username).collate('C'))
+        .ddl_if(dialect='postgresql'),
+    )
+
     def __repr__(self):
         return f"<User #{self.id}: {self.username}, {self.email}>"
 
-    def is_followed_by(self, other_user):
-        """Is this user followed by `other_user`?"""
-
-        found_user_list = [user for user in self.followers if user == other_user]
-        return len(found_user_list) == 1
-
-    def is_following(self, other_user):
-        """Is this user following `other_use`?"""
-
-        found_user_list = [user for user in self.following if user == other_user]
-        return len(found_user_list) == 1
-
     @classmethod
     def signup(cls, username, email, password, image_url):
         """Sign up user.
@@ -139,7 +319,7 @@ class User(db.Model):
         Hashes password and adds user to system.
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = hasher().hash(password)
 
         user = User(
             username=username,
@@ -162,14 +342,25 @@ class User(db.Model):
         If can't find matching user (or if password is wrong), returns False.
         """
 
-        user = cls.query.filter_by(username=username).first()
+        # the check lives with the login limits, which remember usernames
+        # that don't exist
+        from auth import authenticate
+        return authenticate(username, password)
+
+    def check_password(self, password):
+        """Whether `password` is this user's password.
+
+        If it is, and the stored hash was made at a different cost than
+        BCRYPT_LOG_ROUNDS, replaces the hash (the caller commits).
+        """
 
-        if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
-            if is_auth:
-                return user
+        passwords = hasher()
+        if not passwords.check(self.password, password):
+            return False
 
-        return False
+        if passwords.needs_rehash(self.password):
+            self.password = passwords.hash(password)
+        return True
 
 
 class Message(db.Model):
@@ -177,9 +368,12 @@ class Message(db.Model):
 
     __tablename__ = 'messages'
 
+    # time-ordered (see snowflake.py), so newest-first is ORDER BY id DESC
     id = db.Column(
-        db.Integer,
+        db.BigInteger,
         primary_key=True,
+        autoincrement=False,
+        default=next_message_id,
     )
 
     text = db.Column(
@@ -190,7 +384,8 @@ class Message(db.Model):
     timestamp = db.Column(
         db.DateTime,
         nullable=False,
-        default=datetime.utcnow(),
+        default=datetime.utcnow,
+        server_default=utcnow(),
     )
 
     user_id = db.Column(
@@ -199,12 +394,125 @@ class Message(db.Model):
         nullable=False,
     )
 
+    # stored rather than an expression index, so ranking search results
+    # reads each match's tsvector instead of re-parsing its text; deferred,
+    # and not fetched back after INSERTs (eager_defaults below), so only
+    # search ever reads it
+    search_vector = db.deferred(db.Column(
+        db.Text().with_variant(postgresql.TSVECTOR(), 'postgresql'),
+        db.Computed(message_document(text), persisted=True),
+    ))
+
     user = db.relationship('User',
                            overlaps="messages")
+
+    # a user's messages newest-first; btree indexes scan backwards just as
+    # well, so no DESC is needed
+    __table_args__ = (
+        db.Index('ix_messages_user_id_id', 'user_id', 'id'),
+        db.Index('ix_messages_search', 'search_vector',
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+
+    __mapper_args__ = {'eager_defaults': False}
+
     def __repr__(self):
         return f"<Message #{self.id}: {self.text}, {self.user}>"
 
 
+class Timeline(db.Model):
+    """A message on a user's home feed.
+
+    Rows are written when a message is posted (fan-out on write), so the
+    home page reads one user's entries instead of joining through follows.
+    Message ids are time-ordered, so the primary key is also the index
+    the home page pages through, newest first.
+    """
+
+    __tablename__ = 'timelines'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True
+    )
+
+    message_id = db.Column(
+        db.BigInteger,
+        db.ForeignKey('messages.id', ondelete='cascade'),
+        primary_key=True
+    )
+
+    __table_args__ = (
+        db.Index('ix_timelines_message_id', 'message_id'),
+    )
+
+
+class RateLimit(db.Model):
+    """A rate-limit bucket shared by every worker (see ratelimit.py).
+
+    Keeps only when the bucket will be full again; rows whose time has
+    passed are the same as no row, and can be pruned.
+    """
+
+    __tablename__ = 'rate_limits'
+
+    key = db.Column(db.Text, primary_key=True)
+
+    full_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+
+# what pages show of a user's profile
+PROFILE_FIELDS = ('username', 'image_url', 'header_image_url', 'bio',
+                  'location')
+
+
+@event.listens_for(User, 'before_update')
+def bump_profile_version(mapper, connection, user):
+    """A change to the profile makes pages cached under it stale."""
+
+    state = db.inspect(user)
+    if any(state.attrs[field].history.has_changes()
+           for field in PROFILE_FIELDS):
+        user.profile_version = User.profile_version + 1
+
+
+@event.listens_for(User, 'expire')
+@event.listens_for(User, 'refresh')
+def forget_expired_memberships(user, *args):
+    """Reloading a user reloads its membership sets too."""
+
+    # None if the user was garbage collected before its state expired
+    if user is not None:
+        user.forget_memberships()
+
+
+@event.listens_for(User.following, 'append')
+@event.listens_for(User.following, 'remove')
+@event.listens_for(User.followers, 'append')
+@event.listens_for(User.followers, 'remove')
+@event.listens_for(User.likes, 'append')
+@event.listens_for(User.likes, 'remove')
+def forget_changed_memberships(user, other, *args):
+    """Changing a follow or like invalidates both sides' sets."""
+
+    # rollback can replay these on instances that have been collected
+    if user is not None:
+        user.forget_memberships()
+    if isinstance(other, User):
+        other.forget_memberships()
+
+
+@event.listens_for(db.session, 'after_flush')
+def forget_flushed_memberships(session, flush_context):
+    """Follows/Likes rows written directly invalidate every loaded user."""
+
+    changed = session.new | session.deleted
+    if any(isinstance(obj, (Follows, Likes)) for obj in changed):
+        for obj in list(session.identity_map.values()):
+            if isinstance(obj, User):
+                obj.forget_memberships()
+
 
 def connect_db(app):
     """Connect this database to provided Flask app.
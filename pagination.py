@@ -0,0 +1,170 @@
+"""Keyset (cursor) pagination for Warbler's lists.
+
+Pages are read newest-first by an indexed sort key, and the next page
+starts strictly after the last row of this one:
+
+    WHERE id < :last_id
+    ORDER BY id DESC LIMIT :size
+
+so page 500 costs the same as page 1, unlike OFFSET. The cursor handed to
+the browser (`?before=...`) is an opaque encoding of that last sort key.
+
+A page is read whole, or with stream=True as a StreamedPage, which reads
+its rows from a server-side cursor as it's iterated, for pages rendered
+as they're sent (see streaming.py).
+"""
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from flask import abort
+from sqlalchemy import tuple_
+
+from instrumentation import count_rows
+from models import Message, User
+
+PAGE_SIZE = 100
+
+# what a BIGINT column holds; a cursor outside it is forged
+MIN_KEY = -2 ** 63
+MAX_KEY = 2 ** 63 - 1
+
+# rows fetched from a streamed page's cursor at a time
+STREAM_BATCH_SIZE = 20
+
+
+class Page:
+    """One page of results, plus the cursor for the page after it.
+
+    Iterates like the list of items, so templates can loop over it directly.
+    `next_cursor` is None on the last page.
+    """
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class StreamedPage:
+    """One page of results, read from the database as it's iterated.
+
+    Iterate it once. `next_cursor` is known once it has been, so render
+    the pager after the list; it has no len().
+    """
+
+    def __init__(self, query, key, size):
+        self.query = query
+        self.key = key
+        self.size = size
+        self.next_cursor = None
+
+    def __iter__(self):
+        rows = iter(self.query.yield_per(STREAM_BATCH_SIZE))
+        read = 0
+        try:
+            count = 0
+            last = None
+            for row in rows:
+                read += 1
+                if count == self.size:
+                    # the extra row: there's a page after this one, which
+                    # starts after the last row of this one
+                    if last is not None:
+                        self.next_cursor = encode_cursor(self.key(last))
+                    break
+                yield row
+                last = row
+                count += 1
+        finally:
+            rows.close()
+            # a server-side cursor's rowcount is -1 when it's executed, so
+            # the request's stats count its rows here
+            count_rows(read)
+
+
+def encode_cursor(values):
+    """Turn a sort key into an opaque, URL-safe cursor string."""
+
+    values = [v.isoformat() if isinstance(v, datetime) else v
+              for v in values]
+    raw = json.dumps(values, separators=(',', ':')).encode('UTF-8')
+    return urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """Turn a cursor back into a sort key for `columns`.
+
+    Aborts with a 400 if the cursor wasn't one of ours.
+    """
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(urlsafe_b64decode(padded.encode('ascii')))
+
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(cursor)
+
+        key = [datetime.fromisoformat(value)
+               if column.type.python_type is datetime
+               else column.type.python_type(value)
+               for column, value in zip(columns, values)]
+
+        # the database driver, not us, would fail on anything bigger
+        if any(isinstance(value, int) and not MIN_KEY <= value <= MAX_KEY
+               for value in key):
+            raise ValueError(cursor)
+
+        return key
+
+    except (ValueError, TypeError, OverflowError):
+        # OverflowError: int() of a forged Infinity or 1e999
+        abort(400)
+
+
+def paginate(query, columns, key, before=None, size=PAGE_SIZE,
+             stream=False):
+    """Return a Page of `query`, newest first by `columns`.
+
+    `columns` is the sort key (it should end in a unique column so there
+    are no ties) and `key(row)` gives those values for a result row.
+    With `stream`, return a StreamedPage instead.
+    """
+
+    if before:
+        query = query.filter(
+            tuple_(*columns) < tuple_(*decode_cursor(before, columns)))
+
+    # one more than a page, to tell whether there's a next one
+    query = (query
+             .order_by(*[column.desc() for column in columns])
+             .limit(size + 1))
+    if stream:
+        return StreamedPage(query, key, size)
+
+    rows = query.all()
+
+    if len(rows) > size:
+        rows = rows[:size]
+        return Page(rows, encode_cursor(key(rows[-1])))
+
+    return Page(rows, None)
+
+
+def paginate_messages(query, before=None, size=PAGE_SIZE, stream=False):
+    """Page through a Message query by id, i.e. newest first."""
+
+    return paginate(query, (Message.id,), lambda msg: (msg.id,),
+                    before, size, stream)
+
+
+def paginate_users(query, before=None, size=PAGE_SIZE):
+    """Page through a User query by id."""
+
+    return paginate(query, (User.id,), lambda user: (user.id,), before, size)
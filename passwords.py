@@ -0,0 +1,142 @@
+"""Password hashing in a bounded pool of processes.
+
+bcrypt is slow on purpose: at cost 12 a hash or check takes about 250 ms
+of CPU. Run on the request threads, a burst of logins takes every core a
+worker has. Here hashes run in a pool of PASSWORD_HASH_WORKERS processes
+per app worker instead -- so at most that many at once, however many
+requests are logging in -- while the request waits for its result. With
+PASSWORD_HASH_WORKERS = 0 they run on the request thread, as the tests do.
+
+BCRYPT_LOG_ROUNDS sets the cost of new hashes. Each stored hash records
+the cost it was made with, so when the setting changes, needs_rehash()
+picks out the old ones, and User.check_password() replaces them the next
+time their user logs in.
+
+pretend_check() takes as long as a check does, without the CPU: it waits
+the average of recent checks. Logins for usernames that don't exist wait
+that long so they can't be told apart by timing, however many an
+attacker tries.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from time import perf_counter, sleep
+
+import bcrypt
+from flask import current_app
+
+LOG_ROUNDS = 12
+
+# weight of the latest check in the running average of their times
+CHECK_TIME_WEIGHT = 0.1
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+class PasswordHasher:
+    """Hashes and checks passwords at one cost, in `workers` processes."""
+
+    def __init__(self, rounds=LOG_ROUNDS, workers=0):
+        self.rounds = rounds
+        self.workers = workers
+        self._executor = None
+        self._lock = Lock()
+        self.check_seconds = None
+
+    def _pool(self, broken=None):
+        """The executor, made on first use or to replace `broken`."""
+
+        with self._lock:
+            if broken is not None and self._executor is broken:
+                broken.shutdown(wait=False)
+                self._executor = None
+
+            if self._executor is None:
+                # spawned rather than forked: forking a process that's
+                # running threads can copy a held lock into the child
+                self._executor = ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+
+        executor = self._pool()
+        try:
+            return executor.submit(function, *args).result()
+        except BrokenProcessPool:
+            # a worker died (killed for memory, say), which breaks the
+            # whole pool for good: start another and try once more
+            return self._pool(broken=executor).submit(function,
+                                                      *args).result()
+
+    def hash(self, password):
+        """A new hash of `password`, as text."""
+
+        if not password:
+            raise ValueError("Password must be non-empty.")
+        return self._run(_hash, password.encode('utf-8'),
+                         self.rounds).decode('utf-8')
+
+    def check(self, hashed, password):
+        """Whether `password` matches `hashed`."""
+
+        if not password:
+            return False
+
+        start = perf_counter()
+        matches = self._run(_check, password.encode('utf-8'),
+                            hashed.encode('utf-8'))
+        seconds = perf_counter() - start
+
+        if self.check_seconds is None:
+            self.check_seconds = seconds
+        else:
+            self.check_seconds += CHECK_TIME_WEIGHT * (
+                seconds - self.check_seconds)
+        return matches
+
+    def pretend_check(self):
+        """Take as long as check() does, mostly without working."""
+
+        if self.check_seconds is None:
+            # nothing to go by yet; time a real one
+            self.check(self.hash('calibration'), 'calibration')
+        else:
+            sleep(self.check_seconds)
+
+    def needs_rehash(self, hashed):
+        """Whether `hashed` was made at a different cost than ours."""
+
+        # $2b$12$...
+        return int(hashed.split('$')[2]) != self.rounds
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+def init_passwords(app):
+    app.config.setdefault('BCRYPT_LOG_ROUNDS', LOG_ROUNDS)
+    app.config.setdefault('PASSWORD_HASH_WORKERS', 0)
+
+    app.extensions['passwords'] = PasswordHasher(
+        app.config['BCRYPT_LOG_ROUNDS'], app.config['PASSWORD_HASH_WORKERS'])
+
+
+def hasher():
+    """The current app's PasswordHasher."""
+
+    return current_app.extensions['passwords']
@@ -0,0 +1,128 @@
+"""Database connection pool settings, sizing and checkout timing.
+
+engine_options() turns the DB_* environment variables into
+SQLALCHEMY_ENGINE_OPTIONS (config.py calls it):
+
+    DB_POOL_SIZE            connections each worker keeps open (5)
+    DB_MAX_OVERFLOW         more a worker may open when it's busy (10)
+    DB_MAX_CONNECTIONS      instead of the two above: the connections the
+                            whole deployment may use; sized per worker with
+                            pool_size_for(), from WEB_CONCURRENCY workers
+                            of GUNICORN_THREADS threads (gunicorn.conf.py)
+    DB_POOL_TIMEOUT         seconds to wait for a connection (10)
+    DB_POOL_RECYCLE         seconds before a connection is replaced (1800)
+    DB_POOL_PRE_PING        check connections before use (on)
+    DB_STATEMENT_TIMEOUT_MS cancel statements running longer (0: never)
+    DB_PGBOUNCER            connect through PgBouncer in transaction mode
+
+Behind PgBouncer, it does the pooling: each worker opens and closes
+connections to it as it needs them. Set statement_timeout on the role
+instead (ALTER ROLE ... SET statement_timeout), as PgBouncer refuses the
+startup option; session state -- SET, advisory locks, LISTEN -- doesn't
+survive past a transaction there.
+
+The pools time every checkout into instrumentation.metrics, so /metrics
+shows how long requests wait for a connection.
+"""
+
+import os
+from time import perf_counter
+
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+
+from instrumentation import metrics
+
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+POOL_TIMEOUT = 10
+POOL_RECYCLE = 1800
+
+# connections kept back, out of DB_MAX_CONNECTIONS, for migrations, cron
+# jobs and psql
+RESERVED_CONNECTIONS = 5
+
+
+class TimedCheckout:
+    """Pool mixin: time each checkout, and count ones that time out."""
+
+    def connect(self):
+        start = perf_counter()
+        try:
+            connection = super().connect()
+        except TimeoutError:
+            metrics.observe_pool_wait(perf_counter() - start, timed_out=True)
+            raise
+        metrics.observe_pool_wait(perf_counter() - start)
+        return connection
+
+
+class TimedQueuePool(TimedCheckout, QueuePool):
+    pass
+
+
+class TimedNullPool(TimedCheckout, NullPool):
+    pass
+
+
+def pool_size_for(max_connections, workers, threads=1,
+                  reserved=RESERVED_CONNECTIONS):
+    """(pool_size, max_overflow) for each of `workers` processes.
+
+    A request holds one connection at a time, so a worker running `threads`
+    threads never needs more than `threads`: that many are kept open, as
+    far as `max_connections` (less `reserved`) allows, and the rest of a
+    worker's share can overflow.
+    """
+
+    per_worker = (max_connections - reserved) // workers
+    if per_worker < 1:
+        raise ValueError(
+            f"{max_connections} connections, less {reserved} reserved, "
+            f"can't go round {workers} workers")
+
+    pool_size = min(threads, per_worker)
+    return pool_size, per_worker - pool_size
+
+
+def env_flag(environ, name, default):
+    return environ.get(name, str(default)).lower() in ('1', 'true', 'on',
+                                                       'yes')
+
+
+def engine_options(database_url, environ=os.environ):
+    """SQLALCHEMY_ENGINE_OPTIONS for `database_url`, from DB_* variables."""
+
+    if not database_url.startswith('postgresql'):
+        # SQLite picks its own pool
+        return {}
+
+    options = {'pool_pre_ping': env_flag(environ, 'DB_POOL_PRE_PING', True)}
+
+    if env_flag(environ, 'DB_PGBOUNCER', False):
+        options['poolclass'] = TimedNullPool
+        return options
+
+    if 'DB_MAX_CONNECTIONS' in environ:
+        pool_size, max_overflow = pool_size_for(
+            int(environ['DB_MAX_CONNECTIONS']),
+            int(environ.get('WEB_CONCURRENCY', 1)),
+            int(environ.get('GUNICORN_THREADS', 1)))
+    else:
+        pool_size = int(environ.get('DB_POOL_SIZE', POOL_SIZE))
+        max_overflow = int(environ.get('DB_MAX_OVERFLOW', MAX_OVERFLOW))
+
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=float(environ.get('DB_POOL_TIMEOUT', POOL_TIMEOUT)),
+        pool_recycle=int(environ.get('DB_POOL_RECYCLE', POOL_RECYCLE)),
+    )
+
+    statement_timeout = int(environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+    if statement_timeout:
+        options['connect_args'] = {
+            'options': f'-c statement_timeout={statement_timeout}'}
+
+    return options
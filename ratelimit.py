@@ -0,0 +1,143 @@
+"""Token-bucket rate limits, per process or shared through the database.
+
+A Limit lets `burst` requests through at once and then one more every
+`interval` seconds: a bucket of `burst` tokens, refilled one per
+`interval`, each request taking one. A bucket is kept as a single time --
+when it will be full again -- which each request pushes `interval` later,
+and a request is turned away if that would put it more than `burst`
+intervals off. (This is the generic cell rate algorithm; it lets through
+exactly what the bucket would.)
+
+Backends hold the buckets. Each has take(key, limit), which takes a token
+for `key` and returns 0, or the seconds until a token is free if none is:
+
+- MemoryBackend keeps them in this process, so each worker limits on its
+  own, and a restart forgets them.
+- DatabaseBackend keeps them in the rate_limits table, so every worker
+  shares them; it costs a statement per take, and needs Postgres or
+  SQLite.
+
+Any object with the same take() can stand in for them -- say, a Redis one.
+"""
+
+from collections import namedtuple
+from threading import Lock
+from time import monotonic
+
+from sqlalchemy import delete, func, literal_column, select, text
+
+from cache import LRUCache
+from models import db, RateLimit
+
+Limit = namedtuple('Limit', 'burst interval')
+
+# buckets a MemoryBackend holds before forgetting the least recently used,
+# which leaves those keys a full bucket
+MEMORY_BUCKETS = 100000
+
+
+class MemoryBackend:
+    """Buckets in this process."""
+
+    def __init__(self, maxsize=MEMORY_BUCKETS):
+        self._full_at = LRUCache(maxsize=maxsize)
+        self._lock = Lock()
+
+    def take(self, key, limit):
+        with self._lock:
+            now = monotonic()
+            full_at = max(self._full_at.get(key, now), now) + limit.interval
+
+            wait = full_at - now - limit.burst * limit.interval
+            if wait > 0:
+                return wait
+
+            self._full_at.set(key, full_at)
+            return 0
+
+
+# the current time as SQLite keeps DateTime columns, to the millisecond
+SQLITE_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# per dialect: the current time, to compare with full_at
+NOW = {
+    'postgresql': func.now(),
+    'sqlite': literal_column(SQLITE_NOW),
+}
+
+# per dialect: ON CONFLICT ... WHERE leaves the row alone, and returns
+# nothing, when the bucket is empty
+TAKE = {
+    'postgresql': text("""
+        INSERT INTO rate_limits AS bucket (key, full_at)
+        VALUES (:key, now() + make_interval(secs => :interval))
+        ON CONFLICT (key) DO UPDATE
+        SET full_at = greatest(bucket.full_at, now())
+                      + make_interval(secs => :interval)
+        WHERE greatest(bucket.full_at, now())
+              + make_interval(secs => :interval)
+              <= now() + make_interval(secs => :window)
+        RETURNING full_at
+    """),
+    # SQLite keeps times as text, which sorts as they do; strftime()
+    # adds the seconds
+    'sqlite': text(f"""
+        INSERT INTO rate_limits AS bucket (key, full_at)
+        VALUES (:key, strftime('%Y-%m-%d %H:%M:%f', 'now',
+                               :interval || ' seconds'))
+        ON CONFLICT (key) DO UPDATE
+        SET full_at = strftime('%Y-%m-%d %H:%M:%f',
+                               max(bucket.full_at, {SQLITE_NOW}),
+                               :interval || ' seconds')
+        WHERE strftime('%Y-%m-%d %H:%M:%f',
+                       max(bucket.full_at, {SQLITE_NOW}),
+                       :interval || ' seconds')
+              <= strftime('%Y-%m-%d %H:%M:%f', 'now', :window || ' seconds')
+        RETURNING full_at
+    """),
+}
+
+# per dialect: the seconds until a bucket is full
+FULL_IN = {
+    'postgresql': func.extract('epoch', RateLimit.full_at - func.now()),
+    'sqlite': (func.julianday(RateLimit.full_at)
+               - func.julianday('now')) * 86400,
+}
+
+
+class DatabaseBackend:
+    """Buckets in the rate_limits table, shared by every worker.
+
+    Each take is its own transaction on its own connection, so it counts
+    even if the request's transaction rolls back. Works on the dialects
+    in TAKE: Postgres, and SQLite for local runs.
+    """
+
+    def take(self, key, limit):
+        window = limit.burst * limit.interval
+
+        with db.engine.begin() as conn:
+            dialect = conn.dialect.name
+            taken = conn.execute(TAKE[dialect], {'key': key,
+                                                 'interval': limit.interval,
+                                                 'window': window}).first()
+            if taken:
+                return 0
+
+            full_in = conn.scalar(
+                select(FULL_IN[dialect]).where(RateLimit.key == key))
+            return float(full_in) + limit.interval - window
+
+    def prune(self):
+        """Delete buckets that have filled up again; return how many."""
+
+        with db.engine.begin() as conn:
+            now = NOW[conn.dialect.name]
+            return conn.execute(
+                delete(RateLimit).where(RateLimit.full_at <= now)).rowcount
+
+
+BACKENDS = {
+    'memory': MemoryBackend,
+    'database': DatabaseBackend,
+}
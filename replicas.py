@@ -0,0 +1,101 @@
+"""Send read-only pages' queries to read replicas.
+
+With replicas configured (DATABASE_REPLICA_URLS, comma-separated), a
+request for a view marked @replica_reads runs its SELECTs -- in its hooks
+and templates too -- on one of them, picked at random. Everything else,
+and every write, flush and raw statement even on those pages, goes to
+the primary.
+
+Replicas lag the primary a little, so a user who has just changed
+something must not be shown the page from before: every POST, PUT,
+DELETE or other unsafe request marks the user's session to read from the
+primary for REPLICA_STICKY_SECONDS after it. Other users may see the
+change a moment late.
+"""
+
+import random
+from time import time
+
+from flask import current_app, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.selectable import CompoundSelect
+
+from pool import engine_options
+
+STICKY_SECONDS = 10
+
+# session key: read from the primary until this time
+PRIMARY_UNTIL_KEY = 'primary_until'
+
+# requests that don't write; any other may have
+SAFE_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+
+class RoutingSession(Session):
+    """A session whose SELECTs go to `info['replica']`, when it's set."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('replica')
+        if (replica is not None and bind is None and not self._flushing
+                and isinstance(clause, (Select, CompoundSelect))):
+            return replica
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind,
+                                **kwargs)
+
+
+def replica_reads(view):
+    """Mark a view as safe to serve from a replica: it only reads."""
+
+    view.replica_reads = True
+    return view
+
+
+def init_replicas(app, db):
+    """Make engines for `app`'s replicas and route requests among them.
+
+    Call this before registering views, so the routing is decided before
+    their hooks query anything.
+    """
+
+    app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+    app.config.setdefault('REPLICA_STICKY_SECONDS', STICKY_SECONDS)
+
+    replicas = [create_engine(url, **engine_options(url))
+                for url in app.config['SQLALCHEMY_REPLICA_URIS']]
+    app.extensions['replicas'] = replicas
+    if not replicas:
+        return
+
+    @app.before_request
+    def choose_database():
+        if reads_from_replica():
+            db.session.info['replica'] = random.choice(replicas)
+
+    @app.teardown_request
+    def forget_database(exc):
+        # the session outlives the request where an app context is shared,
+        # as in the tests
+        db.session.info.pop('replica', None)
+
+    @app.after_request
+    def stick_to_primary(response):
+        if request.method not in SAFE_METHODS:
+            session[PRIMARY_UNTIL_KEY] = (
+                time() + current_app.config['REPLICA_STICKY_SECONDS'])
+        return response
+
+
+def reads_from_replica():
+    """Whether this request can read from a replica."""
+
+    if request.method != 'GET':
+        return False
+
+    view = current_app.view_functions.get(request.endpoint)
+    if not getattr(view, 'replica_reads', False):
+        return False
+
+    return session.get(PRIMARY_UNTIL_KEY, 0) < time()
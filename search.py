@@ -0,0 +1,277 @@
+"""User search for the /users page.
+
+A query is split into words, and a user matches if every word begins some
+word of their username, location or bio: "jo sm" finds @john_smith.
+Results are ranked -- exact username first, then usernames starting with
+the query, then by where the words matched (username over location over
+bio) -- and capped at SEARCH_LIMIT. Queries shorter than
+MIN_QUERY_LENGTH match username prefixes only; as words they'd match
+most of the table.
+
+On Postgres this is a full-text query against ix_users_search, a GIN
+index over models.search_document(), and ix_users_username_prefix for
+short queries. Other databases (SQLite test runs) have neither, so they
+search an in-process NgramIndex instead, built on first use and kept in
+step with committed changes by session hooks.
+"""
+
+import re
+from bisect import bisect_left, insort
+from collections import defaultdict
+from threading import Lock
+
+from sqlalchemy import case, func, literal_column, select
+
+from changes import track_committed
+from models import db, search_document, User
+
+SEARCH_LIMIT = 50
+MIN_QUERY_LENGTH = 3
+
+WORD = re.compile(r'[^\W_]+')
+
+
+def words(text):
+    """Lowercased words of `text`, split as Postgres's 'simple' config does."""
+
+    return WORD.findall(text.lower()) if text else []
+
+
+def like_prefix(text):
+    """A LIKE pattern matching strings that start with `text`."""
+
+    escaped = (text.replace('\\', '\\\\')
+               .replace('%', '\\%')
+               .replace('_', '\\_'))
+    return f"{escaped}%"
+
+
+def search_users(query, limit=SEARCH_LIMIT):
+    """Return up to `limit` users matching `query`, best match first."""
+
+    query = query.strip().lower()
+    if not query:
+        return []
+
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return _search_postgres(query, limit)
+    return _search_index(query, limit)
+
+
+def _search_postgres(query, limit):
+    username = func.lower(User.username)
+    prefix = like_prefix(query)
+
+    if len(query) < MIN_QUERY_LENGTH:
+        # byte order, so one index serves both the LIKE and the ORDER BY
+        username = username.collate('C')
+        return (User.query
+                .filter(username.like(prefix))
+                .order_by(username)
+                .limit(limit)
+                .all())
+
+    terms = words(query)
+    if not terms:
+        return []
+
+    document = search_document(User.username, User.location, User.bio)
+    tsquery = func.to_tsquery(literal_column("'simple'"),
+                              ' & '.join(f"{term}:*" for term in terms))
+
+    return (User.query
+            .filter(document.op('@@')(tsquery))
+            .order_by(case((username == query, 0),
+                           (username.like(prefix), 1),
+                           else_=2),
+                      func.ts_rank(document, tsquery).desc(),
+                      User.id)
+            .limit(limit)
+            .all())
+
+
+def _search_index(query, limit):
+    if not user_index.loaded:
+        user_index.load(db.session.execute(
+            select(User.id, User.username, User.location, User.bio)))
+
+    ids = user_index.search(query, limit)
+    if not ids:
+        return []
+
+    users = {user.id: user
+             for user in User.query.filter(User.id.in_(ids)).all()}
+    return [users[user_id] for user_id in ids if user_id in users]
+
+
+class NgramIndex:
+    """In-process index of users' username/location/bio word prefixes.
+
+    Maps every prefix (edge n-gram), up to MAX_GRAM characters, of every
+    word to the ids of the users it appears for, so a search looks up one
+    set per query word and intersects them; short queries instead bisect
+    a sorted list of usernames. Same matching and ranking as the Postgres
+    query in _search_postgres().
+    """
+
+    MAX_GRAM = 12
+
+    # how much a word matching in each field counts, as ts_rank weighs
+    # A/B/C; fields are (username, location, bio)
+    WEIGHTS = (1.0, 0.4, 0.2)
+
+    def __init__(self):
+        self.loaded = False
+        self._postings = defaultdict(set)
+        self._fields = {}
+        self._usernames = []
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._fields)
+
+    def load(self, rows):
+        """Index every (id, username, location, bio) row in `rows`."""
+
+        with self._lock:
+            for user_id, username, location, bio in rows:
+                self._discard(user_id)
+                self._usernames.append(self._index(user_id, username,
+                                                   location, bio))
+            self._usernames.sort()
+            self.loaded = True
+
+    def clear(self):
+        """Forget everything; the next search reloads."""
+
+        with self._lock:
+            self._postings.clear()
+            self._fields.clear()
+            self._usernames.clear()
+            self.loaded = False
+
+    def _grams(self, fields):
+        for field in fields:
+            for word in field:
+                for n in range(1, min(len(word), self.MAX_GRAM) + 1):
+                    yield word[:n]
+
+    def add(self, user_id, username, location, bio):
+        """Index (or re-index) one user."""
+
+        with self._lock:
+            self._discard(user_id)
+            insort(self._usernames,
+                   self._index(user_id, username, location, bio))
+
+    def _index(self, user_id, username, location, bio):
+        username = (username or '').lower()
+        fields = (words(username), words(location), words(bio))
+
+        self._fields[user_id] = (username, fields)
+        for gram in self._grams(fields):
+            self._postings[gram].add(user_id)
+
+        return (username, user_id)
+
+    def remove(self, user_id):
+        """Drop one user from the index."""
+
+        with self._lock:
+            self._discard(user_id)
+
+    def _discard(self, user_id):
+        entry = self._fields.pop(user_id, None)
+        if entry is None:
+            return
+
+        username, fields = entry
+        del self._usernames[bisect_left(self._usernames, (username, user_id))]
+
+        for gram in set(self._grams(fields)):
+            postings = self._postings[gram]
+            postings.discard(user_id)
+            if not postings:
+                del self._postings[gram]
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Return the ids of up to `limit` users matching `query`, ranked."""
+
+        query = query.strip().lower()
+
+        with self._lock:
+            if len(query) < MIN_QUERY_LENGTH:
+                return self._search_usernames(query, limit)
+
+            terms = words(query)
+            if not terms:
+                return []
+
+            candidates = set.intersection(*[
+                self._postings.get(term[:self.MAX_GRAM], set())
+                for term in terms])
+
+            ranked = []
+            for user_id in candidates:
+                username, fields = self._fields[user_id]
+                score = 0
+                for term in terms:
+                    weights = [weight for field, weight
+                               in zip(fields, self.WEIGHTS)
+                               if any(w.startswith(term) for w in field)]
+                    if not weights:
+                        break
+                    score += max(weights)
+                else:
+                    ranked.append(((0 if username == query else
+                                    1 if username.startswith(query) else
+                                    2),
+                                   -score, user_id))
+
+        ranked.sort()
+        return [user_id for *key, user_id in ranked[:limit]]
+
+    def _search_usernames(self, query, limit):
+        found = []
+        start = bisect_left(self._usernames, (query,))
+
+        for username, user_id in self._usernames[start:start + limit]:
+            if not username.startswith(query):
+                break
+            found.append(user_id)
+
+        return found
+
+
+user_index = NgramIndex()
+
+
+def collect_search_changes(session, changes):
+    """Note users whose searchable text this flush changed."""
+
+    if not user_index.loaded:
+        return
+
+    for obj in session.new | session.dirty:
+        if isinstance(obj, User):
+            changes[obj.id] = (obj.username, obj.location, obj.bio)
+
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            changes[db.inspect(obj).identity[0]] = None
+
+
+def apply_search_changes(changes):
+    """Once the changes are committed, update the in-process index."""
+
+    for user_id, fields in changes.items():
+        if fields is None:
+            user_index.remove(user_id)
+        else:
+            user_index.add(user_id, *fields)
+
+
+# a bulk write clears the index, which is rebuilt on next use
+track_committed('search_changes', collect_search_changes,
+                apply_search_changes, pending=dict, model=User,
+                on_bulk=user_index.clear)
@@ -1,20 +1,277 @@
-"""Seed database with sample data from CSV Files."""
+"""Seed database with sample data from CSV Files.
 
-from csv import DictReader
-from app import db
-from models import User, Message, Follows
+    python seed.py [--data generator] [--batch-rows 50000]
 
+Loads the users, messages, follows and likes CSVs that
+generator/create_csvs.py writes -- whole, or split into chunks -- reading
+and inserting a batch of rows at a time, so memory use doesn't grow with
+the data. On Postgres each batch goes in with COPY ... FROM STDIN, and
+indexes and primary key, unique and foreign key constraints are dropped
+for the load and rebuilt once at the end, which is far faster than
+maintaining them row by row. Other databases (SQLite) get plain executemany INSERTs.
+Prints rows/sec for each table.
+"""
 
-db.drop_all()
-db.create_all()
+import argparse
+import csv
+import glob
+import io
+import os
+from datetime import datetime
+from time import perf_counter
 
-with open('generator/users.csv') as users:
-    db.session.bulk_insert_mappings(User, DictReader(users))
+from flask_migrate import stamp
+from sqlalchemy import func, insert, select, text
 
-with open('generator/messages.csv') as messages:
-    db.session.bulk_insert_mappings(Message, DictReader(messages))
+from app import create_app
+from models import db, User, Message, Follows, Likes
+from snowflake import MAX_SEQUENCE, id_from_datetime
+from counters import reconcile_counters
+from timelines import rebuild_timelines
 
-with open('generator/follows.csv') as follows:
-    db.session.bulk_insert_mappings(Follows, DictReader(follows))
+# where each message ended up, by its row in messages.csv, so likes.csv
+# (which refers to messages by row) can be joined to message ids
+staging = db.MetaData()
 
-db.session.commit()
+message_rows = db.Table(
+    'message_rows', staging,
+    db.Column('message_row', db.BigInteger),
+    db.Column('message_id', db.BigInteger),
+    prefixes=['TEMPORARY'],
+)
+
+like_rows = db.Table(
+    'like_rows', staging,
+    db.Column('user_id', db.Integer),
+    db.Column('message_row', db.BigInteger),
+    prefixes=['TEMPORARY'],
+)
+
+DEFERRED_CONSTRAINTS = text("""
+    SELECT conrelid::regclass::text AS table_name, conname AS name,
+           pg_get_constraintdef(oid) AS definition
+    FROM pg_constraint
+    WHERE contype IN ('f', 'p', 'u')
+      AND conrelid = ANY(CAST(:tables AS regclass[]))
+    ORDER BY contype = 'f' DESC
+""")
+
+DEFERRED_INDEXES = text("""
+    SELECT indexrelid::regclass::text AS name,
+           pg_get_indexdef(indexrelid) AS definition
+    FROM pg_index
+    WHERE indrelid = ANY(CAST(:tables AS regclass[]))
+      AND NOT EXISTS (SELECT FROM pg_constraint WHERE conindid = indexrelid)
+""")
+
+
+def read_csv(directory, name, fields):
+    """Yield tuples of `fields` from `name`.csv, or its chunks in order."""
+
+    paths = (glob.glob(os.path.join(directory, f"{name}.csv")) or
+             sorted(glob.glob(os.path.join(directory, f"{name}.*.csv"))))
+
+    for path in paths:
+        with open(path, newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            columns = [header.index(field) for field in fields]
+            for row in reader:
+                yield tuple(row[i] or None for i in columns)
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load(conn, table, columns, rows, batch_rows):
+    """Insert `rows`, tuples of `columns`, into `table`; return how many."""
+
+    count = 0
+
+    if conn.dialect.name == 'postgresql':
+        cursor = conn.connection.cursor()
+        copy = (f"COPY {table.name} ({', '.join(columns)}) "
+                "FROM STDIN WITH (FORMAT csv)")
+
+        for batch in batches(rows, batch_rows):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(batch)
+            buffer.seek(0)
+            cursor.copy_expert(copy, buffer)
+            count += len(batch)
+
+    else:
+        for batch in batches(rows, batch_rows):
+            conn.execute(insert(table),
+                         [dict(zip(columns, row)) for row in batch])
+            count += len(batch)
+
+    return count
+
+
+def drop_deferred(conn):
+    """Drop indexes and constraints; return the DDL to rebuild them."""
+
+    tables = '{' + ','.join(db.metadata.tables) + '}'
+    rebuild = []
+
+    for table_name, name, definition in conn.execute(DEFERRED_CONSTRAINTS,
+                                                     {'tables': tables}):
+        conn.execute(text(f'ALTER TABLE {table_name} DROP CONSTRAINT "{name}"'))
+        # foreign keys come first here, so last when rebuilding
+        rebuild.insert(0, f'ALTER TABLE {table_name} '
+                          f'ADD CONSTRAINT "{name}" {definition}')
+
+    for name, definition in conn.execute(DEFERRED_INDEXES,
+                                         {'tables': tables}).all():
+        conn.execute(text(f'DROP INDEX "{name}"'))
+        rebuild.insert(0, definition)
+
+    return rebuild
+
+
+def reset_sequences(conn):
+    """Move serial ids past the rows loaded with explicit ids."""
+
+    for table in db.metadata.sorted_tables:
+        if 'id' in table.c and table.c.id.primary_key:
+            conn.execute(
+                select(func.setval(
+                    func.pg_get_serial_sequence(table.name, 'id'),
+                    func.coalesce(func.max(table.c.id), 0) + 1,
+                    False))
+                .select_from(table))
+
+
+def users(directory):
+    fields = ('email', 'username', 'image_url', 'password', 'bio',
+              'header_image_url', 'location')
+    for user_id, row in enumerate(read_csv(directory, 'users', fields), 1):
+        yield (user_id, *row)
+
+
+def messages(directory):
+    """(row, id, text, timestamp, user_id) for each message.
+
+    Ids are made from the timestamps, so they sort by time.
+    """
+
+    fields = ('text', 'timestamp', 'user_id')
+    for row, (body, timestamp, user_id) in enumerate(
+            read_csv(directory, 'messages', fields), 1):
+        timestamp = datetime.fromisoformat(timestamp)
+        message_id = id_from_datetime(timestamp,
+                                      sequence=(row - 1) & MAX_SEQUENCE)
+        yield row, message_id, body, timestamp, user_id
+
+
+def timed(title, run):
+    start = perf_counter()
+    count = run()
+    seconds = perf_counter() - start
+
+    if count is None:
+        print(f"{title:<24} {seconds:8.1f}s")
+    else:
+        print(f"{title:<24} {seconds:8.1f}s {count:>12,} rows "
+              f"{count / max(seconds, 1e-9):>12,.0f} rows/s")
+
+
+def seed(directory, batch_rows):
+    db.drop_all()
+    db.create_all()
+
+    # create_all() built the current schema; tell migrations it's up to date
+    stamp()
+
+    conn = db.session.connection()
+    postgres = conn.dialect.name == 'postgresql'
+    staging.create_all(conn)
+
+    rebuild = drop_deferred(conn) if postgres else []
+
+    timed("users", lambda: load(
+        conn, User.__table__,
+        ('id', 'email', 'username', 'image_url', 'password', 'bio',
+         'header_image_url', 'location'),
+        users(directory), batch_rows))
+
+    def load_messages():
+        count = 0
+        for batch in batches(messages(directory), batch_rows):
+            load(conn, Message.__table__,
+                 ('id', 'text', 'timestamp', 'user_id'),
+                 [message[1:] for message in batch], batch_rows)
+            load(conn, message_rows, ('message_row', 'message_id'),
+                 [message[:2] for message in batch], batch_rows)
+            count += len(batch)
+        return count
+
+    timed("messages", load_messages)
+
+    timed("follows", lambda: load(
+        conn, Follows.__table__,
+        ('user_being_followed_id', 'user_following_id'),
+        read_csv(directory, 'follows',
+                 ('user_being_followed_id', 'user_following_id')),
+        batch_rows))
+
+    def load_likes():
+        load(conn, like_rows, ('user_id', 'message_row'),
+             read_csv(directory, 'likes', ('user_id', 'message_row')),
+             batch_rows)
+        return conn.execute(insert(Likes.__table__).from_select(
+            ['user_id', 'message_id'],
+            select(like_rows.c.user_id, message_rows.c.message_id)
+            .join(message_rows,
+                  message_rows.c.message_row == like_rows.c.message_row)
+        )).rowcount
+
+    timed("likes", load_likes)
+
+    staging.drop_all(conn)
+
+    # bulk loads skip the session hooks that fan messages out to followers
+    # and keep users' counters; timelines are built before the constraints
+    # come back, so their foreign keys are checked once, not per row
+    if postgres:
+        conn.execute(text("ANALYZE"))
+    timed("timelines", rebuild_timelines)
+
+    if postgres:
+        def rebuild_deferred():
+            conn.execute(text("SET LOCAL maintenance_work_mem = '512MB'"))
+            for statement in rebuild:
+                conn.execute(text(statement))
+            reset_sequences(conn)
+            conn.execute(text("ANALYZE"))
+
+        timed("indexes, constraints", rebuild_deferred)
+
+    # counting needs the indexes back
+    timed("counters", reconcile_counters)
+
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default='generator',
+                        help="directory holding the CSVs")
+    parser.add_argument('--batch-rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        timed("total", lambda: seed(args.data, args.batch_rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Time-ordered 64-bit ids ("snowflakes") for messages.
+
+An id packs, from the high bits down:
+
+    41 bits  milliseconds since EPOCH (enough until 2079)
+    10 bits  worker number
+    12 bits  sequence number within the millisecond
+
+so ordering messages by id orders them by when they were posted, and a
+feed can sort and page by the primary key alone instead of by timestamp
+with id to break ties.
+
+Ids are minted in-process, without a trip to a database sequence. Every
+process writing at the same time needs its own worker number for them to
+stay unique, so the production profile won't start without
+WARBLER_WORKER_ID (gunicorn.conf.py gives each of a server's workers its
+own). Elsewhere each process falls back on its pid.
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from time import time_ns
+
+# naive UTC, like the timestamps in models.py
+EPOCH = datetime(2010, 1, 1)
+
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+
+MAX_WORKER = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+EPOCH_NS = int(EPOCH.replace(tzinfo=timezone.utc).timestamp()) * 10**9
+
+
+def make_id(ms, worker=0, sequence=0):
+    """Pack milliseconds since EPOCH, worker and sequence into an id."""
+
+    return (ms << (WORKER_BITS + SEQUENCE_BITS)
+            | worker << SEQUENCE_BITS
+            | sequence)
+
+
+def id_from_datetime(when, worker=0, sequence=0):
+    """Return an id for something created at `when` (naive UTC)."""
+
+    return make_id((when - EPOCH) // timedelta(milliseconds=1),
+                   worker, sequence)
+
+
+def datetime_from_id(snowflake):
+    """Return when (naive UTC, to the millisecond) an id was made."""
+
+    return EPOCH + timedelta(
+        milliseconds=snowflake >> (WORKER_BITS + SEQUENCE_BITS))
+
+
+def default_worker():
+    """This process's worker number: WARBLER_WORKER_ID, else the pid."""
+
+    worker = os.environ.get('WARBLER_WORKER_ID')
+    if worker is None:
+        return os.getpid() & MAX_WORKER
+    return int(worker) & MAX_WORKER
+
+
+class SnowflakeGenerator:
+    """Callable that returns a new, strictly increasing id on each call.
+
+    Up to 4096 ids a millisecond; past that, or if the clock steps back,
+    ids borrow the next millisecond rather than wait or repeat.
+    """
+
+    def __init__(self, worker=None, clock=time_ns):
+        self.worker = default_worker() if worker is None else worker
+        self._clock = clock
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = Lock()
+
+    def __call__(self):
+        with self._lock:
+            ms = (self._clock() - EPOCH_NS) // 1_000_000
+
+            if ms > self._last_ms:
+                self._sequence = 0
+            elif self._sequence < MAX_SEQUENCE:
+                ms = self._last_ms
+                self._sequence += 1
+            else:
+                ms = self._last_ms + 1
+                self._sequence = 0
+
+            self._last_ms = ms
+            return make_id(ms, self.worker, self._sequence)
+
+
+next_message_id = SnowflakeGenerator()
+
+
+def _reset_worker():
+    # a forked worker (gunicorn --preload, ...) would otherwise share its
+    # parent's pid-derived worker number
+    next_message_id.worker = default_worker()
+
+
+os.register_at_fork(after_in_child=_reset_worker)
@@ -0,0 +1,87 @@
+"""Feed pages sent as they're rendered.
+
+render_template() builds a whole page before the first byte goes out,
+so a feed of a hundred cards kept the browser waiting on the query and
+every card, and held the page in memory. stream_page() sends it as
+Jinja renders it instead:
+
+    return stream_page('home.html', messages=home_feed(..., stream=True))
+
+Templates call {{ flush() }} where what's rendered so far should go out
+straight away -- after the nav and sidebar, before the message list --
+and otherwise the page goes out in STREAM_CHUNK_SIZE pieces. With a
+streamed feed (see pagination.StreamedPage) the messages are read from
+a server-side cursor as the list is rendered, so the head is sent
+before the feed query has even run. Under render_template(), flush()
+does nothing.
+
+The response's headers, session cookie included, are sent before the
+body is rendered, so stream_page() takes the flashed messages base.html
+shows out of the session first; anything else a template does to the
+session wouldn't be saved. An error partway through can't become an
+error page, either: the page just stops.
+"""
+
+from flask import current_app, get_flashed_messages, stream_template
+from markupsafe import Markup
+
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# where flush() was called, in the stream of what Jinja renders
+FLUSH = '<!-- flush -->'
+
+
+def flush():
+    """Send what's rendered so far; a no-op unless streaming."""
+
+    return ''
+
+
+def flush_marker():
+    return Markup(FLUSH)
+
+
+def chunked(pieces, size):
+    """Join Jinja's many small `pieces` into chunks of about `size`,
+    breaking wherever the template called flush()."""
+
+    try:
+        buffer = []
+        buffered = 0
+        for piece in pieces:
+            if piece == FLUSH:
+                if buffer:
+                    yield ''.join(buffer)
+                    buffer = []
+                    buffered = 0
+                continue
+
+            buffer.append(piece)
+            buffered += len(piece)
+            if buffered >= size:
+                yield ''.join(buffer)
+                buffer = []
+                buffered = 0
+
+        if buffer:
+            yield ''.join(buffer)
+    finally:
+        # ends the request context stream_template() keeps open
+        pieces.close()
+
+
+def stream_page(template_name, **context):
+    """A response that renders `template_name` as it's sent."""
+
+    # the session goes out with the headers, before base.html reads it
+    get_flashed_messages()
+
+    pieces = stream_template(template_name, flush=flush_marker, **context)
+    return current_app.response_class(
+        chunked(pieces, current_app.config['STREAM_CHUNK_SIZE']),
+        mimetype='text/html')
+
+
+def init_streaming(app):
+    app.config.setdefault('STREAM_CHUNK_SIZE', STREAM_CHUNK_SIZE)
+    app.add_template_global(flush)
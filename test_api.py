@@ -0,0 +1,217 @@
+"""JSON API tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_api.py
+
+
+import json
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Likes, Timeline
+from app import create_app, CURR_USER_KEY
+
+app = create_app('test')
+app_context = app.app_context()
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+class APITestCase(TestCase):
+    """Test the /api/v1 endpoints."""
+
+    def setUp(self):
+        db.session.rollback()
+        Likes.query.delete()
+        Timeline.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        author = User.signup(username="author", email="a@test.com",
+                             password="password", image_url=None)
+        reader = User.signup(username="reader", email="r@test.com",
+                             password="password", image_url=None)
+        db.session.commit()
+        self.author_id = author.id
+        self.reader_id = reader.id
+
+        db.session.add(Follows(user_being_followed_id=self.author_id,
+                               user_following_id=self.reader_id))
+        db.session.commit()
+
+        messages = [Message(text=f"Warble {i}", user_id=self.author_id)
+                    for i in range(5)]
+        db.session.add_all(messages)
+        db.session.commit()
+        self.message_ids = [msg.id for msg in messages]
+
+        self.client = app.test_client()
+        self.login(self.reader_id)
+
+    def login(self, user_id):
+        with self.client.session_transaction() as sess:
+            sess.pop(CURR_USER_KEY, None)
+            if user_id is not None:
+                sess[CURR_USER_KEY] = user_id
+
+    def get(self, url, status=200):
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, status, resp.data)
+        self.assertEqual(resp.content_type, 'application/json')
+        return resp.get_json()
+
+    def test_timeline(self):
+        body = self.get("/api/v1/timeline")
+
+        self.assertEqual([msg['id'] for msg in body['data']],
+                         [str(msg_id) for msg_id in self.message_ids[::-1]])
+        self.assertIsNone(body['next_cursor'])
+
+        msg = body['data'][0]
+        self.assertEqual(msg['text'], "Warble 4")
+        self.assertEqual(msg['user'], {'id': self.author_id,
+                                       'username': "author",
+                                       'image_url': msg['user']['image_url']})
+        self.assertFalse(msg['liked'])
+        self.assertIn('timestamp', msg)
+
+    def test_cursor(self):
+        """Does following next_cursor walk the whole feed, once?"""
+
+        url = f"/api/v1/users/{self.author_id}/messages?limit=2"
+        ids = []
+        while url:
+            body = self.get(url)
+            ids.extend(msg['id'] for msg in body['data'])
+            url = (f"/api/v1/users/{self.author_id}/messages?limit=2"
+                   f"&before={body['next_cursor']}"
+                   if body['next_cursor'] else None)
+
+        self.assertEqual(ids, [str(msg_id) for msg_id in
+                               self.message_ids[::-1]])
+
+    def test_message_ids(self):
+        """Do 64-bit message ids survive a client that reads numbers as
+        doubles, as JavaScript does?"""
+
+        msg_id = self.message_ids[0]
+        resp = self.client.get(f"/api/v1/messages/{msg_id}")
+        body = json.loads(resp.data, parse_int=float)
+        self.assertEqual(int(body['data']['id']), msg_id)
+
+        resp = self.client.get("/api/v1/timeline")
+        body = json.loads(resp.data, parse_int=float)
+        self.assertEqual([int(msg['id']) for msg in body['data']],
+                         self.message_ids[::-1])
+
+    def test_fields(self):
+        body = self.get("/api/v1/timeline?fields[message]=id,user"
+                        "&fields[user]=username")
+        self.assertEqual(body['data'][0], {'id': str(self.message_ids[-1]),
+                                           'user': {'username': "author"}})
+
+        body = self.get(f"/api/v1/users/{self.author_id}"
+                        "?fields[user]=username,followers_count,following")
+        self.assertEqual(body['data'], {'username': "author",
+                                        'followers_count': 1,
+                                        'following': True})
+
+    def test_bad_requests(self):
+        body = self.get("/api/v1/timeline?fields[message]=id,nope", 400)
+        self.assertIn("nope", body['message'])
+        self.get("/api/v1/timeline?limit=0", 400)
+        self.get("/api/v1/timeline?limit=abc", 400)
+        self.get("/api/v1/timeline?limit=-1", 400)
+        self.get("/api/v1/timeline?before=garbage", 400)
+        # a card's author has only the fields its card loads
+        self.get("/api/v1/timeline?fields[user]=bio", 400)
+
+        body = self.get("/api/v1/users/0", 404)
+        self.assertEqual(body['error'], "Not Found")
+
+    def test_unknown_paths(self):
+        """Are paths and methods the API doesn't have JSON errors too?"""
+
+        self.assertEqual(self.get("/api/v1/nope", 404)['error'],
+                         "Not Found")
+        self.get("/api/v1", 404)
+
+        resp = self.client.post(f"/api/v1/messages/{self.message_ids[0]}")
+        self.assertEqual(resp.status_code, 405)
+        self.assertEqual(resp.get_json()['error'], "Method Not Allowed")
+
+        # the site's own pages are as they were
+        resp = self.client.get("/nope")
+        self.assertIn("Page not found", resp.get_data(as_text=True))
+        resp = self.client.put("/signup")
+        self.assertEqual(resp.status_code, 405)
+        self.assertEqual(resp.content_type, 'text/html; charset=utf-8')
+
+    def test_login_required(self):
+        self.login(None)
+        self.assertEqual(self.get("/api/v1/timeline", 401)['error'],
+                         "Unauthorized")
+        self.get(f"/api/v1/users/{self.author_id}/followers", 401)
+        self.assertEqual(self.client.put(
+            f"/api/v1/users/{self.author_id}/follow").status_code, 401)
+
+        # public, as on the site
+        self.get(f"/api/v1/users/{self.author_id}")
+        self.get(f"/api/v1/users/{self.author_id}/messages")
+        self.get(f"/api/v1/messages/{self.message_ids[0]}")
+
+    def test_like(self):
+        url = f"/api/v1/messages/{self.message_ids[0]}/like"
+
+        for _ in range(2):
+            self.assertEqual(self.client.put(url).status_code, 204)
+        self.assertEqual(Likes.query.filter_by(user_id=self.reader_id)
+                         .count(), 1)
+
+        body = self.get(f"/api/v1/users/{self.reader_id}/likes")
+        self.assertEqual([msg['id'] for msg in body['data']],
+                         [str(self.message_ids[0])])
+        self.assertTrue(body['data'][0]['liked'])
+
+        for _ in range(2):
+            self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(Likes.query.filter_by(user_id=self.reader_id)
+                         .count(), 0)
+
+    def test_follow(self):
+        url = f"/api/v1/users/{self.author_id}/follow"
+
+        for _ in range(2):
+            self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(
+            self.get(f"/api/v1/users/{self.reader_id}/following")['data'],
+            [])
+        # the timeline is rebuilt without their messages
+        self.assertEqual(self.get("/api/v1/timeline")['data'], [])
+
+        for _ in range(2):
+            self.assertEqual(self.client.put(url).status_code, 204)
+        following = self.get(f"/api/v1/users/{self.reader_id}/following")
+        self.assertEqual([user['id'] for user in following['data']],
+                         [self.author_id])
+        followers = self.get(f"/api/v1/users/{self.author_id}/followers")
+        self.assertEqual([user['username'] for user in followers['data']],
+                         ["reader"])
+        self.assertEqual(len(self.get("/api/v1/timeline")['data']), 5)
+
+    def test_revalidate(self):
+        url = f"/api/v1/users/{self.author_id}"
+        first = self.client.get(url)
+        self.assertTrue(first.headers['ETag'].startswith('W/"'))
+
+        again = self.client.get(
+            url, headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(again.status_code, 304)
@@ -0,0 +1,227 @@
+"""Static asset build tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_assets.py
+
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+from models import db
+from app import create_app
+from assets import (BUILD_DIR, MANIFEST, VENDOR, asset_url, brotli,
+                    build_assets, load_manifest, vendor_assets)
+from http_caching import IMMUTABLE
+
+app = create_app('test')
+app_context = app.app_context()
+
+STYLE = """body { background: url("/static/images/bg.png"); }
+.logo { background: url('../images/logo.png?x=1'); }
+.cdn { background: url(https://example.com/a.png); }
+""" * 20
+SCRIPT = "console.log('warble');\n" * 100
+# the one vendored file the tests write
+VENDORED = ['vendor/jquery/jquery.min.js']
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+class BuildTestCase(TestCase):
+    """Test building and serving fingerprinted, compressed assets."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.write('stylesheets/style.css', STYLE.encode())
+        self.write('images/bg.png', b'\x89PNG bg')
+        self.write('images/logo.png', b'\x89PNG logo')
+        self.write('vendor/jquery/jquery.min.js', SCRIPT.encode())
+
+        self.static_folder = app.static_folder
+        app.static_folder = self.folder
+        self.manifest = build_assets(self.folder, required=VENDORED)
+        load_manifest(app)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.static_folder = self.static_folder
+        load_manifest(app)
+        shutil.rmtree(self.folder)
+
+    def write(self, filename, data):
+        path = os.path.join(self.folder, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(data)
+
+    def script_url(self):
+        built = self.manifest['files']['vendor/jquery/jquery.min.js']
+        return '/static/' + built
+
+    def read(self, filename):
+        with open(os.path.join(self.folder, filename), 'rb') as file:
+            return file.read()
+
+    def test_manifest(self):
+        files = self.manifest['files']
+        self.assertEqual(set(files), {'stylesheets/style.css',
+                                      'images/bg.png', 'images/logo.png',
+                                      'vendor/jquery/jquery.min.js'})
+        self.assertRegex(files['images/bg.png'],
+                         r'^dist/images/bg\.[0-9a-f]{12}\.png$')
+        self.assertEqual(self.read(files['images/bg.png']), b'\x89PNG bg')
+
+        with open(os.path.join(self.folder, BUILD_DIR, MANIFEST)) as file:
+            self.assertEqual(json.load(file), self.manifest)
+
+    def test_rebuild(self):
+        """Does a changed file get a new name, and the build nothing old?"""
+
+        old = self.manifest['files']['images/bg.png']
+        self.write('images/bg.png', b'\x89PNG new bg')
+        manifest = build_assets(self.folder, required=VENDORED)
+
+        new = manifest['files']['images/bg.png']
+        self.assertNotEqual(new, old)
+        self.assertFalse(os.path.exists(os.path.join(self.folder, old)))
+        self.assertNotIn('dist/', ' '.join(manifest['files']))
+
+    def test_missing_vendor_files(self):
+        """Does the build fail, rather than leave pages on the CDNs?"""
+
+        with self.assertRaisesRegex(RuntimeError, "vendor-assets"):
+            build_assets(self.folder)
+        # the last build is left as it was
+        self.assertTrue(os.path.exists(os.path.join(
+            self.folder, self.manifest['files']['images/bg.png'])))
+
+        for filename in VENDOR:
+            if filename not in VENDORED:
+                self.write(filename, b'vendored')
+        self.assertEqual(len(build_assets(self.folder)['files']),
+                         len(VENDOR) + 3)
+
+    def test_css_urls(self):
+        """Do stylesheets point at the built files they use?"""
+
+        files = self.manifest['files']
+        css = self.read(files['stylesheets/style.css']).decode()
+
+        bg = os.path.basename(files['images/bg.png'])
+        logo = os.path.basename(files['images/logo.png'])
+        self.assertIn(f'url("../images/{bg}")', css)
+        self.assertIn(f"url('../images/{logo}?x=1')", css)
+        self.assertIn('url(https://example.com/a.png)', css)
+
+    def test_compressed(self):
+        built = self.manifest['files']['vendor/jquery/jquery.min.js']
+        self.assertIn('gzip', self.manifest['encodings'][built])
+        self.assertEqual(gzip.decompress(self.read(built + '.gz')),
+                         SCRIPT.encode())
+
+        # images are compressed already
+        self.assertNotIn(self.manifest['files']['images/bg.png'],
+                         self.manifest['encodings'])
+
+    @skipUnless(brotli, "brotli isn't installed")
+    def test_brotli(self):
+        built = self.manifest['files']['vendor/jquery/jquery.min.js']
+        self.assertIn('br', self.manifest['encodings'][built])
+        self.assertEqual(brotli.decompress(self.read(built + '.br')),
+                         SCRIPT.encode())
+
+    def test_asset_url(self):
+        with app.test_request_context():
+            self.assertEqual(asset_url('images/bg.png'),
+                             '/static/' + self.manifest['files']
+                             ['images/bg.png'])
+
+            # not built yet
+            self.write('images/new.png', b'\x89PNG')
+            self.assertIn('/static/images/new.png?v=',
+                          asset_url('images/new.png'))
+
+    def test_vendored(self):
+        """Are the vendored files committed, so pages never use a CDN?"""
+
+        for filename in VENDOR:
+            with self.subTest(filename=filename):
+                self.assertTrue(os.path.isfile(
+                    os.path.join(self.static_folder, filename)))
+
+    def test_serve_gzip(self):
+        resp = self.client.get(self.script_url(),
+                               headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertIn('javascript', resp.headers['Content-Type'])
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+        self.assertEqual(resp.headers['Cache-Control'], IMMUTABLE)
+        self.assertEqual(gzip.decompress(resp.data), SCRIPT.encode())
+        resp.close()
+
+    @skipUnless(brotli, "brotli isn't installed")
+    def test_serve_brotli(self):
+        resp = self.client.get(self.script_url(),
+                               headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(resp.headers['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(resp.data), SCRIPT.encode())
+        resp.close()
+
+    def test_serve_identity(self):
+        resp = self.client.get(self.script_url(),
+                               headers={'Accept-Encoding': 'identity'})
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+        self.assertEqual(resp.data, SCRIPT.encode())
+        resp.close()
+
+
+class VendorTestCase(TestCase):
+    """Test downloading vendored files against their pinned hashes."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.served = {'https://cdn.test/a.js': b'a',
+                       'https://cdn.test/b.js': b'b'}
+        self.pins = {
+            f'vendor/{name}': (url, hashlib.sha256(data).hexdigest())
+            for name, (url, data) in zip(('a.js', 'b.js'),
+                                         self.served.items())}
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def vendor(self):
+        with patch.dict('assets.VENDOR', self.pins, clear=True), \
+                patch('urllib.request.urlopen',
+                      lambda url: io.BytesIO(self.served[url])):
+            return vendor_assets(self.folder)
+
+    def test_pinned(self):
+        self.assertEqual(self.vendor(), ['vendor/a.js', 'vendor/b.js'])
+        with open(os.path.join(self.folder, 'vendor/b.js'), 'rb') as file:
+            self.assertEqual(file.read(), b'b')
+
+    def test_mismatch(self):
+        """Does a changed download fail, writing nothing?"""
+
+        self.served['https://cdn.test/b.js'] = b'tampered'
+        with self.assertRaisesRegex(RuntimeError, "vendor/b.js"):
+            self.vendor()
+        self.assertFalse(os.path.exists(os.path.join(self.folder, 'vendor')))
@@ -0,0 +1,231 @@
+"""Login rate limit and unknown-username cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_auth.py
+
+
+from datetime import timedelta
+from time import perf_counter
+from unittest import TestCase
+from unittest.mock import patch
+
+from flask import Flask
+
+from models import db, User, RateLimit
+from app import create_app
+from auth import authenticate, init_login_limits, unknown_usernames
+from config import TestConfig
+from passwords import hasher
+from ratelimit import DatabaseBackend, Limit, MemoryBackend
+
+app = create_app('test')
+app_context = app.app_context()
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+class BackendTests:
+    """Tests every backend must pass; mixed into a TestCase per backend."""
+
+    def test_burst(self):
+        limit = Limit(burst=3, interval=10)
+
+        self.assertEqual([self.backend.take('a', limit) for _ in range(3)],
+                         [0, 0, 0])
+        wait = self.backend.take('a', limit)
+        self.assertGreater(wait, 9)
+        self.assertLessEqual(wait, 10)
+
+        # other keys have their own buckets
+        self.assertEqual(self.backend.take('b', limit), 0)
+
+
+class MemoryBackendTestCase(BackendTests, TestCase):
+
+    def setUp(self):
+        self.backend = MemoryBackend()
+
+    def test_refill(self):
+        limit = Limit(burst=2, interval=10)
+
+        with patch('ratelimit.monotonic', return_value=1000):
+            self.backend.take('a', limit)
+            self.backend.take('a', limit)
+            self.assertEqual(self.backend.take('a', limit), 10)
+
+        with patch('ratelimit.monotonic', return_value=1010):
+            self.assertEqual(self.backend.take('a', limit), 0)
+            self.assertEqual(self.backend.take('a', limit), 10)
+
+
+class DatabaseBackendTestCase(BackendTests, TestCase):
+
+    def setUp(self):
+        RateLimit.query.delete()
+        db.session.commit()
+        self.backend = DatabaseBackend()
+
+    def rewind(self, key, seconds):
+        """Move `key`'s bucket on `seconds`, as if they had passed."""
+
+        bucket = db.session.get(RateLimit, key)
+        bucket.full_at -= timedelta(seconds=seconds)
+        db.session.commit()
+
+    def test_refill(self):
+        limit = Limit(burst=2, interval=10)
+        self.backend.take('a', limit)
+        self.backend.take('a', limit)
+
+        self.rewind('a', 10)
+        self.assertEqual(self.backend.take('a', limit), 0)
+        self.assertTrue(self.backend.take('a', limit))
+
+    def test_prune(self):
+        limit = Limit(burst=1, interval=10)
+        self.backend.take('a', limit)
+        self.backend.take('b', limit)
+
+        self.rewind('b', 10)
+        self.assertEqual(self.backend.prune(), 1)
+        self.assertEqual(db.session.scalars(db.select(RateLimit.key)).all(),
+                         ['a'])
+        db.session.commit()
+
+    def test_unsupported_database(self):
+        """Is a database it has no statements for refused up front?"""
+        other = Flask(__name__)
+        other.config.update(RATE_LIMIT_BACKEND='database',
+                            SQLALCHEMY_DATABASE_URI='mysql://localhost/w')
+
+        with self.assertRaisesRegex(RuntimeError, "mysql"):
+            init_login_limits(other)
+
+
+class LoginLimitTestCase(TestCase):
+    """Test that /login stops checking passwords past the limits."""
+
+    def setUp(self):
+        db.session.rollback()
+        User.query.delete()
+        User.signup(username="testuser", email="test@test.com",
+                    password="secret", image_url=None)
+        db.session.commit()
+
+        limiter = app.extensions['login_limiter']
+        limiter.backend = MemoryBackend()
+        self.client = app.test_client()
+
+    def log_in(self, username="testuser", password="wrong!", ip='10.0.0.1',
+               headers=None):
+        return self.client.post('/login',
+                                data={'username': username,
+                                      'password': password},
+                                environ_base={'REMOTE_ADDR': ip},
+                                headers=headers)
+
+    def test_username_limit(self):
+        burst = app.config['LOGIN_USERNAME_BURST']
+        for _ in range(burst):
+            self.assertEqual(self.log_in().status_code, 200)
+
+        with patch.object(hasher(), 'check') as check:
+            resp = self.log_in(password="secret", ip='10.0.0.2')
+
+        self.assertEqual(resp.status_code, 429)
+        self.assertIn("Too many login attempts", resp.get_data(as_text=True))
+        self.assertGreater(int(resp.headers['Retry-After']), 0)
+        check.assert_not_called()
+
+        # another user is still let in
+        self.assertEqual(self.log_in(username="nobody").status_code, 200)
+
+    def test_ip_limit(self):
+        burst = app.config['LOGIN_IP_BURST']
+        for n in range(burst):
+            self.log_in(username=f"user{n}")
+
+        self.assertEqual(self.log_in(username="other").status_code, 429)
+        self.assertEqual(self.log_in(ip='10.0.0.2').status_code, 200)
+
+    def test_behind_proxy(self):
+        """Behind a load balancer, is each client limited by the address
+        it forwards, not by the balancer's?"""
+        config = TestConfig()
+        config.TRUSTED_PROXIES = 1
+        self.client = create_app(config).test_client()
+
+        def log_in(client_ip, username="testuser"):
+            return self.log_in(username, headers={'X-Forwarded-For':
+                                                  client_ip})
+
+        burst = app.config['LOGIN_IP_BURST']
+        for n in range(burst):
+            log_in('192.0.2.1', username=f"user{n}")
+
+        self.assertEqual(log_in('192.0.2.1').status_code, 429)
+        self.assertEqual(log_in('192.0.2.2').status_code, 200)
+
+
+class UnknownUsernameTestCase(TestCase):
+    """Test the cache of usernames that don't exist."""
+
+    def setUp(self):
+        db.session.rollback()
+        User.query.delete()
+        db.session.commit()
+        unknown_usernames.clear()
+
+    def test_cached(self):
+        self.assertFalse(authenticate("nobody", "secret"))
+        self.assertTrue(unknown_usernames.get("nobody"))
+
+        with patch.object(User, 'query') as query:
+            self.assertFalse(authenticate("nobody", "secret"))
+        query.filter_by.assert_not_called()
+
+    def test_forgotten_on_signup(self):
+        authenticate("newuser", "secret")
+
+        User.signup(username="newuser", email="new@test.com",
+                    password="secret", image_url=None)
+        db.session.commit()
+
+        self.assertIsNone(unknown_usernames.get("newuser"))
+        self.assertTrue(authenticate("newuser", "secret"))
+
+    def test_kept_on_rollback(self):
+        authenticate("newuser", "secret")
+
+        User.signup(username="newuser", email="new@test.com",
+                    password="secret", image_url=None)
+        db.session.flush()
+        db.session.rollback()
+
+        self.assertTrue(unknown_usernames.get("newuser"))
+
+    def test_as_slow_as_a_check(self):
+        """Do unknown usernames take as long as wrong passwords?"""
+
+        User.signup(username="testuser", email="test@test.com",
+                    password="secret", image_url=None)
+        db.session.commit()
+
+        def timed(username):
+            start = perf_counter()
+            authenticate(username, "wrong")
+            return perf_counter() - start
+
+        known = min(timed("testuser") for _ in range(5))
+        # the first try queries; the rest are cached
+        unknown = min(timed("nobody") for _ in range(5))
+
+        self.assertGreater(unknown, known * 0.5)
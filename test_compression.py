@@ -0,0 +1,192 @@
+"""Response compression tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_compression.py
+
+
+import gzip
+import zlib
+from unittest import TestCase, skipUnless
+
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+from models import db, User, Message, Follows, Likes
+from app import create_app, CURR_USER_KEY
+from compression import (CompressionMiddleware, GzipEncoder, brotli,
+                         zstandard)
+
+app = create_app('test')
+app_context = app.app_context()
+
+PAGE = "<li>A warble, and another warble.</li>\n" * 200
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+def wsgi(body, mimetype='text/html', stream=False, **headers):
+    """A WSGI app that sends `body`, in chunks if `stream`."""
+
+    def application(environ, start_response):
+        if stream:
+            chunks = (body[i:i + 100] for i in range(0, len(body), 100))
+            response = Response(chunks, mimetype=mimetype, headers=headers)
+        else:
+            response = Response(body, mimetype=mimetype, headers=headers)
+        return response(environ, start_response)
+    return application
+
+
+class MiddlewareTestCase(TestCase):
+    """Test which responses are compressed, and how."""
+
+    def get(self, application, accept='gzip', **options):
+        client = Client(CompressionMiddleware(application, **options))
+        return client.get('/', headers={'Accept-Encoding': accept})
+
+    def test_gzip(self):
+        resp = self.get(wsgi(PAGE))
+
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+        self.assertNotIn('Content-Length', resp.headers)
+        self.assertLess(len(resp.data), len(PAGE) / 10)
+        self.assertEqual(gzip.decompress(resp.data).decode(), PAGE)
+
+    def test_stream(self):
+        """Is a streamed response compressed chunk by chunk?"""
+
+        resp = self.get(wsgi(PAGE, stream=True))
+
+        chunks = list(resp.response)
+        self.assertGreater(len(chunks), 10)
+        self.assertEqual(gzip.decompress(b''.join(chunks)).decode(), PAGE)
+
+        # each chunk is flushed, so what's come so far can be decoded
+        decoder = zlib.decompressobj(31)
+        self.assertTrue(decoder.decompress(chunks[0] + chunks[1]))
+
+    def test_not_accepted(self):
+        for accept in ('', 'identity', 'gzip;q=0', 'compress'):
+            resp = self.get(wsgi(PAGE), accept=accept)
+            self.assertNotIn('Content-Encoding', resp.headers)
+            # or a shared cache could hand this copy to every client
+            self.assertIn('Accept-Encoding', resp.headers['Vary'])
+            self.assertEqual(resp.get_data(as_text=True), PAGE)
+
+        resp = self.get(wsgi(PAGE, mimetype='image/png'), accept='')
+        self.assertNotIn('Vary', resp.headers)
+
+    def test_small(self):
+        resp = self.get(wsgi("<p>Hi</p>"))
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+        self.assertEqual(resp.data, b"<p>Hi</p>")
+
+        # streamed, so its length is found out as it's sent
+        resp = self.get(wsgi("<p>Hi</p>" * 5, stream=True), min_size=100)
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(resp.data, b"<p>Hi</p>" * 5)
+
+    def test_mimetype(self):
+        resp = self.get(wsgi(PAGE, mimetype='image/png'))
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertNotIn('Vary', resp.headers)
+
+        resp = self.get(wsgi(PAGE, mimetype='application/json'))
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+
+    def test_already_encoded(self):
+        data = gzip.compress(PAGE.encode())
+        resp = self.get(wsgi(data, **{'Content-Encoding': 'gzip'}),
+                        accept='gzip')
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(resp.data, data)
+
+    def test_etag(self):
+        resp = self.get(wsgi(PAGE, ETag='"abc"'))
+        self.assertEqual(resp.headers['ETag'], 'W/"abc"')
+
+    def test_head(self):
+        client = Client(CompressionMiddleware(wsgi(PAGE)))
+        resp = client.head('/', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', resp.headers)
+
+    def test_preference(self):
+        """Is the best encoding both sides share picked?"""
+
+        class Fake(GzipEncoder):
+            name = 'fake'
+
+        options = {'encoders': [Fake, GzipEncoder], 'levels': {'fake': 6}}
+        self.assertEqual(self.get(wsgi(PAGE), accept='gzip, fake',
+                                  **options).headers['Content-Encoding'],
+                         'fake')
+        self.assertEqual(self.get(wsgi(PAGE), accept='gzip, fake;q=0.5',
+                                  **options).headers['Content-Encoding'],
+                         'gzip')
+
+    @skipUnless(brotli, "brotli isn't installed")
+    def test_brotli(self):
+        resp = self.get(wsgi(PAGE, stream=True), accept='gzip, br')
+        self.assertEqual(resp.headers['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(resp.data).decode(), PAGE)
+
+    @skipUnless(zstandard, "zstandard isn't installed")
+    def test_zstd(self):
+        resp = self.get(wsgi(PAGE, stream=True), accept='gzip, br, zstd')
+        self.assertEqual(resp.headers['Content-Encoding'], 'zstd')
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        self.assertEqual(decompressor.decompress(resp.data).decode(), PAGE)
+
+
+class FeedTestCase(TestCase):
+    """Test compressing the app's own pages."""
+
+    def setUp(self):
+        db.session.rollback()
+        Likes.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        user = User.signup(username="author", email="a@test.com",
+                           password="password", image_url=None)
+        db.session.commit()
+        self.user_id = user.id
+        db.session.add_all([Message(text=f"Warble {i}", user_id=user.id)
+                            for i in range(30)])
+        db.session.commit()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+    def test_home(self):
+        plain = self.client.get("/")
+        resp = self.client.get("/", headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(resp.data), plain.data)
+        self.assertLess(len(resp.data), len(plain.data) / 4)
+
+    def test_revalidate(self):
+        """Does a compressed page still get its 304?"""
+
+        url = f"/users/{self.user_id}"
+        headers = {'Accept-Encoding': 'gzip'}
+        with self.client.get(url, headers=headers) as first:
+            self.assertEqual(first.headers['Content-Encoding'], 'gzip')
+
+        headers['If-None-Match'] = first.headers['ETag']
+        again = self.client.get(url, headers=headers)
+        self.assertEqual(again.status_code, 304)
+        self.assertNotIn('Content-Encoding', again.headers)
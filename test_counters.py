@@ -0,0 +1,148 @@
+"""User counter tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_counters.py
+
+
+from unittest import TestCase
+
+from sqlalchemy import update
+
+from models import db, User, Message, Follows, Likes
+from app import create_app, CURR_USER_KEY
+from counters import reconcile_counters
+
+app = create_app('test')
+app_context = app.app_context()
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+class CounterTestCase(TestCase):
+    """Test the denormalized message/follow/like counts on users."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Likes.query.delete()
+
+        self.client = app.test_client()
+
+        db.session.add_all([
+            User(id=1, email="test1@test.com", username="testuser1",
+                 password="HASHED_PASSWORD"),
+            User(id=2, email="test2@test.com", username="testuser2",
+                 password="HASHED_PASSWORD"),
+        ])
+        db.session.add(Message(id=9876, text="Example Text", user_id=2))
+        db.session.commit()
+
+    def counts(self, user_id):
+        user = db.session.get(User, user_id)
+        return (user.messages_count, user.following_count,
+                user.followers_count, user.likes_count)
+
+    def login(self, c):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 1
+
+    def test_new_user(self):
+        """Do new users start with zero counts?"""
+        self.assertEqual(self.counts(1), (0, 0, 0, 0))
+        self.assertEqual(self.counts(2), (1, 0, 0, 0))
+
+    def test_message_routes(self):
+        """Do adding and deleting messages update messages_count?"""
+        with self.client as c:
+            self.login(c)
+
+            c.post("/messages/new", data={"text": "Hello"})
+            self.assertEqual(self.counts(1), (1, 0, 0, 0))
+
+            msg = Message.query.filter_by(user_id=1).one()
+            c.post(f"/messages/{msg.id}/delete")
+            self.assertEqual(self.counts(1), (0, 0, 0, 0))
+
+    def test_follow_routes(self):
+        """Do follow and unfollow update both users' counts?"""
+        with self.client as c:
+            self.login(c)
+
+            c.post("/users/follow/2")
+            self.assertEqual(self.counts(1), (0, 1, 0, 0))
+            self.assertEqual(self.counts(2), (1, 0, 1, 0))
+
+            c.post("/users/stop-following/2")
+            self.assertEqual(self.counts(1), (0, 0, 0, 0))
+            self.assertEqual(self.counts(2), (1, 0, 0, 0))
+
+    def test_like_route(self):
+        """Does toggling a like update likes_count?"""
+        with self.client as c:
+            self.login(c)
+
+            c.post("/users/add_like/9876")
+            self.assertEqual(self.counts(1), (0, 0, 0, 1))
+
+            c.post("/users/add_like/9876")
+            self.assertEqual(self.counts(1), (0, 0, 0, 0))
+
+    def test_rows(self):
+        """Are Follows and Likes rows counted like relationship changes?"""
+        db.session.add(Follows(user_being_followed_id=2, user_following_id=1))
+        db.session.add(Likes(user_id=1, message_id=9876))
+        db.session.commit()
+
+        self.assertEqual(self.counts(1), (0, 1, 0, 1))
+        self.assertEqual(self.counts(2), (1, 0, 1, 0))
+
+    def test_deleted_message_uncounts_likes(self):
+        """Does deleting a liked message take back the like?"""
+        db.session.add(Likes(user_id=1, message_id=9876))
+        db.session.commit()
+
+        db.session.delete(db.session.get(Message, 9876))
+        db.session.commit()
+
+        self.assertEqual(self.counts(1), (0, 0, 0, 0))
+        self.assertEqual(self.counts(2), (0, 0, 0, 0))
+
+    def test_reconcile(self):
+        """Does reconcile_counters repair counts that have drifted?"""
+        db.session.add(Follows(user_being_followed_id=2, user_following_id=1))
+        db.session.commit()
+        db.session.execute(update(User).values(
+            messages_count=7, followers_count=7,
+            following_count=7, likes_count=7))
+        db.session.commit()
+
+        reconcile_counters()
+        db.session.commit()
+
+        self.assertEqual(self.counts(1), (0, 1, 0, 0))
+        self.assertEqual(self.counts(2), (1, 0, 1, 0))
+
+    def test_profile_header(self):
+        """Does the profile page show the counters?"""
+        db.session.execute(update(User).where(User.id == 2).values(
+            messages_count=12, following_count=34,
+            followers_count=56, likes_count=78))
+        db.session.commit()
+
+        resp = self.client.get("/users/2")
+        html = resp.get_data(as_text=True)
+
+        for count in ("12", "34", "56", "78"):
+            self.assertIn(f">{count}</a>", html)
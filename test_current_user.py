@@ -0,0 +1,185 @@
+"""Current-user cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_current_user.py
+
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from sqlalchemy import event
+
+from models import db, User, Message, Follows
+from app import create_app, CURR_USER_KEY
+from cache import LRUCache
+from current_user import CurrentUser, load_snapshot, user_cache
+
+app = create_app('test')
+app_context = app.app_context()
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+class LRUCacheTestCase(TestCase):
+    """Test the bounded TTL cache."""
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_expires(self):
+        cache = LRUCache(ttl=10)
+
+        with patch('cache.monotonic', return_value=100):
+            cache.set('a', 1)
+        with patch('cache.monotonic', return_value=109):
+            self.assertEqual(cache.get('a'), 1)
+        with patch('cache.monotonic', return_value=110):
+            self.assertIsNone(cache.get('a'))
+
+
+class CurrentUserTestCase(TestCase):
+    """Test the cached snapshot behind g.user."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+
+        self.client = app.test_client()
+
+        self.testuser = User.signup(username="testuser",
+                                    email="test@test.com",
+                                    password="testuser",
+                                    image_url=None)
+        db.session.commit()
+        self.testuser_id = self.testuser.id
+
+    def get(self, url):
+        """GET `url` as testuser; return (response html, queries run)."""
+
+        queries = []
+
+        def count(*args):
+            queries.append(args)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                resp = c.get(url)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+
+        return resp.get_data(as_text=True), len(queries)
+
+    def test_no_query_when_cached(self):
+        """Does a warm request skip the user lookup entirely?"""
+        user_cache.clear()
+
+        html, cold = self.get("/messages/new")
+        html, warm = self.get("/messages/new")
+
+        self.assertEqual(cold, 1)
+        self.assertEqual(warm, 0)
+        self.assertIn('alt="testuser"', html)
+
+    def test_read_only(self):
+        """Does g.user refuse writes that belong on the model?"""
+        user = CurrentUser(load_snapshot(self.testuser_id))
+
+        with self.assertRaises(AttributeError):
+            user.username = "changed"
+
+        self.assertEqual(user.model.email, "test@test.com")
+
+    def test_profile_edit_invalidates(self):
+        """Does editing the profile show the new name straight away?"""
+        self.get("/messages/new")
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            c.post("/users/profile", data={
+                "username": "renamed",
+                "email": "test@test.com",
+                "image_url": "/static/images/default-pic.png",
+                "header_image_url": "",
+                "bio": "",
+                "password": "testuser",
+            })
+
+        html, queries = self.get("/messages/new")
+        self.assertIn('alt="renamed"', html)
+
+    def test_new_message_refreshes_counts(self):
+        """Does posting a message update the cached message count?"""
+        self.assertEqual(load_snapshot(self.testuser_id).messages_count, 0)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            c.post("/messages/new", data={"text": "Hello"})
+
+        self.assertEqual(load_snapshot(self.testuser_id).messages_count, 1)
+
+    def test_deleted_user(self):
+        """Is a deleted user logged out rather than served from cache?"""
+        self.get("/messages/new")
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            c.post("/users/delete")
+
+        self.assertIsNone(load_snapshot(self.testuser_id))
+
+    def test_deleted_behind_cache(self):
+        """Is a user deleted by another worker logged out, not a 500?"""
+        for url in ("/users/profile", "/users/delete"):
+            with self.subTest(url=url):
+                self.setUp()
+                snapshot = load_snapshot(self.testuser_id)
+
+                # as another worker would: the row goes, the snapshot stays
+                db.session.delete(db.session.get(User, self.testuser_id))
+                db.session.commit()
+                user_cache.set(self.testuser_id, snapshot)
+
+                with self.client as c:
+                    with c.session_transaction() as sess:
+                        sess[CURR_USER_KEY] = self.testuser_id
+
+                    resp = c.post(url, data={"password": "testuser"},
+                                  follow_redirects=True)
+
+                    with c.session_transaction() as sess:
+                        self.assertNotIn(CURR_USER_KEY, sess)
+
+                self.assertEqual(resp.status_code, 200)
+                self.assertIn("Access unauthorized.",
+                              resp.get_data(as_text=True))
+                self.assertIsNone(user_cache.get(self.testuser_id))
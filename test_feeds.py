@@ -0,0 +1,136 @@
+"""Feed query tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_feeds.py
+
+
+from unittest import TestCase
+
+from sqlalchemy import event
+
+from models import db, User, Message, Follows, Likes
+from app import create_app, CURR_USER_KEY
+from current_user import user_cache
+
+app = create_app('test')
+app_context = app.app_context()
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+class FeedQueryTestCase(TestCase):
+    """Test that feed pages cost a constant number of queries."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Likes.query.delete()
+
+        self.client = app.test_client()
+
+        db.session.add(User(id=1, email="test@test.com", username="testuser",
+                            password="HASHED_PASSWORD"))
+        db.session.commit()
+
+        self.next_id = 100
+
+    def add_authors(self, count):
+        """Add `count` users, each with a message user 1 follows and likes."""
+
+        ids = range(self.next_id, self.next_id + count)
+        self.next_id += count
+
+        db.session.add_all([
+            User(id=i, email=f"author{i}@test.com", username=f"author{i}",
+                 password="HASHED_PASSWORD")
+            for i in ids
+        ])
+        db.session.commit()
+
+        db.session.add_all(
+            [Message(id=i, text=f"warble {i}", user_id=i) for i in ids] +
+            [Message(id=10000 + i, text=f"own {i}", user_id=1) for i in ids] +
+            [Follows(user_being_followed_id=i, user_following_id=1)
+             for i in ids]
+        )
+        db.session.commit()
+
+        db.session.add_all([Likes(user_id=1, message_id=i) for i in ids])
+        db.session.commit()
+
+    def count_queries(self, url):
+        """Request `url` as user 1 and return how many queries it ran."""
+
+        queries = []
+
+        def count(*args):
+            queries.append(args)
+
+        # start from an empty session and user cache, as a fresh
+        # process would
+        db.session.expunge_all()
+        user_cache.clear()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 1
+
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                resp = c.get(url)
+                # streamed feeds run their queries, and any lazy loads,
+                # as the body is rendered
+                resp.get_data()
+                resp.close()
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+
+        self.assertEqual(resp.status_code, 200)
+        return len(queries)
+
+    def assert_constant_queries(self, url):
+        self.add_authors(2)
+        few = self.count_queries(url)
+
+        self.add_authors(40)
+        many = self.count_queries(url)
+
+        self.assertEqual(few, many)
+
+    def test_home_feed(self):
+        """Does the home page cost the same for 2 authors as for 42?"""
+        self.assert_constant_queries("/")
+
+    def test_user_feed(self):
+        """Does the profile page cost the same for 2 messages as for 42?"""
+        self.assert_constant_queries("/users/1")
+
+    def test_liked_feed(self):
+        """Does the likes page cost the same for 2 likes as for 42?"""
+        self.assert_constant_queries("/users/1/likes")
+
+    def test_authors_rendered(self):
+        """Do the eagerly loaded authors show up on the cards?"""
+        self.add_authors(3)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 1
+
+            html = c.get("/").get_data(as_text=True)
+
+        for i in range(100, 103):
+            self.assertIn(f"@author{i}", html)
+            self.assertIn(f"warble {i}", html)
@@ -0,0 +1,138 @@
+"""Cached message and user card tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_fragments.py
+
+
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Likes
+from app import create_app, CURR_USER_KEY
+from fragments import fragments
+
+app = create_app('test')
+app_context = app.app_context()
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+class FragmentTestCase(TestCase):
+    """Test that cards are reused, and re-rendered when they change."""
+
+    def setUp(self):
+        db.session.rollback()
+        Likes.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+        fragments().clear()
+
+        self.author = User.signup(username="author", email="a@test.com",
+                                  password="password", image_url=None)
+        self.reader = User.signup(username="reader", email="r@test.com",
+                                  password="password", image_url=None)
+        db.session.commit()
+        self.author_id = self.author.id
+        self.reader_id = self.reader.id
+
+        msg = Message(text="First warble", user_id=self.author_id)
+        db.session.add(msg)
+        db.session.commit()
+        self.message_id = msg.id
+
+        self.client = app.test_client()
+
+    def get(self, url, user_id):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+        return self.client.get(url).get_data(as_text=True)
+
+    def post(self, url, user_id, data=None):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+        return self.client.post(url, data=data)
+
+    def test_cached(self):
+        self.get(f"/users/{self.author_id}", self.reader_id)
+        self.assertIsNotNone(fragments().get(('message', self.message_id)))
+
+        # rendered from the cache, the page is the same
+        first = self.get(f"/users/{self.author_id}/likes", self.reader_id)
+        fragments().clear()
+        self.assertEqual(
+            self.get(f"/users/{self.author_id}/likes", self.reader_id), first)
+
+    def test_viewer_parts_not_cached(self):
+        """Does each viewer see their own like button on a cached card?"""
+
+        db.session.add(Likes(user_id=self.reader_id,
+                             message_id=self.message_id))
+        db.session.commit()
+        url = "/search/messages?q=warble"
+
+        html = self.get(url, self.reader_id)
+        self.assertIn("First warble", html)
+        self.assertIn("btn-primary", html)
+
+        # no button on your own warble
+        html = self.get(url, self.author_id)
+        self.assertIn("First warble", html)
+        self.assertNotIn("fa-thumbs-up", html)
+
+    def test_profile_edit(self):
+        """Do cards show a renamed user's new name straight away?"""
+
+        self.post(f"/users/follow/{self.author_id}", self.reader_id)
+        self.get(f"/users/{self.reader_id}/following", self.reader_id)
+        self.get("/", self.reader_id)
+
+        self.post("/users/profile", self.author_id, data={
+            "username": "renamed",
+            "email": "a@test.com",
+            "image_url": "",
+            "header_image_url": "",
+            "bio": "New bio",
+            "password": "password",
+        })
+
+        html = self.get(f"/users/{self.reader_id}/following", self.reader_id)
+        self.assertIn("@renamed", html)
+        self.assertIn("New bio", html)
+        html = self.get("/", self.reader_id)
+        self.assertIn("@renamed", html)
+        self.assertNotIn("@author", html)
+
+    def test_version(self):
+        """Does only a change to what pages show bump the version?"""
+
+        author = db.session.get(User, self.author_id)
+        self.assertEqual(author.profile_version, 1)
+
+        author.email = "new@test.com"
+        db.session.commit()
+        self.assertEqual(author.profile_version, 1)
+
+        author.bio = "Hello"
+        db.session.commit()
+        self.assertEqual(author.profile_version, 2)
+
+        author.location = "Somewhere"
+        db.session.commit()
+        self.assertEqual(author.profile_version, 3)
+
+    def test_messages_destroy(self):
+        self.get(f"/users/{self.author_id}", self.author_id)
+
+        self.post(f"/messages/{self.message_id}/delete", self.author_id)
+
+        self.assertIsNone(fragments().get(('message', self.message_id)))
+        self.assertNotIn("First warble",
+                         self.get(f"/users/{self.author_id}", self.reader_id))
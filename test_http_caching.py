@@ -0,0 +1,211 @@
+"""HTTP caching tests: Cache-Control, ETags and 304s."""
+
+# run these tests like:
+#
+#    python -m unittest test_http_caching.py
+
+
+from unittest import TestCase
+
+from flask import template_rendered
+
+from models import db, User, Message, Follows, Likes
+from app import create_app, CURR_USER_KEY
+from assets import asset_url
+from current_user import user_cache
+from fragments import fragments
+from http_caching import IMMUTABLE
+
+app = create_app('test')
+app_context = app.app_context()
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+class ConditionalGetTestCase(TestCase):
+    """Test ETags on pages, and 304s that skip rendering."""
+
+    def setUp(self):
+        db.session.rollback()
+        # bulk deletes leave the last test's objects in the session, and
+        # SQLite reuses their ids
+        db.session.expunge_all()
+        user_cache.clear()
+        fragments().clear()
+        Likes.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        author = User.signup(username="author", email="a@test.com",
+                             password="password", image_url=None)
+        reader = User.signup(username="reader", email="r@test.com",
+                             password="password", image_url=None)
+        db.session.commit()
+        self.author_id = author.id
+        self.reader_id = reader.id
+
+        msg = Message(text="First warble", user_id=self.author_id)
+        db.session.add(msg)
+        db.session.commit()
+        self.message_id = msg.id
+
+        self.client = app.test_client()
+        self.rendered = []
+        template_rendered.connect(self.record, app)
+
+    def tearDown(self):
+        template_rendered.disconnect(self.record, app)
+
+    def record(self, sender, template, context, **extra):
+        self.rendered.append(template.name)
+
+    def get(self, url, user_id=None, etag=None):
+        with self.client.session_transaction() as sess:
+            sess.pop(CURR_USER_KEY, None)
+            if user_id is not None:
+                sess[CURR_USER_KEY] = user_id
+        self.rendered.clear()
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get(url, headers=headers)
+
+    def assertRevalidates(self, url, user_id=None):
+        """Is `url` sent in full once, then as an empty 304?"""
+
+        first = self.get(url, user_id)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.headers['ETag'].startswith('W/"'))
+        self.assertEqual(first.headers['Cache-Control'], 'private, no-cache')
+        self.assertIn('Cookie', first.headers['Vary'])
+        self.assertGreater(len(first.data), 1000)
+
+        again = self.get(url, user_id, etag=first.headers['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(len(again.data), 0)
+        self.assertEqual(again.headers['ETag'], first.headers['ETag'])
+        self.assertEqual(self.rendered, [])
+
+        return first.headers['ETag']
+
+    def test_users_show(self):
+        url = f"/users/{self.author_id}"
+        etag = self.assertRevalidates(url)
+
+        db.session.add(Message(text="Second warble", user_id=self.author_id))
+        db.session.commit()
+
+        resp = self.get(url, etag=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b"Second warble", resp.data)
+        self.assertEqual(self.rendered[0], 'users/show.html')
+
+    def test_per_viewer(self):
+        """Does each viewer get their own ETag?"""
+
+        url = f"/users/{self.author_id}"
+        anonymous = self.assertRevalidates(url)
+        reader = self.assertRevalidates(url, self.reader_id)
+        self.assertNotEqual(anonymous, reader)
+
+        self.assertEqual(self.get(url, self.reader_id,
+                                  etag=anonymous).status_code, 200)
+
+    def test_follow(self):
+        """Does following the author change the page?"""
+
+        url = f"/users/{self.author_id}"
+        etag = self.assertRevalidates(url, self.reader_id)
+
+        db.session.add(Follows(user_being_followed_id=self.author_id,
+                               user_following_id=self.reader_id))
+        db.session.commit()
+
+        self.assertEqual(self.get(url, self.reader_id, etag=etag).status_code,
+                         200)
+
+    def test_profile_edit(self):
+        url = "/users"
+        etag = self.assertRevalidates(url)
+
+        author = db.session.get(User, self.author_id)
+        author.username = "renamed"
+        db.session.commit()
+
+        resp = self.get(url, etag=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b"@renamed", resp.data)
+
+    def test_messages_show(self):
+        self.assertRevalidates(f"/messages/{self.message_id}",
+                               self.reader_id)
+
+    def test_follow_lists(self):
+        db.session.add(Follows(user_being_followed_id=self.author_id,
+                               user_following_id=self.reader_id))
+        db.session.commit()
+
+        self.assertRevalidates(f"/users/{self.author_id}/followers",
+                               self.reader_id)
+        self.assertRevalidates(f"/users/{self.reader_id}/following",
+                               self.reader_id)
+
+    def test_flash(self):
+        """Is a page with a flashed message always sent?"""
+
+        with self.client.session_transaction() as sess:
+            sess['_flashes'] = [('success', "Hello!")]
+        resp = self.client.get("/users")
+
+        self.assertIn(b"Hello!", resp.data)
+        self.assertNotIn('ETag', resp.headers)
+        self.assertEqual(resp.headers['Cache-Control'], 'no-store')
+
+    def test_default(self):
+        resp = self.client.get("/signup")
+        self.assertEqual(resp.headers['Cache-Control'], 'no-store')
+        self.assertNotIn('ETag', resp.headers)
+
+
+class StaticTestCase(TestCase):
+    """Test caching of static files."""
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def test_fingerprinted(self):
+        with app.test_request_context():
+            url = asset_url('stylesheets/style.css')
+        self.assertIn('?v=', url)
+
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Cache-Control'], IMMUTABLE)
+        resp.close()
+
+    def test_stale_fingerprint(self):
+        resp = self.client.get('/static/stylesheets/style.css?v=0')
+        self.assertEqual(resp.headers['Cache-Control'], 'no-cache')
+        resp.close()
+
+    def test_revalidate(self):
+        """Is an unchanged plain static file sent as an empty 304?"""
+
+        first = self.client.get('/static/stylesheets/style.css')
+        self.assertEqual(first.headers['Cache-Control'], 'no-cache')
+        size = len(first.data)
+        first.close()
+
+        again = self.client.get(
+            '/static/stylesheets/style.css',
+            headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(len(again.data), 0)
+        self.assertGreater(size, 1000)
+        again.close()
@@ -0,0 +1,191 @@
+"""Request and SQL instrumentation tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_instrumentation.py
+
+
+from unittest import TestCase, skipUnless
+
+from sqlalchemy.engine import make_url
+
+from models import db, User, Message
+from app import create_app, CURR_USER_KEY
+from instrumentation import Histogram, RequestStats, escape, metrics
+
+app = create_app('test')
+app_context = app.app_context()
+
+# SQLite reports no rowcount for SELECTs, so only Postgres counts rows
+POSTGRES = make_url(
+    app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == 'postgresql'
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+class InstrumentationTestCase(TestCase):
+    """Test per-request query stats, the slow-query log and /metrics."""
+
+    def setUp(self):
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        db.session.add(User(id=101, email="test@test.com",
+                            username="testuser", password="HASHED_PASSWORD"))
+        db.session.add_all([Message(id=message_id, text="Hello",
+                                    user_id=101)
+                            for message_id in (101, 102, 103)])
+        db.session.commit()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 101
+
+        metrics.clear()
+
+    def tearDown(self):
+        app.config['SLOW_QUERY_MS'] = 100
+        db.session.rollback()
+
+    def test_counts_queries_by_endpoint(self):
+        """Are a request's queries added to its endpoint?"""
+
+        resp = self.client.get('/users/101')
+        self.assertEqual(resp.status_code, 200)
+        # a streamed page's stats are recorded once it's been sent
+        resp.close()
+
+        self.assertEqual(
+            metrics.requests['views.users_show', 'GET', 200], 1)
+        self.assertGreater(metrics.queries['views.users_show'], 0)
+        self.assertGreater(metrics.db_seconds['views.users_show'], 0)
+        self.assertEqual(metrics.query_counts['views.users_show'].count, 1)
+        self.assertEqual(metrics.slow_queries['views.users_show'], 0)
+
+    @skipUnless(POSTGRES, "SQLite has no rowcount for SELECTs")
+    def test_counts_rows(self):
+        """Are the rows a request's SELECTs return added up?"""
+
+        self.client.get('/users/101').close()
+
+        # at least the user's three messages
+        self.assertGreaterEqual(metrics.rows['views.users_show'], 3)
+
+    def test_counts_streamed_rows(self):
+        """Are a streamed feed's rows counted, though the server-side
+        cursor they're read from has no rowcount?"""
+
+        db.session.add_all([Message(id=message_id, text="Hello",
+                                    user_id=101)
+                            for message_id in range(104, 134)])
+        db.session.commit()
+
+        resp = self.client.get('/')
+        self.assertIn("Hello", resp.get_data(as_text=True))
+        resp.close()
+
+        self.assertGreaterEqual(metrics.rows['views.homepage'], 33)
+
+    def test_counts_each_request(self):
+        """Does each request get stats of its own?"""
+
+        self.client.get('/users/101').close()
+        self.client.get('/users/101').close()
+
+        self.assertEqual(
+            metrics.requests['views.users_show', 'GET', 200], 2)
+        histogram = metrics.query_counts['views.users_show']
+        self.assertEqual(histogram.count, 2)
+        self.assertEqual(histogram.sum, metrics.queries['views.users_show'])
+
+    def test_logs_slow_queries(self):
+        """Are queries over SLOW_QUERY_MS logged with their endpoint?"""
+
+        app.config['SLOW_QUERY_MS'] = 0
+
+        with self.assertLogs('warbler.sql', 'WARNING') as logs:
+            self.client.get('/users/101').close()
+
+        self.assertIn("slow query", logs.output[0])
+        self.assertIn("in views.users_show:", logs.output[0])
+        self.assertEqual(metrics.slow_queries['views.users_show'],
+                         metrics.queries['views.users_show'])
+
+    def test_metrics_endpoint(self):
+        """Does /metrics serve the aggregates in the Prometheus format?"""
+
+        self.client.get('/users/101').close()
+        resp = self.client.get('/metrics', headers={
+            'Authorization': f"Bearer {app.config['METRICS_TOKEN']}"})
+        body = resp.get_data(as_text=True)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.content_type.startswith(
+            'text/plain; version=0.0.4'))
+        self.assertIn("# TYPE warbler_requests_total counter", body)
+        self.assertIn('warbler_requests_total{endpoint="views.users_show",'
+                      'method="GET",status="200"} 1', body)
+        self.assertIn("# TYPE warbler_request_duration_seconds histogram",
+                      body)
+        self.assertIn('warbler_request_queries_count'
+                      '{endpoint="views.users_show"} 1', body)
+        self.assertIn('warbler_db_queries_total{endpoint="views.users_show"} ',
+                      body)
+
+    def test_metrics_need_token(self):
+        """Is /metrics refused without the token, or with none set?"""
+
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', headers={
+            'Authorization': 'Bearer wrong'}).status_code, 403)
+
+        token = app.config['METRICS_TOKEN']
+        app.config['METRICS_TOKEN'] = None
+        try:
+            self.assertEqual(self.client.get('/metrics', headers={
+                'Authorization': 'Bearer '}).status_code, 403)
+        finally:
+            app.config['METRICS_TOKEN'] = token
+
+    def test_unmatched_urls(self):
+        """Are 404s counted together, rather than one series per URL?"""
+
+        self.client.get('/no/such/page')
+        resp = self.client.get('/nor/this')
+
+        self.assertEqual(
+            metrics.requests['<unmatched>', 'GET', resp.status_code], 2)
+
+
+class HistogramTestCase(TestCase):
+    """Test the Prometheus helpers."""
+
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram((1, 5))
+        for value in (0, 3, 10):
+            histogram.observe(value)
+
+        self.assertEqual(list(histogram.lines('h', 'a="b"')), [
+            'h_bucket{a="b",le="1"} 1',
+            'h_bucket{a="b",le="5"} 2',
+            'h_bucket{a="b",le="+Inf"} 3',
+            'h_sum{a="b"} 13',
+            'h_count{a="b"} 3',
+        ])
+
+    def test_escape(self):
+        self.assertEqual(escape('a"b\\c\nd'), 'a\\"b\\\\c\\nd')
+
+    def test_render_empty(self):
+        metrics.clear()
+        metrics.observe('x', 'GET', 200, 0.1, RequestStats())
+        self.assertIn('warbler_db_rows_total{endpoint="x"} 0',
+                      metrics.render())
@@ -0,0 +1,151 @@
+"""Follow/like membership tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_memberships.py
+
+
+from unittest import TestCase
+
+from sqlalchemy import event
+
+from models import db, User, Message, Follows, Likes
+from app import create_app, CURR_USER_KEY
+from current_user import user_cache
+
+app = create_app('test')
+app_context = app.app_context()
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+class MembershipTestCase(TestCase):
+    """Test the cached follow/like id sets on users."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Likes.query.delete()
+
+        self.client = app.test_client()
+
+        self.u1 = User(id=1, email="test1@test.com", username="testuser1",
+                       password="HASHED_PASSWORD")
+        self.u2 = User(id=2, email="test2@test.com", username="testuser2",
+                       password="HASHED_PASSWORD")
+        db.session.add_all([self.u1, self.u2])
+        db.session.add(Message(id=9876, text="Example Text", user_id=2))
+        db.session.commit()
+
+    def add_users(self, ids):
+        db.session.add_all([
+            User(id=i, email=f"more{i}@test.com", username=f"more{i}",
+                 password="HASHED_PASSWORD")
+            for i in ids
+        ])
+        db.session.commit()
+
+    def count_queries(self, url):
+        """Request `url` as user 1 and return how many queries it ran."""
+
+        queries = []
+
+        def count(*args):
+            queries.append(args)
+
+        # count the current user's lookup every time
+        user_cache.clear()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 1
+
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                resp = c.get(url)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+
+        self.assertEqual(resp.status_code, 200)
+        return len(queries)
+
+    def test_membership_sets(self):
+        """Do the id sets reflect follows and likes?"""
+        self.u1.following.append(self.u2)
+        db.session.add(Likes(user_id=1, message_id=9876))
+        db.session.commit()
+
+        self.assertEqual(self.u1.following_ids, {2})
+        self.assertEqual(self.u2.follower_ids, {1})
+        self.assertEqual(self.u1.liked_message_ids, {9876})
+        self.assertTrue(self.u1.is_following(self.u2))
+        self.assertTrue(self.u2.is_followed_by(self.u1))
+        self.assertFalse(self.u2.is_following(self.u1))
+
+    def test_sets_follow_changes(self):
+        """Are cached sets dropped when the follows behind them change?"""
+        self.assertFalse(self.u1.is_following(self.u2))
+
+        self.u2.followers.append(self.u1)
+        self.assertTrue(self.u1.is_following(self.u2))
+
+        self.u1.following.remove(self.u2)
+        self.assertFalse(self.u1.is_following(self.u2))
+
+        db.session.add(Follows(user_being_followed_id=2, user_following_id=1))
+        db.session.flush()
+        self.assertTrue(self.u1.is_following(self.u2))
+
+    def test_add_like_toggles(self):
+        """Does add_like like, then unlike, a message?"""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 1
+
+            c.post("/users/add_like/9876")
+            self.assertEqual(Likes.query.filter_by(user_id=1).count(), 1)
+
+            c.post("/users/add_like/9876")
+            self.assertEqual(Likes.query.filter_by(user_id=1).count(), 0)
+
+    def test_users_page_queries_constant(self):
+        """Does the users page cost the same for 3 cards as for 30?"""
+        self.add_users(range(100, 101))
+        few = self.count_queries("/users")
+
+        self.add_users(range(101, 131))
+        db.session.add_all([
+            Follows(user_being_followed_id=i, user_following_id=1)
+            for i in range(101, 131, 2)
+        ])
+        db.session.commit()
+        many = self.count_queries("/users")
+
+        self.assertEqual(few, many)
+
+    def test_followers_page_queries_constant(self):
+        """Does the followers page cost the same for 1 follower as for 30?"""
+        db.session.add(Follows(user_being_followed_id=2, user_following_id=1))
+        db.session.commit()
+        few = self.count_queries("/users/2/followers")
+
+        self.add_users(range(100, 130))
+        db.session.add_all([
+            Follows(user_being_followed_id=2, user_following_id=i)
+            for i in range(100, 130)
+        ])
+        db.session.commit()
+        many = self.count_queries("/users/2/followers")
+
+        self.assertEqual(few, many)
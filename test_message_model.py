@@ -1,12 +1,19 @@
-import os
 from unittest import TestCase
 from models import db, Message, Likes, User
+from app import create_app
 
-os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+app = create_app('test')
+app_context = app.app_context()
 
-from app import app
 
-db.create_all()
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
 
 class MessageModelTestCase(TestCase):
     """Test message model"""
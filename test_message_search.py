@@ -0,0 +1,186 @@
+"""Message search tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_message_search.py
+
+
+from unittest import TestCase, skipUnless
+
+from sqlalchemy.engine import make_url
+
+from models import db, User, Message
+from app import create_app, CURR_USER_KEY
+from message_search import InvertedIndex, message_index, search_messages
+
+app = create_app('test')
+app_context = app.app_context()
+
+# only Postgres stems; the in-process index matches exact words
+POSTGRES = make_url(
+    app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == 'postgresql'
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+MESSAGES = (
+    (101, "Birds are singing in the garden"),
+    (102, "The garden birds sang, and the birds flew off"),
+    (103, "Drums all night"),
+    (104, "A bird in the hand"),
+    (105, "Gardening with drums"),
+)
+
+
+class SearchMessagesTestCase(TestCase):
+    """Test ranked, paged message search against Postgres."""
+
+    def setUp(self):
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        db.session.add(User(id=101, email="test@test.com",
+                            username="testuser", password="HASHED_PASSWORD"))
+        db.session.add_all([Message(id=message_id, text=text, user_id=101)
+                            for message_id, text in MESSAGES])
+        db.session.commit()
+
+    def search(self, query, **kwargs):
+        return [msg.id for msg in search_messages(query, **kwargs)]
+
+    @skipUnless(POSTGRES, "only Postgres stems")
+    def test_every_word_matches(self):
+        """Must every word of the query appear, stemmed?"""
+        self.assertEqual(sorted(self.search("bird garden")), [101, 102])
+        self.assertEqual(self.search("drum night"), [103])
+        self.assertEqual(self.search("the"), [])
+
+    def test_ranking(self):
+        """Do more occurrences rank higher?"""
+        self.assertEqual(self.search("birds")[0], 102)
+
+    @skipUnless(POSTGRES, "only Postgres stems")
+    def test_pages_cover_everything_once(self):
+        """Do consecutive pages return every match once, in rank order?"""
+        everything = self.search("bird")
+        seen = []
+        before = None
+
+        while True:
+            page = search_messages("bird", before, size=1)
+            seen.extend(msg.id for msg in page)
+            before = page.next_cursor
+            if not before:
+                break
+
+        self.assertEqual(seen, everything)
+        self.assertEqual(sorted(seen), [101, 102, 104])
+
+    def test_route(self):
+        """Does /search/messages show the matches?"""
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 101
+
+            html = client.get("/search/messages?q=drums").get_data(as_text=True)
+
+        self.assertIn("Drums all night", html)
+        self.assertNotIn("A bird in the hand", html)
+
+    def test_bad_cursor(self):
+        """Does a tampered cursor get a 400?"""
+        resp = app.test_client().get("/search/messages?q=bird&before=nope")
+
+        self.assertEqual(resp.status_code, 400)
+
+
+class InvertedIndexTestCase(TestCase):
+    """Test the in-process index used where Postgres isn't."""
+
+    def setUp(self):
+        self.index = InvertedIndex()
+        self.index.load(MESSAGES)
+
+    def ids(self, hits):
+        return [message_id for score, message_id in hits]
+
+    def test_every_word_matches(self):
+        """Must every word of the query appear?"""
+        self.assertEqual(sorted(self.ids(self.index.search("birds garden"))),
+                         [101, 102])
+        self.assertEqual(self.index.search("the"), [])
+
+    def test_ranking(self):
+        """Do more occurrences rank higher?"""
+        self.assertEqual(self.ids(self.index.search("birds")), [102, 101])
+
+    def test_before(self):
+        """Does `before` continue after an earlier hit?"""
+        first, second = self.index.search("birds")
+
+        self.assertEqual(self.index.search("birds", first), [second])
+        self.assertEqual(self.index.search("birds", limit=1), [first])
+
+    def test_update_and_remove(self):
+        """Does re-adding a message replace its old words?"""
+        self.index.add(103, "Quiet night")
+        self.assertEqual(self.index.search("drums"), [
+            hit for hit in self.index.search("drums") if hit[1] == 105])
+
+        self.index.remove(105)
+        self.assertEqual(self.index.search("drums"), [])
+        self.assertEqual(len(self.index), 4)
+
+
+class IndexHooksTestCase(TestCase):
+    """Test that posted and deleted messages reach the in-process index."""
+
+    def setUp(self):
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        db.session.add(User(id=101, email="test@test.com",
+                            username="testuser", password="HASHED_PASSWORD"))
+        db.session.add(Message(id=101, text="Drums all night", user_id=101))
+        db.session.commit()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 101
+
+        message_index.clear()
+        message_index.load([(101, "Drums all night")])
+
+    def tearDown(self):
+        message_index.clear()
+
+    def test_post(self):
+        """Is a posted message searchable straight away?"""
+        self.client.post("/messages/new", data={"text": "Cymbals too"})
+        [msg] = Message.query.filter_by(text="Cymbals too").all()
+
+        self.assertEqual([hit[1] for hit in message_index.search("cymbals")],
+                         [msg.id])
+
+    def test_delete(self):
+        """Is a deleted message dropped?"""
+        self.client.post("/messages/101/delete")
+
+        self.assertEqual(message_index.search("drums"), [])
+
+    def test_rollback(self):
+        """Is a rolled-back message ignored?"""
+        db.session.add(Message(id=102, text="Cymbals too", user_id=101))
+        db.session.flush()
+        db.session.rollback()
+
+        self.assertEqual(message_index.search("cymbals"), [])
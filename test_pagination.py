@@ -0,0 +1,158 @@
+"""Cursor pagination tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_pagination.py
+
+
+from base64 import urlsafe_b64encode
+from unittest import TestCase
+
+from models import db, User, Message, Follows
+from app import create_app, CURR_USER_KEY
+from pagination import (encode_cursor, decode_cursor, paginate_messages,
+                        paginate_users)
+
+app = create_app('test')
+app_context = app.app_context()
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+class PaginationTestCase(TestCase):
+    """Test keyset pagination of messages and users."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+
+        self.client = app.test_client()
+
+        self.user = User(id=1, email="test@test.com", username="testuser",
+                         password="HASHED_PASSWORD")
+        db.session.add(self.user)
+
+        db.session.add_all([
+            Message(id=i, text=f"warble {i}", user_id=1)
+            for i in range(1, 11)
+        ])
+        db.session.commit()
+
+    def test_cursor_round_trip(self):
+        """Does a cursor decode back to the key it was made from?"""
+        key = [926625772339200000]
+        cursor = encode_cursor(key)
+
+        self.assertNotIn("9266", cursor)
+        self.assertEqual(decode_cursor(cursor, (Message.id,)), key)
+
+    def test_pages_cover_everything_once(self):
+        """Do consecutive pages return every message once, newest first?"""
+        query = Message.query.filter(Message.user_id == 1)
+        seen = []
+        before = None
+
+        while True:
+            page = paginate_messages(query, before, size=3)
+            seen.extend(msg.id for msg in page)
+            before = page.next_cursor
+            if not before:
+                break
+
+        self.assertEqual(seen, list(range(10, 0, -1)))
+
+    def test_last_page_has_no_cursor(self):
+        """Is next_cursor None once the results run out?"""
+        page = paginate_users(User.query, size=5)
+
+        self.assertEqual(len(page), 1)
+        self.assertIsNone(page.next_cursor)
+
+    def test_bad_cursor(self):
+        """Does a tampered cursor get a 400?"""
+        resp = self.client.get("/users/1?before=not-a-cursor")
+
+        self.assertEqual(resp.status_code, 400)
+
+    def test_infinite_cursor(self):
+        """Does a cursor forged to hold Infinity get a 400, not a 500?"""
+        for value in ("[Infinity]", "[1e999]"):
+            cursor = urlsafe_b64encode(value.encode()).decode().rstrip("=")
+            resp = self.client.get(f"/users/1?before={cursor}")
+
+            self.assertEqual(resp.status_code, 400)
+
+    def test_huge_cursor(self):
+        """Does a cursor holding more than a 64-bit id get a 400?"""
+        for value in ("[99999999999999999999999]", f"[{2 ** 63}]",
+                      f"[{-2 ** 63 - 1}]"):
+            cursor = urlsafe_b64encode(value.encode()).decode().rstrip("=")
+            for url in ("/users/1", "/users", "/api/v1/users/1/messages"):
+                resp = self.client.get(f"{url}?before={cursor}")
+
+                self.assertEqual(resp.status_code, 400, (url, value))
+
+    def test_older_link(self):
+        """Does the home page link to the next page when there is one?"""
+        db.session.add_all([Message(id=i, text=f"more {i}", user_id=1)
+                            for i in range(11, 111)])
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 1
+
+            resp = c.get("/")
+            html = resp.get_data(as_text=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("/?before=", html)
+            self.assertNotIn("warble 1<", html)
+
+            cursor = html.split("/?before=")[1].split('"')[0]
+            resp = c.get(f"/?before={cursor}")
+            html = resp.get_data(as_text=True)
+
+            self.assertIn("warble 1<", html)
+            self.assertNotIn("/?before=", html)
+
+    def test_follow_lists(self):
+        """Are followers and following paged, with an older link?"""
+        db.session.add_all([User(id=i, email=f"u{i}@test.com",
+                                 username=f"user{i}",
+                                 password="HASHED_PASSWORD")
+                            for i in range(2, 103)])
+        db.session.commit()
+        db.session.add_all(
+            [Follows(user_being_followed_id=1, user_following_id=i)
+             for i in range(2, 103)]
+            + [Follows(user_being_followed_id=i, user_following_id=1)
+               for i in range(2, 103)])
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 1
+
+            for url in ("/users/1/followers", "/users/1/following"):
+                html = c.get(url).get_data(as_text=True)
+                self.assertIn("@user102<", html)
+                self.assertNotIn("@user2<", html)
+                self.assertIn(f"{url}?before=", html)
+
+                cursor = html.split(f"{url}?before=")[1].split('"')[0]
+                html = c.get(f"{url}?before={cursor}").get_data(as_text=True)
+                self.assertIn("@user2<", html)
+                self.assertNotIn("@user102<", html)
+                self.assertNotIn(f"{url}?before=", html)
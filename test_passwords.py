@@ -0,0 +1,105 @@
+"""Password hashing tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_passwords.py
+
+
+from unittest import TestCase
+
+from models import db, User
+from app import create_app
+from passwords import PasswordHasher
+
+app = create_app('test')
+app_context = app.app_context()
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+class PasswordHasherTestCase(TestCase):
+    """Test hashing inline and in worker processes."""
+
+    def test_inline(self):
+        passwords = PasswordHasher(rounds=4)
+        hashed = passwords.hash("secret")
+
+        self.assertTrue(hashed.startswith("$2b$04$"))
+        self.assertTrue(passwords.check(hashed, "secret"))
+        self.assertFalse(passwords.check(hashed, "Secret"))
+
+    def test_pool(self):
+        """Do hashes made in worker processes check out?"""
+
+        passwords = PasswordHasher(rounds=4, workers=2)
+        try:
+            hashed = passwords.hash("secret")
+            self.assertTrue(passwords.check(hashed, "secret"))
+            self.assertFalse(passwords.check(hashed, "wrong"))
+        finally:
+            passwords.shutdown()
+
+        # and inline ones, the other way round
+        self.assertTrue(PasswordHasher(rounds=4).check(hashed, "secret"))
+
+    def test_broken_pool(self):
+        """Does the pool come back after a worker process dies?"""
+
+        passwords = PasswordHasher(rounds=4, workers=1)
+        try:
+            hashed = passwords.hash("secret")
+            broken = passwords._executor
+            for process in list(broken._processes.values()):
+                process.kill()
+                process.join()
+
+            self.assertTrue(passwords.check(hashed, "secret"))
+            self.assertIsNot(passwords._executor, broken)
+        finally:
+            passwords.shutdown()
+
+    def test_needs_rehash(self):
+        passwords = PasswordHasher(rounds=4)
+        self.assertFalse(passwords.needs_rehash(passwords.hash("secret")))
+        self.assertTrue(PasswordHasher(rounds=5).needs_rehash(
+            passwords.hash("secret")))
+
+
+class RehashTestCase(TestCase):
+    """Test that logging in upgrades hashes made at another cost."""
+
+    def setUp(self):
+        db.session.rollback()
+        User.query.delete()
+        db.session.add(User(id=101, email="test@test.com",
+                            username="testuser",
+                            password=PasswordHasher(rounds=5).hash("secret")))
+        db.session.commit()
+
+    def stored_hash(self):
+        db.session.expire_all()
+        return db.session.get(User, 101).password
+
+    def test_login_rehashes(self):
+        resp = app.test_client().post(
+            '/login', data={'username': "testuser", 'password': "secret"})
+
+        self.assertEqual(resp.status_code, 302)
+        hashed = self.stored_hash()
+        self.assertTrue(hashed.startswith("$2b$04$"))
+        self.assertTrue(PasswordHasher(rounds=4).check(hashed, "secret"))
+
+    def test_failed_login_keeps_hash(self):
+        before = self.stored_hash()
+        resp = app.test_client().post(
+            '/login', data={'username': "testuser", 'password': "wrong"})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.stored_hash(), before)
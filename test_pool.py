@@ -0,0 +1,162 @@
+"""Connection pool settings and checkout timing tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_pool.py
+
+
+from unittest import TestCase, skipUnless
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError
+
+from models import db
+from app import create_app
+from instrumentation import metrics
+from pool import (TimedNullPool, TimedQueuePool, engine_options,
+                  pool_size_for)
+
+app = create_app('test')
+app_context = app.app_context()
+
+URL = app.config['SQLALCHEMY_DATABASE_URI']
+POSTGRES = make_url(URL).get_backend_name() == 'postgresql'
+
+# engine_options() only reads the scheme, so this is never connected to
+POSTGRES_URL = 'postgresql:///warbler-test'
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+class PoolSizeTestCase(TestCase):
+    """Test sharing out connections among workers."""
+
+    def test_threads_fit(self):
+        """Does each worker keep a connection per thread, and overflow
+        into the rest of its share?"""
+        self.assertEqual(pool_size_for(105, workers=4, threads=8), (8, 17))
+
+    def test_threads_dont_fit(self):
+        """Is a worker's pool cut down to its share?"""
+        self.assertEqual(pool_size_for(25, workers=4, threads=8), (5, 0))
+
+    def test_too_many_workers(self):
+        with self.assertRaises(ValueError):
+            pool_size_for(10, workers=8)
+
+
+class EngineOptionsTestCase(TestCase):
+    """Test reading pool settings from the environment."""
+
+    def test_defaults(self):
+        options = engine_options(POSTGRES_URL, {})
+        self.assertIs(options['poolclass'], TimedQueuePool)
+        self.assertEqual(options['pool_size'], 5)
+        self.assertEqual(options['max_overflow'], 10)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertNotIn('connect_args', options)
+
+    def test_settings(self):
+        options = engine_options(POSTGRES_URL, {
+            'DB_POOL_SIZE': '3', 'DB_MAX_OVERFLOW': '0',
+            'DB_POOL_TIMEOUT': '2.5', 'DB_POOL_RECYCLE': '60',
+            'DB_POOL_PRE_PING': 'off', 'DB_STATEMENT_TIMEOUT_MS': '500'})
+
+        self.assertEqual((options['pool_size'], options['max_overflow'],
+                          options['pool_timeout'], options['pool_recycle']),
+                         (3, 0, 2.5, 60))
+        self.assertFalse(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'],
+                         {'options': '-c statement_timeout=500'})
+
+    def test_sized_by_max_connections(self):
+        options = engine_options(POSTGRES_URL, {
+            'DB_MAX_CONNECTIONS': '105', 'WEB_CONCURRENCY': '4',
+            'GUNICORN_THREADS': '8'})
+        self.assertEqual((options['pool_size'], options['max_overflow']),
+                         (8, 17))
+
+    def test_pgbouncer(self):
+        """Does PgBouncer mode leave pooling, and startup options, to it?"""
+        options = engine_options(POSTGRES_URL, {
+            'DB_PGBOUNCER': '1', 'DB_STATEMENT_TIMEOUT_MS': '500'})
+        self.assertIs(options['poolclass'], TimedNullPool)
+        self.assertNotIn('pool_size', options)
+        self.assertNotIn('connect_args', options)
+
+    def test_sqlite(self):
+        self.assertEqual(engine_options('sqlite://', {'DB_POOL_SIZE': '3'}),
+                         {})
+
+    @skipUnless(POSTGRES, "the app's database isn't Postgres")
+    def test_app_engine(self):
+        """Does the app's engine use the timed pool?"""
+        self.assertIsInstance(db.engine.pool, TimedQueuePool)
+
+    @skipUnless(POSTGRES, "the app's database isn't Postgres")
+    def test_statement_timeout(self):
+        engine = create_engine(URL, **engine_options(
+            URL, {'DB_STATEMENT_TIMEOUT_MS': '1234'}))
+        with engine.connect() as conn:
+            self.assertEqual(
+                conn.exec_driver_sql("SHOW statement_timeout").scalar(),
+                '1234ms')
+        engine.dispose()
+
+
+class CheckoutTimingTestCase(TestCase):
+    """Test that checkouts are timed into the metrics."""
+
+    def setUp(self):
+        metrics.clear()
+        self.engine = create_engine(URL, poolclass=TimedQueuePool,
+                                    pool_size=1, max_overflow=0,
+                                    pool_timeout=0.05)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_checkouts_timed(self):
+        for _ in range(3):
+            with self.engine.connect():
+                pass
+
+        self.assertEqual(metrics.pool_wait.count, 3)
+        self.assertEqual(metrics.pool_timeouts, 0)
+
+    def test_timeouts_counted(self):
+        """Is a checkout that finds the pool empty counted as a timeout?"""
+
+        with self.engine.connect():
+            with self.assertRaises(TimeoutError):
+                self.engine.connect()
+
+        self.assertEqual(metrics.pool_timeouts, 1)
+        self.assertGreaterEqual(metrics.pool_wait.sum, 0.05)
+
+    def test_metrics(self):
+        with self.engine.connect():
+            text = metrics.render(pool=self.engine.pool)
+
+        self.assertIn("warbler_db_pool_wait_seconds_count 1", text)
+        self.assertIn('warbler_db_pool_wait_seconds_bucket{le="+Inf"} 1',
+                      text)
+        self.assertIn("warbler_db_pool_size 1", text)
+        self.assertIn("warbler_db_pool_checked_out 1", text)
+        self.assertIn("warbler_db_pool_overflow 0", text)
+
+    def test_metrics_endpoint(self):
+        """Does /metrics report the app's own pool?"""
+
+        resp = app.test_client().get('/metrics', headers={
+            'Authorization': f"Bearer {app.config['METRICS_TOKEN']}"})
+        text = resp.get_data(as_text=True)
+        self.assertIn("# TYPE warbler_db_pool_checked_out gauge", text)
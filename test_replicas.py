@@ -0,0 +1,155 @@
+"""Read replica routing tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_replicas.py
+
+
+import os
+import tempfile
+from time import time
+from unittest import TestCase
+
+from sqlalchemy import insert, select
+
+from models import db, User, Message
+from app import create_app, CURR_USER_KEY
+from config import load_config
+from replicas import PRIMARY_UNTIL_KEY
+
+# a SQLite file stands in for the replica; it isn't replicated to, so
+# what a page shows tells which database it read
+REPLICA = os.path.join(tempfile.mkdtemp(), 'replica.db')
+
+config = load_config('test')
+config.SQLALCHEMY_REPLICA_URIS = [f"sqlite:///{REPLICA}"]
+app = create_app(config)
+app_context = app.app_context()
+
+[replica] = app.extensions['replicas']
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+    db.metadata.create_all(replica)
+
+
+def tearDownModule():
+    app_context.pop()
+    replica.dispose()
+    os.remove(REPLICA)
+
+
+class ReplicaTestCase(TestCase):
+    """Test which database each request reads."""
+
+    def setUp(self):
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+        db.session.add(User(id=101, email="test@test.com",
+                            username="on_primary", password="HASHED_PASSWORD"))
+        db.session.commit()
+
+        with replica.begin() as conn:
+            for table in (Message.__table__, User.__table__):
+                conn.execute(table.delete())
+            conn.execute(insert(User.__table__).values(
+                id=101, email="test@test.com", username="on_replica",
+                password="HASHED_PASSWORD"))
+
+        self.client = app.test_client()
+
+    def log_in(self):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 101
+
+    def test_read_only_page(self):
+        """Does a marked page read from the replica?"""
+
+        html = self.client.get('/users/101').get_data(as_text=True)
+        self.assertIn("@on_replica", html)
+
+    def test_other_pages(self):
+        """Do unmarked pages read from the primary?"""
+
+        self.log_in()
+        html = self.client.get('/users/profile').get_data(as_text=True)
+        self.assertIn('value="on_primary"', html)
+
+    def test_read_your_writes(self):
+        """After a POST, does the user read their own write?"""
+
+        self.log_in()
+        resp = self.client.post('/messages/new',
+                                data={'text': "Fresh warble"})
+        self.assertEqual(resp.status_code, 302)
+
+        html = self.client.get('/users/101').get_data(as_text=True)
+        self.assertIn("@on_primary", html)
+        self.assertIn("Fresh warble", html)
+
+        # and back to the replica once that's had time to catch up
+        with self.client.session_transaction() as sess:
+            sess[PRIMARY_UNTIL_KEY] = time() - 1
+        html = self.client.get('/users/101').get_data(as_text=True)
+        self.assertIn("@on_replica", html)
+
+    def test_sticky_after_put_and_delete(self):
+        """Do the API's PUTs and DELETEs stick to the primary too?"""
+
+        self.log_in()
+        for method in (self.client.put, self.client.delete):
+            with self.client.session_transaction() as sess:
+                sess.pop(PRIMARY_UNTIL_KEY, None)
+
+            resp = method('/api/v1/users/101/follow')
+            self.assertEqual(resp.status_code, 204)
+
+            with self.client.session_transaction() as sess:
+                self.assertGreater(sess[PRIMARY_UNTIL_KEY], time())
+            html = self.client.get('/users/101').get_data(as_text=True)
+            self.assertIn("@on_primary", html)
+
+    def test_writes_go_to_primary(self):
+        """Do flushes and other statements skip the replica?"""
+
+        db.session.info['replica'] = replica
+        try:
+            self.assertIs(db.session.get_bind(clause=select(User)), replica)
+            self.assertIsNot(
+                db.session.get_bind(clause=User.__table__.delete()), replica)
+            self.assertIsNot(db.session.get_bind(), replica)
+
+            user = db.session.get(User, 101)
+            self.assertEqual(user.username, "on_replica")
+            user.bio = "Edited"
+            db.session.commit()
+        finally:
+            db.session.info.pop('replica')
+
+        self.assertEqual(db.session.scalar(
+            select(User.bio).where(User.id == 101)), "Edited")
+        with replica.connect() as conn:
+            self.assertIsNone(conn.scalar(
+                select(User.bio).where(User.id == 101)))
+
+    def test_request_forgets_replica(self):
+        """Does a request leave the session reading the primary?"""
+
+        self.client.get('/users/101')
+        self.assertNotIn('replica', db.session.info)
+        self.assertEqual(db.session.get(User, 101).username, "on_primary")
+
+
+class NoReplicaTestCase(TestCase):
+    """Test that without replicas nothing is routed."""
+
+    def test_no_hooks(self):
+        plain = create_app('test')
+        self.assertEqual(plain.extensions['replicas'], [])
+
+        with plain.test_request_context('/users/101'):
+            plain.preprocess_request()
+            self.assertNotIn('replica', db.session.info)
@@ -0,0 +1,154 @@
+"""User search tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_search.py
+
+
+from unittest import TestCase
+
+from models import db, User
+from app import create_app
+from search import NgramIndex, search_users, user_index
+
+app = create_app('test')
+app_context = app.app_context()
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+USERS = (
+    (101, "john_smith", "Portland", "Writes about birds"),
+    (102, "johnny", "Boston", "Plays drums"),
+    (103, "maria", "Johnstown", "Likes smithing"),
+    (104, "john", None, None),
+    (105, "bob", "Smithfield", "Friend of john"),
+)
+
+
+class SearchTestCase(TestCase):
+    """Test ranked, prefix-aware search against Postgres."""
+
+    def setUp(self):
+        db.session.rollback()
+        User.query.delete()
+
+        db.session.add_all([
+            User(id=user_id, email=f"{name}@test.com", username=name,
+                 location=location, bio=bio, password="HASHED_PASSWORD")
+            for user_id, name, location, bio in USERS
+        ])
+        db.session.commit()
+
+    def search(self, query, **kwargs):
+        return [user.username for user in search_users(query, **kwargs)]
+
+    def test_ranking(self):
+        """Exact username, then username prefix, then other fields?"""
+        self.assertEqual(self.search("john"),
+                         ["john", "john_smith", "johnny", "maria", "bob"])
+
+    def test_words_match_any_field(self):
+        """Must every word begin some word of the user's fields?"""
+        self.assertEqual(self.search("smi port"), ["john_smith"])
+        self.assertEqual(self.search("smith")[:1], ["john_smith"])
+
+    def test_short_query(self):
+        """Do short queries match username prefixes only?"""
+        self.assertEqual(self.search("jo"), ["john", "john_smith", "johnny"])
+
+    def test_limit(self):
+        """Are results capped?"""
+        self.assertEqual(len(self.search("john", limit=2)), 2)
+
+    def test_no_wildcards(self):
+        """Are LIKE wildcards and tsquery syntax taken literally?"""
+        self.assertEqual(self.search("%"), [])
+        self.assertEqual(self.search("j_"), [])
+        self.assertEqual(self.search("john & !smith"),
+                         self.search("john smith"))
+
+    def test_route(self):
+        """Does /users?q= show the matches?"""
+        html = app.test_client().get("/users?q=johns").get_data(as_text=True)
+
+        self.assertIn("@maria", html)
+        self.assertNotIn("@bob", html)
+
+
+class NgramIndexTestCase(TestCase):
+    """Test the in-process index used where Postgres isn't."""
+
+    def setUp(self):
+        self.index = NgramIndex()
+        self.index.load(USERS)
+
+    def test_same_results_as_postgres(self):
+        """Does the index rank like the Postgres query?"""
+        self.assertEqual(self.index.search("john"), [104, 101, 102, 103, 105])
+        self.assertEqual(self.index.search("smi port"), [101])
+        self.assertEqual(self.index.search("jo"), [104, 101, 102])
+
+    def test_long_words(self):
+        """Do words longer than the longest n-gram still match exactly?"""
+        self.index.add(106, "extraordinarily", None, None)
+
+        self.assertEqual(self.index.search("extraordinarily"), [106])
+        self.assertEqual(self.index.search("extraordinaries"), [])
+
+    def test_update_and_remove(self):
+        """Does re-adding a user replace their old words?"""
+        self.index.add(102, "drummer", None, None)
+        self.assertNotIn(102, self.index.search("john"))
+
+        self.index.remove(101)
+        self.assertEqual(self.index.search("smi port"), [])
+
+
+class IndexHooksTestCase(TestCase):
+    """Test that committed changes reach the in-process index."""
+
+    def setUp(self):
+        db.session.rollback()
+        User.query.delete()
+
+        self.user = User(id=101, email="test@test.com", username="testuser",
+                         password="HASHED_PASSWORD")
+        db.session.add(self.user)
+        db.session.commit()
+
+        user_index.clear()
+        user_index.load([(101, "testuser", None, None)])
+
+    def tearDown(self):
+        user_index.clear()
+
+    def test_rename(self):
+        """Is a committed rename searchable straight away?"""
+        self.user.username = "renamed"
+        db.session.commit()
+
+        self.assertEqual(user_index.search("renamed"), [101])
+        self.assertEqual(user_index.search("testuser"), [])
+
+    def test_rollback(self):
+        """Is a rolled-back rename ignored?"""
+        self.user.username = "renamed"
+        db.session.flush()
+        db.session.rollback()
+
+        self.assertEqual(user_index.search("testuser"), [101])
+
+    def test_delete(self):
+        """Is a deleted user dropped?"""
+        db.session.delete(self.user)
+        db.session.commit()
+
+        self.assertEqual(user_index.search("testuser"), [])
@@ -0,0 +1,102 @@
+"""Message id and timestamp tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_snowflake.py
+
+
+import os
+from datetime import datetime
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Message
+from app import create_app
+from config import load_config
+from snowflake import (MAX_SEQUENCE, SnowflakeGenerator, datetime_from_id,
+                       id_from_datetime)
+
+app = create_app('test')
+app_context = app.app_context()
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+class SnowflakeTestCase(TestCase):
+    """Test the time-ordered id generator."""
+
+    def test_increasing(self):
+        """Are ids unique and increasing, even within a millisecond?"""
+        make_id = SnowflakeGenerator(worker=1, clock=lambda: 10**18)
+        ids = [make_id() for _ in range(MAX_SEQUENCE + 10)]
+
+        self.assertEqual(ids, sorted(set(ids)))
+
+    def test_clock_steps_back(self):
+        """Does a clock going backwards still give increasing ids?"""
+        times = iter([10**18, 10**18 - 5 * 10**6])
+        make_id = SnowflakeGenerator(worker=1, clock=lambda: next(times))
+
+        first = make_id()
+        self.assertGreater(make_id(), first)
+
+    def test_time_round_trip(self):
+        """Can an id be made for a time, and the time read back?"""
+        when = datetime(2017, 1, 21, 11, 4, 53, 522000)
+
+        self.assertEqual(datetime_from_id(id_from_datetime(when)), when)
+        self.assertLess(id_from_datetime(when),
+                        id_from_datetime(datetime(2017, 1, 21, 11, 4, 54)))
+
+    def test_production_needs_worker_id(self):
+        """Does production refuse to fall back on pids, which repeat
+        across servers?"""
+        with patch.dict(os.environ, {'SECRET_KEY': "secret"}):
+            os.environ.pop('WARBLER_WORKER_ID', None)
+            with self.assertRaisesRegex(RuntimeError, "WARBLER_WORKER_ID"):
+                load_config('production')
+
+            os.environ['WARBLER_WORKER_ID'] = '3'
+            load_config('production')
+
+
+class MessageDefaultsTestCase(TestCase):
+    """Test the defaults new messages get."""
+
+    def setUp(self):
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        db.session.add(User(id=1, email="test@test.com", username="testuser",
+                            password="HASHED_PASSWORD"))
+        db.session.commit()
+
+    def test_ids_follow_posting_order(self):
+        """Do later messages get larger ids?"""
+        first = Message(text="first", user_id=1)
+        db.session.add(first)
+        db.session.commit()
+
+        second = Message(text="second", user_id=1)
+        db.session.add(second)
+        db.session.commit()
+
+        self.assertGreater(second.id, first.id)
+
+    def test_timestamp_is_insertion_time(self):
+        """Does each message get the time it was posted, not import time?"""
+        before = datetime.utcnow()
+        msg = Message(text="now", user_id=1)
+        db.session.add(msg)
+        db.session.commit()
+
+        self.assertGreaterEqual(msg.timestamp, before)
+        self.assertLessEqual(msg.timestamp, datetime.utcnow())
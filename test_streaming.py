@@ -0,0 +1,135 @@
+"""Streamed page tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_streaming.py
+
+
+from unittest import TestCase
+
+from sqlalchemy import event
+
+from models import db, User, Message, Follows, Likes, Timeline
+from app import create_app, CURR_USER_KEY
+from feeds import home_feed, liked_feed
+from streaming import FLUSH
+
+app = create_app('test')
+app_context = app.app_context()
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+class StreamedFeedTestCase(TestCase):
+    """Test feeds streamed from a cursor, and pages sent as rendered."""
+
+    def setUp(self):
+        db.session.rollback()
+        Likes.query.delete()
+        Timeline.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        user = User.signup(username="author", email="a@test.com",
+                           password="password", image_url=None)
+        db.session.commit()
+        self.user_id = user.id
+
+        messages = [Message(text=f"Warble {i}", user_id=user.id)
+                    for i in range(5)]
+        db.session.add_all(messages)
+        db.session.commit()
+        self.message_ids = [msg.id for msg in messages]
+        db.session.add_all([Likes(user_id=user.id, message_id=msg_id)
+                            for msg_id in self.message_ids])
+        db.session.commit()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+    def test_streamed_page(self):
+        """Does a streamed page hold the same messages and cursor?"""
+
+        for feed in (home_feed, liked_feed):
+            whole = feed(self.user_id, size=2)
+            streamed = feed(self.user_id, size=2, stream=True)
+
+            self.assertEqual([msg.id for msg in streamed],
+                             [msg.id for msg in whole])
+            self.assertEqual(streamed.next_cursor, whole.next_cursor)
+
+            last = feed(self.user_id, whole.next_cursor, size=3, stream=True)
+            self.assertEqual(len(list(last)), 3)
+            self.assertIsNone(last.next_cursor)
+
+            empty = feed(self.user_id, size=0, stream=True)
+            self.assertEqual(list(empty), [])
+            self.assertIsNone(empty.next_cursor)
+
+    def test_head_first(self):
+        """Is the page's head sent before the feed is read?"""
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            resp = self.client.get("/")
+            self.assertTrue(resp.is_streamed)
+            chunks = iter(resp.response)
+
+            head = next(chunks).decode()
+            self.assertIn('id="home-aside"', head)
+            self.assertNotIn("Warble 4", head)
+            self.assertFalse(any('timelines' in statement
+                                 for statement in statements))
+
+            rest = b''.join(chunks).decode()
+            self.assertIn("Warble 4", rest)
+            self.assertTrue(any('timelines' in statement
+                                for statement in statements))
+        finally:
+            resp.close()
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        self.assertNotIn(FLUSH, head + rest)
+
+    def test_pages(self):
+        for url in ("/", f"/users/{self.user_id}",
+                    f"/users/{self.user_id}/likes"):
+            resp = self.client.get(url)
+            html = resp.get_data(as_text=True)
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("Warble 0", html)
+            self.assertIn("Warble 4", html)
+            self.assertTrue(html.rstrip().endswith("</html>"))
+
+    def test_flash_once(self):
+        """Is a flashed message taken out of the session, though the
+        session is sent before the page is rendered?"""
+
+        with self.client.session_transaction() as sess:
+            sess['_flashes'] = [('success', "Hello!")]
+
+        self.assertIn("Hello!", self.client.get("/").get_data(as_text=True))
+        self.assertNotIn("Hello!",
+                         self.client.get("/").get_data(as_text=True))
+
+    def test_not_streamed(self):
+        """Does flush() leave no trace in a page rendered whole?"""
+
+        html = self.client.get(
+            f"/users/{self.user_id}/following").get_data(as_text=True)
+        self.assertIn('id="sidebar-username"', html)
+        self.assertNotIn(FLUSH, html)
@@ -0,0 +1,158 @@
+"""Home timeline tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_timelines.py
+
+
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Timeline
+from app import create_app, CURR_USER_KEY
+from timelines import rebuild_timelines
+
+app = create_app('test')
+app_context = app.app_context()
+
+
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
+
+class TimelineTestCase(TestCase):
+    """Test fan-out of messages and follows into timelines."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Timeline.query.delete()
+
+        self.client = app.test_client()
+
+        self.u1 = User(id=1, email="test1@test.com", username="testuser1",
+                       password="HASHED_PASSWORD")
+        self.u2 = User(id=2, email="test2@test.com", username="testuser2",
+                       password="HASHED_PASSWORD")
+        self.u3 = User(id=3, email="test3@test.com", username="testuser3",
+                       password="HASHED_PASSWORD")
+        db.session.add_all([self.u1, self.u2, self.u3])
+        db.session.commit()
+
+    def timeline_ids(self, user_id):
+        return {t.message_id for t in
+                Timeline.query.filter_by(user_id=user_id).all()}
+
+    def test_own_message(self):
+        """Does a new message land on its author's timeline?"""
+        db.session.add(Message(id=1, text="mine", user_id=1))
+        db.session.commit()
+
+        self.assertEqual(self.timeline_ids(1), {1})
+        self.assertEqual(self.timeline_ids(2), set())
+
+    def test_fan_out_to_followers(self):
+        """Does a new message land on every follower's timeline?"""
+        self.u2.following.append(self.u1)
+        db.session.add(Follows(user_being_followed_id=1, user_following_id=3))
+        db.session.commit()
+
+        db.session.add(Message(id=1, text="hello followers", user_id=1))
+        db.session.commit()
+
+        self.assertEqual(self.timeline_ids(2), {1})
+        self.assertEqual(self.timeline_ids(3), {1})
+
+    def test_self_follow(self):
+        """Does a user who follows themselves get each message once?"""
+        self.u1.following.append(self.u1)
+        db.session.commit()
+
+        db.session.add(Message(id=1, text="note to self", user_id=1))
+        db.session.commit()
+
+        self.assertEqual(self.timeline_ids(1), {1})
+
+    def test_rebuild(self):
+        """Does a rebuild give the same timelines, self-follows included?"""
+        self.u1.following.append(self.u1)
+        self.u2.following.append(self.u1)
+        db.session.add(Message(id=1, text="hello", user_id=1))
+        db.session.add(Message(id=2, text="unfollowed", user_id=3))
+        db.session.commit()
+
+        rebuild_timelines()
+        db.session.commit()
+
+        self.assertEqual(self.timeline_ids(1), {1})
+        self.assertEqual(self.timeline_ids(2), {1})
+        self.assertEqual(self.timeline_ids(3), {2})
+
+    def test_follow_backfills(self):
+        """Does following a user add their earlier messages?"""
+        db.session.add_all([Message(id=1, text="one", user_id=1),
+                            Message(id=2, text="two", user_id=1)])
+        db.session.commit()
+
+        self.u1.followers.append(self.u2)
+        db.session.commit()
+
+        self.assertEqual(self.timeline_ids(2), {1, 2})
+
+    def test_unfollow_purges(self):
+        """Does unfollowing remove that user's messages only?"""
+        self.u2.following.extend([self.u1, self.u3])
+        db.session.add_all([Message(id=1, text="one", user_id=1),
+                            Message(id=2, text="two", user_id=3),
+                            Message(id=3, text="three", user_id=2)])
+        db.session.commit()
+
+        self.u2.following.remove(self.u1)
+        db.session.commit()
+
+        self.assertEqual(self.timeline_ids(2), {2, 3})
+
+    def test_delete_message(self):
+        """Does deleting a message remove it from timelines?"""
+        self.u2.following.append(self.u1)
+        m = Message(id=1, text="oops", user_id=1)
+        db.session.add(m)
+        db.session.commit()
+
+        db.session.delete(m)
+        db.session.commit()
+
+        self.assertEqual(Timeline.query.count(), 0)
+
+    def test_homepage_reads_timeline(self):
+        """Do the follow and message routes feed the home page?"""
+        db.session.add(Message(text="Example Text", user_id=2))
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 1
+
+            c.post("/users/follow/2")
+            c.post("/messages/new", data={"text": "My own warble"})
+            resp = c.get("/")
+            html = resp.get_data(as_text=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("Example Text", html)
+            self.assertIn("My own warble", html)
+
+            c.post("/users/stop-following/2")
+            resp = c.get("/")
+            html = resp.get_data(as_text=True)
+
+            self.assertNotIn("Example Text", html)
+            self.assertIn("My own warble", html)
@@ -5,29 +5,22 @@
 #    python -m unittest test_user_model.py
 
 
-import os
 from unittest import TestCase
 
 from models import db, User, Follows, Message
+from app import create_app
 
-# BEFORE we import our app, let's set an environmental variable
-# to use a different database for tests (we need to do this
-# before we import our app, since that will have already
-# connected to the database
+app = create_app('test')
+app_context = app.app_context()
 
-os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
 
+def setUpModule():
+    app_context.push()
+    db.create_all()
 
-# Now we can import app
-
-from app import app
-
-# Create our tables (we do this here, so we only create the tables
-# once for all tests --- in each test, we'll delete the data
-# and create fresh new clean test data
-# db.drop_all()
-db.create_all() 
 
+def tearDownModule():
+    app_context.pop()
 
 
 class UserModelTestCase(TestCase):
@@ -1,16 +1,20 @@
-import os
 from unittest import TestCase
 
-from models import db, User, Follows, Message
- 
- 
-os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+from models import db, User, Follows, Message, Likes
+from app import create_app, CURR_USER_KEY
 
-from app import app, CURR_USER_KEY
+app = create_app('test')
+app_context = app.app_context()
 
-db.create_all() 
 
-app.config['WTF_CSRF_ENABLED'] = False
+def setUpModule():
+    app_context.push()
+    db.create_all()
+
+
+def tearDownModule():
+    app_context.pop()
+
 
 class UserViewTestCase(TestCase):
     """Test views for messages."""
@@ -20,6 +24,7 @@ class UserViewTestCase(TestCase):
 
         User.query.delete()
         Message.query.delete()
+        Likes.query.delete()
 
         self.client = app.test_client()
 
@@ -117,6 +122,22 @@ class UserViewTestCase(TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertIn("exampleuser", html)
     
+    def test_view_likes(self):
+        """Does a profile's likes page show that user's likes?"""
+        db.session.add(Likes(user_id=2, message_id=1))
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            resp = c.get('/users/2/likes')
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("Example Text", resp.get_data(as_text=True))
+
+            resp = c.get(f'/users/{self.testuser.id}/likes')
+            self.assertNotIn("Example Text", resp.get_data(as_text=True))
+
     def test_view_followers_fail(self):
         """ Can other user see user's followers?"""
         with app.test_client() as client:
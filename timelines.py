@@ -0,0 +1,132 @@
+"""Fan-out-on-write home timelines for Warbler.
+
+When a message is written it is copied into the `timelines` table for its
+author and for each of the author's followers, so the home page (see
+feeds.home_feed) is a single range read on (user_id, message_id) no matter
+how many accounts the user follows. Following someone backfills their
+messages; unfollowing purges them.
+
+The table is kept in step from a session hook rather than from each route,
+so it sees every write that goes through the ORM: `messages_add()`,
+`add_follow()` and `stop_following()`, but also tests and the shell.
+"""
+
+from sqlalchemy import (delete, event, exists, insert, literal, select, union,
+                        union_all)
+
+from changes import deleted_messages, follow_changes, new_messages
+from models import db, Follows, Message, Timeline
+
+timelines = Timeline.__table__
+
+
+def _insert_entries(conn, entries):
+    """Insert (user_id, message_id) rows from `entries`.
+
+    Rows already on the timeline are skipped, so callers can overlap.
+    """
+
+    entries = entries.subquery()
+    present = timelines.alias('present')
+    rows = (select(entries.c.user_id, entries.c.message_id)
+            .where(~exists().where(present.c.user_id == entries.c.user_id,
+                                   present.c.message_id == entries.c.message_id)))
+
+    conn.execute(insert(timelines).from_select(
+        ['user_id', 'message_id'], rows))
+
+
+def fan_out(conn, message_ids):
+    """Copy messages onto the timelines of their authors and followers."""
+
+    if not message_ids:
+        return
+
+    authors = (select(Message.user_id.label('user_id'),
+                      Message.id.label('message_id'))
+               .where(Message.id.in_(message_ids)))
+    followers = (select(Follows.user_following_id.label('user_id'),
+                        Message.id.label('message_id'))
+                 .join(Follows,
+                       Follows.user_being_followed_id == Message.user_id)
+                 .where(Message.id.in_(message_ids)))
+
+    # union, not union_all: a user who follows themselves would otherwise
+    # get two entries per message, which the primary key rejects
+    _insert_entries(conn, union(authors, followers))
+
+
+def backfill(conn, follower_id, followed_id):
+    """Add everything `followed_id` has posted to `follower_id`'s timeline."""
+
+    _insert_entries(conn, select(literal(follower_id).label('user_id'),
+                                 Message.id.label('message_id'))
+                    .where(Message.user_id == followed_id))
+
+
+def purge(conn, follower_id, followed_id):
+    """Remove `followed_id`'s messages from `follower_id`'s timeline."""
+
+    conn.execute(delete(timelines).where(
+        timelines.c.user_id == follower_id,
+        timelines.c.message_id.in_(
+            select(Message.id).where(Message.user_id == followed_id))))
+
+
+def remove(conn, message_ids):
+    """Drop deleted messages from every timeline.
+
+    Postgres does this through the foreign key cascade; this covers
+    databases that don't enforce it (e.g. SQLite without the pragma).
+    """
+
+    if message_ids:
+        conn.execute(delete(timelines).where(
+            timelines.c.message_id.in_(message_ids)))
+
+
+def rebuild_timelines():
+    """Recompute every timeline from messages and follows.
+
+    For bulk loads (seed.py) that bypass the session hook.
+    """
+
+    conn = db.session.connection()
+    conn.execute(delete(timelines))
+
+    authors = select(Message.user_id.label('user_id'),
+                     Message.id.label('message_id'))
+    # a self-follow would repeat the author's own entries; leaving those
+    # out keeps the halves disjoint, so there's nothing to de-duplicate
+    followers = (select(Follows.user_following_id.label('user_id'),
+                        Message.id.label('message_id'))
+                 .join(Follows,
+                       Follows.user_being_followed_id == Message.user_id)
+                 .where(Follows.user_following_id != Message.user_id))
+
+    conn.execute(insert(timelines).from_select(
+        ['user_id', 'message_id'],
+        union_all(authors, followers)))
+
+
+@event.listens_for(db.session, 'after_flush')
+def update_timelines(session, flush_context):
+    """Apply this flush's messages and follows to the timelines table."""
+
+    added, removed = follow_changes(session)
+    posted = [msg.id for msg in new_messages(session)]
+    deleted = [msg.id for msg in deleted_messages(session)]
+
+    if not (added or removed or posted or deleted):
+        return
+
+    conn = session.connection()
+
+    for follower_id, followed_id in removed:
+        purge(conn, follower_id, followed_id)
+
+    for follower_id, followed_id in added:
+        backfill(conn, follower_id, followed_id)
+
+    fan_out(conn, posted)
+    remove(conn, deleted)
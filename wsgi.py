@@ -0,0 +1,12 @@
+"""Entry point for the app servers:
+
+    SECRET_KEY=... WARBLER_WORKER_ID=... DATABASE_URL=... gunicorn wsgi:app
+
+Uses the production profile unless WARBLER_CONFIG names another.
+"""
+
+import os
+
+from app import create_app
+
+app = create_app(os.environ.get('WARBLER_CONFIG', 'production'))